@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import shutil
+import threading
+import subprocess
+import configparser
+from concurrent.futures import ThreadPoolExecutor, wait
+from logging import Logger
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+# Constants
+BYTES_TO_GB = 1024**3
+JOURNAL_FILE_NAME = 'deletion_journal.jsonl'
+PROGRESS_INTERVAL_SECONDS = 30
+
+def map_path(path: str, path_map: List[Tuple[str, str]]) -> str:
+    """Translate a path as seen by qBittorrent into a local path."""
+    for remote_prefix, local_prefix in path_map:
+        if path == remote_prefix or path.startswith(remote_prefix.rstrip('/') + '/'):
+            return local_prefix.rstrip('/') + path[len(remote_prefix.rstrip('/')):]
+    return path
+
+def is_within(path: str, parent: str) -> bool:
+    """Whether path is parent itself or nested under it."""
+    parent = parent.rstrip('/\\')
+    return path == parent or path.startswith(parent + '/') or path.startswith(parent + '\\')
+
+def load_path_map(config: configparser.ConfigParser) -> List[Tuple[str, str]]:
+    """Parse [content_deletion] path_map, a comma separated list of remote_prefix:local_prefix pairs."""
+    path_map = []
+    for mapping in config.get('content_deletion', 'path_map', fallback='').split(','):
+        if ':' in mapping:
+            remote_prefix, local_prefix = mapping.split(':', 1)
+            path_map.append((remote_prefix.strip(), local_prefix.strip()))
+    return path_map
+
+class ContentDeleter:
+    """Deletes torrent content locally after the torrents were removed from qBittorrent without files.
+
+    Every deletion is written to an append-only journal before the torrent is
+    removed and marked done once its files are gone, so deletions interrupted
+    by a crash or a killed run are resumed by the next run. Only the files of
+    the torrent itself are deleted, as listed by qBittorrent when it was
+    queued, followed by the directories they leave empty; other files in its
+    folder or save path are never touched. Files that another torrent still
+    uses stay pending until it no longer does.
+    """
+
+    def __init__(self, journal_path: str, logger: Logger, workers: int = 2, low_priority: bool = True,
+                 path_map: Optional[List[Tuple[str, str]]] = None):
+        self.journal_path = journal_path
+        self.logger = logger
+        self.workers = workers
+        self.low_priority = low_priority
+        self.path_map = path_map or []
+        self._lock = threading.Lock()
+        self._bytes_deleted = 0
+
+    def _append_journal(self, entries: List[Dict[str, Any]]) -> None:
+        with self._lock, open(self.journal_path, 'a') as file:
+            file.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def pending(self) -> Dict[str, Dict[str, Any]]:
+        """Deletions that were queued but not finished or cancelled, by hash."""
+        pending: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.journal_path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn last line from an interrupted write
+                    if entry['op'] == 'queued':
+                        pending[entry['hash']] = entry
+                    else:
+                        pending.pop(entry['hash'], None)
+        except FileNotFoundError:
+            pass
+        return pending
+
+    def queue(self, removals: List[Any], files: Dict[str, List[str]]) -> None:
+        """Record deletions before their torrents are removed from qBittorrent.
+
+        files holds the paths of the files of each torrent by hash; torrents
+        without a file list are only deleted when their content path is safe
+        to remove as a whole.
+        """
+        self._append_journal([{'op': 'queued', 'hash': r.hash, 'name': r.name, 'path': r.content_path, 'save_path': r.save_path,
+                               'files': files.get(r.hash), 'bytes': r.size}
+                              for r in removals])
+
+    def cancel(self, removals: List[Any]) -> None:
+        """Drop queued deletions whose torrents could not be removed."""
+        self._append_journal([{'op': 'cancelled', 'hash': r.hash} for r in removals])
+
+    def local_path(self, path: str) -> str:
+        return map_path(path, self.path_map)
+
+    def _delete_path(self, path: str) -> None:
+        if os.path.isdir(path) and not os.path.islink(path):
+            for root, dirs, files in os.walk(path, topdown=False):
+                for name in files:
+                    self._unlink(os.path.join(root, name))
+                for name in dirs:
+                    dir_path = os.path.join(root, name)
+                    if os.path.islink(dir_path):
+                        os.unlink(dir_path)
+                    else:
+                        os.rmdir(dir_path)
+            os.rmdir(path)
+        elif os.path.lexists(path):
+            self._unlink(path)
+
+    def _delete_files(self, files: List[str], save_path: str) -> None:
+        """Delete the given files, then the directories below save_path they leave empty."""
+        local_save_path = self.local_path(save_path).rstrip('/\\')
+        directories = set()
+        for path in files:
+            local_path = self.local_path(path)
+            if os.path.lexists(local_path):
+                self._unlink(local_path)
+            directory = os.path.dirname(local_path)
+            while directory != local_save_path and is_within(directory, local_save_path):
+                directories.add(directory)
+                directory = os.path.dirname(directory)
+        for directory in sorted(directories, key=len, reverse=True):  # Deepest first
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass  # Already gone, or still holds files that are not part of the torrent
+
+    def _unlink(self, path: str) -> None:
+        size = os.lstat(path).st_size
+        os.unlink(path)
+        with self._lock:
+            self._bytes_deleted += size
+
+    def _delete(self, entry: Dict[str, Any]) -> None:
+        path = self.local_path(entry['path'])
+        try:
+            if entry.get('files') is not None:
+                self._delete_files(entry['files'], entry['save_path'])
+            else:
+                self._delete_path(path)
+        except OSError as e:
+            self.logger.error(f"Failed to delete content of {entry['name']} at {path}: {e}")
+            return  # Left pending, retried on the next run
+        if entry.get('kept'):
+            # Queued again with only the files still in use, so they are deleted once they are released
+            requeued = {field: value for field, value in entry.items() if field != 'kept'}
+            self._append_journal([{**requeued, 'files': entry['kept'], 'bytes': self._local_bytes(entry['kept'])}])
+            self.logger.debug(f"Deleted content of {entry['name']} at {path} except {len(entry['kept'])} files in use")
+            return
+        self._append_journal([{'op': 'done', 'hash': entry['hash']}])
+        self.logger.debug(f"Deleted content of {entry['name']} at {path}")
+
+    def _local_bytes(self, files: List[str]) -> int:
+        total = 0
+        for path in files:
+            try:
+                total += os.lstat(self.local_path(path)).st_size
+            except OSError:
+                pass
+        return total
+
+    def _lower_worker_priority(self) -> None:
+        """Best effort: lower the CPU and I/O priority of the calling worker thread.
+
+        Linux sets both priorities per thread, so the main thread keeps its
+        priority for the API calls that follow. Elsewhere they would apply to
+        the whole process, so nothing is changed.
+        """
+        thread_id = threading.get_native_id()
+        try:
+            os.setpriority(os.PRIO_PROCESS, thread_id, min(os.getpriority(os.PRIO_PROCESS, thread_id) + 10, 19))
+        except OSError:
+            pass
+        if shutil.which('ionice'):
+            subprocess.run(['ionice', '-c', '3', '-p', str(thread_id)], check=False,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def run(self, files_in_use: Set[str]) -> int:
+        """Delete all pending content, keeping the files still used by torrents in qBittorrent, and return the bytes freed.
+
+        files_in_use holds the files of the torrents in qBittorrent whose
+        content overlaps the pending deletions, as seen by qBittorrent.
+        """
+        pending = list(self.pending().values())
+        if not pending:
+            self._compact()
+            return 0
+
+        runnable = []
+        for entry in pending:
+            files = entry.get('files')
+            if not entry['path'] or (files is None and os.path.ismount(self.local_path(entry['path']))):
+                self.logger.error(f"Refusing to delete content of {entry['name']} at '{entry['path']}'")
+                self._append_journal([{'op': 'cancelled', 'hash': entry['hash']}])
+            elif files is None and entry['path'].rstrip('/\\') == entry.get('save_path', '').rstrip('/\\'):
+                # Without a file list only a folder or file of the torrent alone can be deleted as a whole
+                self.logger.error(f"Refusing to delete content of {entry['name']} at '{entry['path']}', "
+                                  f"it is the save path of the torrent")
+                self._append_journal([{'op': 'cancelled', 'hash': entry['hash']}])
+            elif files is None and any(is_within(path, entry['path']) for path in files_in_use):
+                self.logger.info(f"Keeping content of {entry['name']} at '{entry['path']}' for now, "
+                                 f"it holds files of another torrent")
+            elif files is not None and files and all(path in files_in_use for path in files):
+                self.logger.info(f"Keeping content of {entry['name']} for now, it is still used by another torrent")
+            else:
+                if files is not None:
+                    entry['kept'] = [path for path in files if path in files_in_use]
+                    entry['files'] = [path for path in files if path not in files_in_use]
+                    if entry['kept']:
+                        self.logger.info(f"Keeping {len(entry['kept'])} files of {entry['name']} for now, "
+                                         f"they are still used by another torrent")
+                runnable.append(entry)
+        if not runnable:
+            self._compact()
+            return 0
+
+        total_bytes = sum(entry['bytes'] for entry in runnable)
+        self._bytes_deleted = 0
+        self.logger.info(f"Deleting content of {len(runnable)} torrents ({total_bytes / BYTES_TO_GB:.2f} GB) with {self.workers} workers")
+        lower_priority = self.low_priority and sys.platform.startswith('linux')
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                initializer=self._lower_worker_priority if lower_priority else None) as executor:
+            futures = {executor.submit(self._delete, entry) for entry in runnable}
+            while futures:
+                _, futures = wait(futures, timeout=PROGRESS_INTERVAL_SECONDS)
+                self.logger.info(f"Content deletion: {len(runnable) - len(futures)}/{len(runnable)} torrents, "
+                                 f"{self._bytes_deleted / BYTES_TO_GB:.2f} GB freed")
+        self._compact()
+        return self._bytes_deleted
+
+    def _compact(self) -> None:
+        """Rewrite the journal with only the deletions that are still pending."""
+        pending = self.pending()
+        if not pending and not os.path.exists(self.journal_path):
+            return
+        with self._lock:
+            with open(self.journal_path + '.tmp', 'w') as file:
+                file.write(''.join(json.dumps(entry) + '\n' for entry in pending.values()))
+            os.replace(self.journal_path + '.tmp', self.journal_path)
+
+def from_config(config: configparser.ConfigParser, logger: Logger) -> Optional[ContentDeleter]:
+    """Create the deleter configured in [content_deletion], or None when qBittorrent should delete files itself."""
+    if not config.getboolean('content_deletion', 'enabled', fallback=False):
+        return None
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    default_journal = os.path.join(config.get('logging', 'location', fallback='') or script_directory, JOURNAL_FILE_NAME)
+    return ContentDeleter(config.get('content_deletion', 'journal', fallback=default_journal), logger,
+                          config.getint('content_deletion', 'workers', fallback=2),
+                          config.getboolean('content_deletion', 'low_priority', fallback=True),
+                          load_path_map(config))
@@ -0,0 +1,68 @@
+import os
+import json
+import time
+import zlib
+import configparser
+from typing import Dict, List, Any, Optional, Set
+
+# Constants
+TRACE_FILE_NAME = 'decision_trace.jsonl'
+SAMPLE_BUCKETS = 10000
+
+class DecisionTrace:
+    """Structured trace of cleanup decisions for selected torrents, written as JSON lines.
+
+    Call sites check wants() before building an event, so a disabled trace
+    costs one attribute lookup per torrent and never formats anything.
+    Torrents are selected by category, or all of them when no category or
+    hash is given, then sampled by hash so the same torrents are traced
+    across all events and runs. Torrents listed by hash are always traced.
+    """
+
+    def __init__(self, trace_path: Optional[str] = None, categories: Optional[Set[str]] = None,
+                 hashes: Optional[Set[str]] = None, sample_rate: float = 1.0):
+        self.enabled = trace_path is not None
+        self.trace_path = trace_path
+        self.categories = categories or set()
+        self.hashes = hashes or set()
+        self.sample_threshold = int(sample_rate * SAMPLE_BUCKETS)
+        self.events: List[Dict[str, Any]] = []
+        self._selected: Dict[str, bool] = {}
+
+    def wants(self, torrent: Dict[str, Any]) -> bool:
+        """Whether events about this torrent should be recorded."""
+        if not self.enabled:
+            return False
+        torrent_hash = torrent['hash']
+        selected = self._selected.get(torrent_hash)
+        if selected is None:
+            selected = torrent_hash in self.hashes or (
+                ((not self.categories and not self.hashes) or torrent.get('category', '').lower() in self.categories)
+                and zlib.crc32(torrent_hash.encode()) % SAMPLE_BUCKETS < self.sample_threshold)
+            self._selected[torrent_hash] = selected
+        return selected
+
+    def record(self, event: str, torrent: Dict[str, Any], **fields: Any) -> None:
+        self.events.append({'ts': round(time.time(), 3), 'event': event, 'hash': torrent['hash'],
+                            'name': torrent.get('name'), 'category': torrent.get('category'), **fields})
+
+    def flush(self) -> None:
+        """Append the recorded events to the trace file."""
+        if not self.events:
+            return
+        with open(self.trace_path, 'a') as file:
+            file.write(''.join(json.dumps(event, separators=(',', ':'), default=str) + '\n' for event in self.events))
+        self.events = []
+
+NULL_TRACE = DecisionTrace()
+
+def from_config(config: configparser.ConfigParser) -> DecisionTrace:
+    """Create the trace configured in the [decision_trace] section, or a disabled one."""
+    if not config.getboolean('decision_trace', 'enabled', fallback=False):
+        return NULL_TRACE
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    default_path = os.path.join(config.get('logging', 'location', fallback='') or script_directory, TRACE_FILE_NAME)
+    categories = {c.strip().lower() for c in config.get('decision_trace', 'categories', fallback='').split(',') if c.strip()}
+    hashes = {h.strip().lower() for h in config.get('decision_trace', 'hashes', fallback='').split(',') if h.strip()}
+    return DecisionTrace(config.get('decision_trace', 'location', fallback=default_path), categories, hashes,
+                         config.getfloat('decision_trace', 'sample_rate', fallback=1.0))
@@ -0,0 +1,113 @@
+import os
+import json
+import hashlib
+import configparser
+from typing import Dict, List, Any, Iterable, Optional
+
+# Constants
+CACHE_FILE_NAME = 'eligibility_cache.json'
+CLOCK_FIELDS = ('seeding_time', 'time_active')  # Grow by at most one second per second
+GROWING_FIELDS = ('ratio', 'uploaded')  # Only grow while the torrent seeds, by an unknown amount
+MONOTONIC_FIELDS = CLOCK_FIELDS + GROWING_FIELDS
+
+def rules_fingerprint(rules: Dict[str, Any]) -> str:
+    """Stable hash of the compiled rules of one category."""
+    return hashlib.sha256(json.dumps(rules, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+class EligibilityCache:
+    """Remembers the seed rule verdict of each torrent and the field values it depended on.
+
+    A verdict is reused while the category, its rules and the values of the
+    fields those rules check are unchanged. Rules on seeding_time,
+    time_active, ratio and uploaded are not part of that comparison: these
+    values only grow, so a met rule stays met. The clocks grow by at most the
+    elapsed time, so an unmet clock rule can not be met before the remaining
+    time has passed; an unmet ratio or uploaded rule is checked against its
+    threshold on every lookup. An entry therefore stays valid until its
+    verdict could first change, or until one of these values goes down, e.g.
+    when the torrent was removed and added again.
+
+    The file is only written when a verdict was stored or dropped.
+    """
+
+    def __init__(self, cache_path: Optional[str]):
+        self.cache_path = cache_path
+        self.fingerprints: Dict[str, str] = {}
+        self.entries: Dict[str, List[Any]] = {}
+        self.changed = False
+        if cache_path:
+            try:
+                with open(cache_path, 'r') as file:
+                    data = json.load(file)
+                self.fingerprints = data['rules']
+                self.entries = data['torrents']
+            except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                pass
+
+    def set_rules(self, category_rules: Dict[str, Dict[str, Any]]) -> None:
+        """Drop the verdicts of categories whose rules changed since they were cached."""
+        fingerprints = {category: rules_fingerprint(rules) for category, rules in category_rules.items()}
+        changed = {category for category in set(fingerprints) | set(self.fingerprints)
+                   if fingerprints.get(category) != self.fingerprints.get(category)}
+        if changed:
+            self.entries = {h: entry for h, entry in self.entries.items() if entry[0] not in changed}
+            self.changed = True
+        self.fingerprints = fingerprints
+
+    @staticmethod
+    def _signature(torrent: Dict[str, Any], rules: Dict[str, Any]) -> List[Any]:
+        return [torrent.get(field) for field in rules if field not in MONOTONIC_FIELDS]
+
+    @staticmethod
+    def _monotonic(rules: Dict[str, Any]) -> List[str]:
+        return [field for field in MONOTONIC_FIELDS if field in rules]
+
+    def lookup(self, torrent: Dict[str, Any], category: str, rules: Dict[str, Any], now: float) -> Optional[bool]:
+        """The cached verdict, or None if the torrent has to be evaluated."""
+        entry = self.entries.get(torrent['hash'])
+        if (entry is None or len(entry) < 5 or entry[0] != category or (entry[3] is not None and now >= entry[3])
+                or entry[1] != self._signature(torrent, rules)):
+            return None
+        fields = self._monotonic(rules)
+        if len(entry[4]) != len(fields):
+            return None
+        for field, cached in zip(fields, entry[4]):
+            current = torrent.get(field, 0)
+            if current < cached:
+                return None
+            if not entry[2] and field in GROWING_FIELDS and cached < rules[field] <= current:
+                return None  # An unmet rule is met now
+        return entry[2]
+
+    def store(self, torrent: Dict[str, Any], category: str, rules: Dict[str, Any], eligible: bool, now: float) -> None:
+        recheck_at = None
+        if not eligible:
+            # The verdict can only flip once every unmet clock rule has had time to be met
+            waits = [rules[field] - torrent[field] for field in CLOCK_FIELDS
+                     if field in rules and torrent.get(field, 0) < rules[field]]
+            if waits:
+                recheck_at = now + max(waits)
+        self.entries[torrent['hash']] = [category, self._signature(torrent, rules), eligible, recheck_at,
+                                         [torrent.get(field, 0) for field in self._monotonic(rules)]]
+        self.changed = True
+
+    def save(self, current_hashes: Iterable[str]) -> None:
+        """Save the cache if it changed, dropping torrents that are no longer in qBittorrent."""
+        if not self.cache_path:
+            return
+        current_hashes = set(current_hashes)
+        entries = {h: entry for h, entry in self.entries.items() if h in current_hashes}
+        if not self.changed and len(entries) == len(self.entries):
+            return
+        with open(self.cache_path + '.tmp', 'w') as file:
+            json.dump({'rules': self.fingerprints, 'torrents': entries}, file, separators=(',', ':'))
+        os.replace(self.cache_path + '.tmp', self.cache_path)
+        self.entries = entries
+        self.changed = False
+
+def from_config(config: configparser.ConfigParser) -> Optional[EligibilityCache]:
+    """Create the cache when [cleanup] cache_eligibility is enabled."""
+    if not config.getboolean('cleanup', 'cache_eligibility', fallback=False):
+        return None
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    return EligibilityCache(os.path.join(config.get('logging', 'location', fallback='') or script_directory, CACHE_FILE_NAME))
@@ -0,0 +1,41 @@
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, callers fall back to unlocked access
+    fcntl = None
+
+@contextmanager
+def locked(lock_path: str, shared: bool = False) -> Iterator[None]:
+    """Hold an advisory lock on lock_path while the block runs.
+
+    Only coordinates processes that use the same lock file; where fcntl is not
+    available the block runs without a lock.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def try_locked(lock_path: str) -> Iterator[bool]:
+    """Like locked, but without waiting: yields whether the exclusive lock was acquired."""
+    if fcntl is None:
+        yield True
+        return
+    with open(lock_path, 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -1,9 +1,8 @@
 import logging
 from logging.handlers import RotatingFileHandler
 import os
-from typing import Tuple, List, Dict, Any
-import torrent_utils
-import configparser
+from typing import Tuple, List
+from removal_plan import PlannedRemoval
 
 # Constants
 MAX_BYTES = 1 * 1024 * 1024  # 1 MB
@@ -67,26 +66,24 @@ def setup_logger(log_path, debug: bool = False, log_file_name: str = 'deletelog.
     
     return logger, handler
 
-def log_torrent_removal_info(torrents_info: List[Dict[str, Any]], logger: logging.Logger, bonus_rules: Dict[str, Dict[str, Any]], config: configparser.ConfigParser) -> None:
-    if not torrents_info:
+def log_torrent_removal_info(removals: List[PlannedRemoval], logger: logging.Logger) -> None:
+    if not removals:
         logger.info("No torrents to remove based on current rules.")
         return
 
-    logger.info(f"Total torrents to remove: {len(torrents_info)}")
+    logger.info(f"Total torrents to remove: {len(removals)}")
 
-    log_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'torrent_ratio_log.json')
+    for removal in removals:
+        size_gb = removal.size / BYTES_TO_GB
+        seeding_time_day = removal.seeding_time / SECONDS_PER_DAY
+        category = removal.category
+        popularity = removal.popularity
+        eta = removal.eta
+        tracker = removal.tracker
 
-    for torrent_info in torrents_info:
-        size_gb = torrent_info['size'] / BYTES_TO_GB
-        seeding_time_day = torrent_info['seeding_time'] / SECONDS_PER_DAY
-        category = torrent_info.get('category', 'Unknown')
-        popularity = torrent_info.get('popularity')
-        eta = torrent_info.get('eta')
-        tracker = torrent_info.get('tracker')
+        average_ratio_per_week = removal.score
 
-        average_ratio_per_week = torrent_utils.calculate_average_ratio(torrent_info, log_file_path, logger, bonus_rules, config)
-
-        truncated_name = (torrent_info['name'][:MAX_NAME_LENGTH - 3] + '...') if len(torrent_info['name']) > MAX_NAME_LENGTH else torrent_info['name']
+        truncated_name = (removal.name[:MAX_NAME_LENGTH - 3] + '...') if len(removal.name) > MAX_NAME_LENGTH else removal.name
 
         size_str = f"{size_gb:.2f} GB".rjust(10)
         seeding_time_str = f"{seeding_time_day:.1f} Days".rjust(11)
@@ -0,0 +1,108 @@
+import os
+import json
+import random
+import requests
+import configparser
+from logging import Logger
+from typing import Any, Dict, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry, make_headers
+import torrent_list_cache
+from torrent_list_cache import TorrentListCache
+
+# Constants
+API_V2_BASE = "/api/v2"
+LOGIN_PATH = f"{API_V2_BASE}/auth/login"
+RETRY_STATUSES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+class JitteredRetry(Retry):
+    """Retry with full jitter, so parallel cron jobs hitting a restarting WebUI do not retry in lockstep."""
+
+    def get_backoff_time(self) -> float:
+        return random.uniform(0, super().get_backoff_time())
+
+class QBittorrentSession(requests.Session):
+    """Session used for all qBittorrent WebUI API calls.
+
+    Every request gets a connect and read timeout. Idempotent requests are
+    retried a bounded number of times with jittered backoff on connection
+    errors and overloaded responses; other requests are only retried when
+    the connection could not be established, so they are never sent twice.
+    A 403 from an expired or missing cookie triggers one login and one retry
+    of the request.
+    """
+
+    def __init__(self, api_address: str, username: str, password: str, logger: Optional[Logger] = None,
+                 timeout: Tuple[float, float] = (5, 60), retries: int = 3, backoff_factor: float = 0.5,
+                 pool_size: int = 4):
+        super().__init__()
+        self.api_address = api_address
+        self.username = username
+        self.password = password
+        self.logger = logger
+        self.timeout = timeout
+        self.torrent_cache: Optional[TorrentListCache] = None  # Used by torrent_utils.get_torrent_list
+        retry = JitteredRetry(total=retries, connect=retries, read=retries, status=retries,
+                              backoff_factor=backoff_factor, status_forcelist=RETRY_STATUSES,
+                              allowed_methods=IDEMPOTENT_METHODS, raise_on_status=False, respect_retry_after_header=True)
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        # Ask for every encoding urllib3 can decode here (gzip, deflate and brotli/zstd when installed)
+        self.headers['Accept-Encoding'] = make_headers(accept_encoding=True)['accept-encoding']
+
+    def login(self) -> None:
+        """Log in to the WebUI, raising ConnectionError when the credentials are rejected."""
+        response = super().request('POST', f"{self.api_address}{LOGIN_PATH}",
+                                   data={'username': self.username, 'password': self.password}, timeout=self.timeout)
+        response.raise_for_status()
+        if response.text != 'Ok.':
+            raise ConnectionError("Login failed: Unexpected response")
+
+    def save_cookies(self, cookie_path: str) -> None:
+        """Save the session cookie, readable by the owner only, so the next run can keep using the same session."""
+        cookies = [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path}
+                   for cookie in self.cookies]
+        tmp_path = cookie_path + '.tmp'
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as file:
+            json.dump({'address': self.api_address, 'cookies': cookies}, file)
+        os.replace(tmp_path, cookie_path)
+
+    def load_cookies(self, cookie_path: str) -> None:
+        """Restore a cookie saved by save_cookies for the same WebUI address; an expired one just causes a login."""
+        try:
+            with open(cookie_path, 'r') as file:
+                saved = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if saved.get('address') != self.api_address:
+            return
+        for cookie in saved.get('cookies', []):
+            self.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+
+    def request(self, method: str, url: str, *args: Any, **kwargs: Any) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        response = super().request(method, url, *args, **kwargs)
+        if response.status_code == 403 and not url.endswith(LOGIN_PATH):
+            if self.logger is not None:
+                self.logger.debug("Not authenticated with qBittorrent, logging in")
+            self.login()
+            response = super().request(method, url, *args, **kwargs)
+        return response
+
+def transport_options(config: configparser.ConfigParser) -> Dict[str, Any]:
+    """Transport settings of the [api] section as QBittorrentSession keyword arguments."""
+    return {
+        'timeout': (config.getfloat('api', 'connect_timeout', fallback=5), config.getfloat('api', 'read_timeout', fallback=60)),
+        'retries': config.getint('api', 'retries', fallback=3),
+        'backoff_factor': config.getfloat('api', 'backoff_factor', fallback=0.5),
+        'pool_size': config.getint('api', 'pool_size', fallback=4)
+    }
+
+def from_config(config: configparser.ConfigParser, logger: Optional[Logger] = None) -> QBittorrentSession:
+    """Create the session for the [login] WebUI with the settings of the [api] and [torrent_cache] sections."""
+    session = QBittorrentSession(config.get('login', 'address'), config.get('login', 'username'), config.get('login', 'password'),
+                                 logger, **transport_options(config))
+    session.torrent_cache = torrent_list_cache.from_config(config)
+    return session
@@ -1,40 +1,60 @@
 import os
+import re
 import requests
-from typing import Dict, Any
+from typing import Dict, List, Any, Optional, Pattern, Tuple
 from logging import Logger
 import logger_utils
 import torrent_utils
+import qbittorrent_api
 from configparser import ConfigParser
 import argparse
 
+def compile_keyword_matcher(keywords: List[str]) -> Optional[Pattern[str]]:
+    """Combine all keywords into one regex so each name is scanned once."""
+    if not keywords:
+        return None
+    return re.compile('|'.join(re.escape(keyword) for keyword in sorted(keywords, key=len, reverse=True)))
+
+def plan_force_start_changes(torrents: List[Dict[str, Any]], categories_force: List[str], matcher: Optional[Pattern[str]],
+                             unforce_unmatched: bool, logger: Logger) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Return the torrents whose force start has to be set and cleared."""
+    categories = set(categories_force)
+    to_force = []
+    to_unforce = []
+    for torrent in torrents:
+        category = torrent['category'].lower()
+        if category not in categories:
+            continue
+        matches = matcher is not None and matcher.search(torrent['name'].lower()) is not None
+        if matches and not torrent.get('force_start', False):
+            to_force.append(torrent)
+            logger.debug(f"Torrent {torrent['name']} marked for force seeding in category: {category} (matched keyword in name)")
+        elif not matches and unforce_unmatched and torrent.get('force_start', False):
+            to_unforce.append(torrent)
+            logger.debug(f"Torrent {torrent['name']} no longer matches a keyword in category: {category}, clearing force start")
+    return to_force, to_unforce
+
 def force_seed(session: requests.Session, logger: Logger, config: ConfigParser, test_mode: bool) -> None:
     api_address = config.get('login', 'address')
     categories_force = [cat.strip().lower() for cat in config.get('cleanup', 'categories_to_force_seed').split(',')]
     tracker_names = [kw.strip().lower() for kw in config.get('cleanup', 'trackers_to_force_seed').split(',') if kw.strip()]
 
-    for _ in range(2):  # Attempt twice: first try, then retry after login if unauthorized
-        try:
-            all_torrents = torrent_utils.get_torrent_list(session, api_address, logger)
-            break  # Exit loop if successful
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 403 and _ == 0:  # Retry only on the first attempt
-                torrent_utils.login_to_qbittorrent(session, api_address, 
-                                                   config.get('login', 'username'), 
-                                                   config.get('login', 'password'), logger)
-            else:
-                raise
-
-    filtered_torrents = []
-    
-    for torrent in all_torrents:
-        for category in categories_force:
-            if torrent['category'].lower() == category:
-                if any(tracker_prefix in torrent['name'].lower() for tracker_prefix in tracker_names):
-                    filtered_torrents.append(torrent)
-                    logger.debug(f"Torrent {torrent['name']} marked for force seeding in category: {category} (matched keyword in name)")
-
-
-    torrent_utils.force_torrents(session, api_address, filtered_torrents, logger, test_mode)
+    all_torrents = torrent_utils.get_torrent_list(session, api_address, logger)
+
+    to_force, to_unforce = plan_force_start_changes(
+        all_torrents,
+        categories_force,
+        compile_keyword_matcher(tracker_names),
+        config.getboolean('cleanup', 'unforce_unmatched_seeds', fallback=False),
+        logger
+    )
+
+    if not to_force and not to_unforce:
+        logger.debug("Force start already up to date for all torrents.")
+    if to_force:
+        torrent_utils.force_torrents(session, api_address, to_force, logger, test_mode, True)
+    if to_unforce:
+        torrent_utils.force_torrents(session, api_address, to_unforce, logger, test_mode, False)
 
 def main(test_mode: bool, logger: Logger, handler: Any, config: ConfigParser, session: requests.Session) -> None:
     try:
@@ -57,5 +77,5 @@ if __name__ == "__main__":
     script_directory = os.path.dirname(os.path.abspath(__file__))
     config = torrent_utils.load_configuration(script_directory)
     logger, log_handler = logger_utils.setup_logger(config.get('logging', 'location', fallback=''), config.getboolean('logging', 'debug'))
-    session = requests.Session()
+    session = qbittorrent_api.from_config(config, logger)
     main(test_mode, logger, log_handler, config, session)
\ No newline at end of file
@@ -1,41 +1,185 @@
 import os
+import json
+import time
+import heapq
 import requests
-from typing import Dict, Any
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, List, Any, Optional
 from logging import Logger
 import logger_utils
 import torrent_utils
+import qbittorrent_api
+from file_lock import try_locked
 from configparser import ConfigParser
 import argparse
 
+# Constants
+STALE_STATES = ('stalledUP', 'stalledDL', 'metaDL', 'error')
+TRACKER_ERROR_STATUSES = (4, 5, 6)  # Not working, tracker error, unreachable
+TRACKER_UPDATING_STATUS = 3
+TRACKER_SAMPLE_SIZE = 3
+MAX_BACKOFF_FACTOR = 16
+STATE_FILE_NAME = 'reannounce_state.json'
+RUN_LOCK_FILE_NAME = 'qbittorrent_seed_reannouncer.lock'
+
+def get_tracker_host(torrent: Dict[str, Any]) -> str:
+    """Host of the torrent's working tracker, falling back to the first tracker of its magnet link."""
+    tracker = torrent.get('tracker', '')
+    if not tracker:
+        trackers = parse_qs(urlparse(torrent.get('magnet_uri', '')).query).get('tr', [])
+        tracker = trackers[0] if trackers else ''
+    return urlparse(tracker).hostname or ''
+
+def needs_reannounce(torrent: Dict[str, Any], last_reannounce: Optional[float], now: float, min_interval: float) -> bool:
+    """Only reannounce torrents whose tracker or swarm information looks stale."""
+    if last_reannounce is not None and now - last_reannounce < min_interval:
+        return False
+    if not torrent.get('tracker'):
+        return True  # No tracker is currently working
+    if torrent.get('state') in STALE_STATES:
+        return True
+    return torrent.get('num_seeds', 0) == 0 and torrent.get('num_leechs', 0) == 0
+
+def load_reannounce_state(state_path: str) -> Dict[str, float]:
+    """Load the last reannounce time of each torrent."""
+    try:
+        with open(state_path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_reannounce_state(state_path: str, state: Dict[str, float], logger: Logger) -> None:
+    try:
+        with open(state_path + '.tmp', 'w') as file:
+            json.dump(state, file)
+        os.replace(state_path + '.tmp', state_path)
+    except OSError as e:
+        logger.error(f"Error saving reannounce state: {e}")
+
+def tracker_reports_errors(session: requests.Session, api_address: str, torrents: List[Dict[str, Any]], host: str, logger: Logger) -> bool:
+    """Check whether the tracker rejected or failed the announces of most of the sampled torrents.
+
+    Announces still in progress are not counted, so only finished announces decide.
+    """
+    finished = failed = 0
+    for torrent in torrents[:TRACKER_SAMPLE_SIZE]:
+        try:
+            trackers = torrent_utils.get_torrent_trackers(session, api_address, torrent['hash'], logger)
+        except requests.RequestException as e:
+            logger.debug(f"Could not read trackers of {torrent['name']}: {e}")
+            continue
+        statuses = [tracker.get('status') for tracker in trackers if urlparse(tracker.get('url', '')).hostname == host]
+        if not statuses or TRACKER_UPDATING_STATUS in statuses:
+            continue
+        finished += 1
+        failed += any(status in TRACKER_ERROR_STATUSES for status in statuses)
+    return finished > 0 and failed * 2 > finished
+
+def schedule_reannounces(session: requests.Session, api_address: str, torrents_by_host: Dict[str, List[Dict[str, Any]]],
+                         batch_size: int, per_tracker_per_minute: float, window_seconds: float,
+                         logger: Logger, test_mode: bool, reannounced: Dict[str, float]) -> None:
+    """Reannounce torrents in per-tracker batches spread over the run window.
+
+    Each tracker gets at most batch_size announces per request and at most
+    per_tracker_per_minute requests per minute. Batches of one tracker are spread
+    evenly over window_seconds. When the next batch of a tracker is due, the
+    announces of its previous batch have completed; while they report errors,
+    the delay doubles and they are checked again before the batch is sent.
+    A tracker that still fails at MAX_BACKOFF_FACTOR is left for the next run.
+    """
+    queue = []
+    intervals = {}
+    backoff = {}
+    for host, torrents in torrents_by_host.items():
+        batches = [torrents[start:start + batch_size] for start in range(0, len(torrents), batch_size)]
+        intervals[host] = max(60 / per_tracker_per_minute, window_seconds / len(batches))
+        backoff[host] = 1
+        heapq.heappush(queue, (0.0, host, batches, None))
+        logger.info(f"Tracker {host or 'unknown'}: {len(torrents)} torrents in {len(batches)} batches, "
+                    f"one every {intervals[host]:.0f} s")
+
+    started = time.monotonic()
+    while queue:
+        due, host, batches, previous_batch = heapq.heappop(queue)
+        if not test_mode:
+            delay = started + due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        if previous_batch and host:
+            if tracker_reports_errors(session, api_address, previous_batch, host, logger):
+                if backoff[host] >= MAX_BACKOFF_FACTOR:
+                    logger.warning(f"Tracker {host} still reports errors, leaving its "
+                                   f"{sum(len(batch) for batch in batches)} remaining torrents for the next run")
+                    continue
+                backoff[host] *= 2
+                logger.warning(f"Tracker {host} reported errors, backing off to one batch every "
+                               f"{intervals[host] * backoff[host]:.0f} s")
+                # Delay this batch by the extra backoff and check the previous batch again before sending it
+                heapq.heappush(queue, (due + intervals[host] * (backoff[host] - 1), host, batches, previous_batch))
+                continue
+            backoff[host] = 1
+
+        batch = batches.pop(0)
+        sent_batch = None
+        try:
+            torrent_utils.reannounce_torrents(session, api_address, batch, logger, test_mode)
+            for torrent in batch:
+                reannounced[torrent['hash']] = time.time()
+            sent_batch = None if test_mode else batch
+        except requests.RequestException as e:
+            backoff[host] = min(backoff[host] * 2, MAX_BACKOFF_FACTOR)
+            logger.error(f"Failed to reannounce {len(batch)} torrents on tracker {host or 'unknown'}, backing off to one batch every "
+                         f"{intervals[host] * backoff[host]:.0f} s: {e}")
+
+        if batches:
+            heapq.heappush(queue, (due + intervals[host] * backoff[host], host, batches, sent_batch))
+
 def check_space_and_remove_torrents(session: requests.Session, logger: Logger, config: ConfigParser, test_mode: bool) -> None:
     api_address = config.get('login', 'address')
     categories_reannounce = [cat.strip().lower() for cat in config.get('cleanup', 'categories_to_reannounce').split(',')]
+    batch_size = config.getint('reannounce', 'batch_size', fallback=20)
+    per_tracker_per_minute = config.getfloat('reannounce', 'per_tracker_per_minute', fallback=2)
+    window_seconds = config.getfloat('reannounce', 'window_minutes', fallback=10) * 60
+    min_interval = config.getfloat('reannounce', 'min_interval_minutes', fallback=30) * 60
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    state_path = os.path.join(config.get('logging', 'location', fallback='') or script_directory, STATE_FILE_NAME)
 
-    for _ in range(2):  # Attempt twice: first try, then retry after login if unauthorized
-        try:
-            all_torrents = torrent_utils.get_torrent_list(session, api_address, logger)
-            break  # Exit loop if successful
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 403 and _ == 0:  # Retry only on the first attempt
-                torrent_utils.login_to_qbittorrent(session, api_address, 
-                                                   config.get('login', 'username'), 
-                                                   config.get('login', 'password'), logger)
-            else:
-                raise
+    all_torrents = torrent_utils.get_torrent_list(session, api_address, logger)
+
+    state = load_reannounce_state(state_path)
+    now = time.time()
+    torrents_by_host: Dict[str, List[Dict[str, Any]]] = {}
+    skipped = 0
 
-    filtered_torrents = []
-    
     for torrent in all_torrents:
-        for category in categories_reannounce:
-            if torrent['category'].lower() == category:
-                filtered_torrents.append(torrent)
-                logger.debug(f"Torrent {torrent['name']} marked for reannounce in category: {category}")
+        category = torrent['category'].lower()
+        if category not in categories_reannounce:
+            continue
+        if needs_reannounce(torrent, state.get(torrent['hash']), now, min_interval):
+            torrents_by_host.setdefault(get_tracker_host(torrent), []).append(torrent)
+            logger.debug(f"Torrent {torrent['name']} marked for reannounce in category: {category}")
+        else:
+            skipped += 1
 
-    torrent_utils.reannounce_torrents(session, api_address, filtered_torrents, logger, test_mode)
+    logger.info(f"{sum(len(t) for t in torrents_by_host.values())} torrents need a reannounce, {skipped} skipped")
+    schedule_reannounces(session, api_address, torrents_by_host, batch_size, per_tracker_per_minute, window_seconds,
+                         logger, test_mode, state)
+
+    if not test_mode:
+        current_hashes = {torrent['hash'] for torrent in all_torrents}
+        save_reannounce_state(state_path, {h: t for h, t in state.items() if h in current_hashes}, logger)
 
 def main(test_mode: bool, logger: Logger, handler: Any, config: ConfigParser, session: requests.Session) -> None:
     try:
-        check_space_and_remove_torrents(session, logger, config, test_mode)
+        script_directory = os.path.dirname(os.path.abspath(__file__))
+        log_directory = config.get('logging', 'location', fallback='') or script_directory
+        # A run spreads its announces over the window; an overlapping run would announce the same torrents again
+        with try_locked(os.path.join(log_directory, RUN_LOCK_FILE_NAME)) as acquired:
+            if not acquired:
+                logger.warning("Another reannounce run is still in progress, skipping this run")
+            else:
+                check_space_and_remove_torrents(session, logger, config, test_mode)
     except Exception as e:
         logger.error(f"An error occurred: {e}")
     finally:
@@ -54,5 +198,5 @@ if __name__ == "__main__":
     script_directory = os.path.dirname(os.path.abspath(__file__))
     config = torrent_utils.load_configuration(script_directory)
     logger, log_handler = logger_utils.setup_logger(config.get('logging', 'location', fallback=''), config.getboolean('logging', 'debug'))
-    session = requests.Session()
-    main(test_mode, logger, log_handler, config, session)
\ No newline at end of file
+    session = qbittorrent_api.from_config(config, logger)
+    main(test_mode, logger, log_handler, config, session)
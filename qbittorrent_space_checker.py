@@ -1,27 +1,23 @@
 import os
+import json
 import requests
-from typing import Dict, Any
+from typing import Dict, List, Any
 from logging import Logger
 import logger_utils
 import torrent_utils
+import qbittorrent_api
 from configparser import ConfigParser
 import argparse
 
+# Constants
+BYTES_TO_GB = 1024 ** 3
+STATE_FILE_NAME = 'space_checker_state.json'
+
 def check_space_and_remove_torrents(session: requests.Session, logger: Logger, config: ConfigParser, test_mode: bool) -> None:
     api_address = config.get('login', 'address')
     categories_force = [cat.strip().lower() for cat in config.get('cleanup', 'categories_to_force_seed').split(',')]
 
-    for _ in range(2):  # Attempt twice: first try, then retry after login if unauthorized
-        try:
-            all_torrents = torrent_utils.get_torrent_list(session, api_address, logger)
-            break  # Exit loop if successful
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 403 and _ == 0:  # Retry only on the first attempt
-                torrent_utils.login_to_qbittorrent(session, api_address, 
-                                                   config.get('login', 'username'), 
-                                                   config.get('login', 'password'), logger)
-            else:
-                raise
+    all_torrents = torrent_utils.get_torrent_list(session, api_address, logger)
 
     filtered_torrents = []
     
@@ -33,43 +29,102 @@ def check_space_and_remove_torrents(session: requests.Session, logger: Logger, c
 
     torrent_utils.force_torrents(session, api_address, filtered_torrents, logger, test_mode)
 
-def main(logger: Logger, handler: Any, config: ConfigParser, session: requests.Session) -> None:
+def load_usage_state(state_path: str) -> Dict[str, Any]:
+    """Load the per-torrent entries and aggregates saved by the previous run."""
+    try:
+        with open(state_path, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'torrents': {}, 'categories': {}, 'states': {}, 'last_totals': {}}
+
+def save_usage_state(state_path: str, usage: Dict[str, Any], logger: Logger) -> None:
+    try:
+        with open(state_path + '.tmp', 'w') as file:
+            json.dump(usage, file, separators=(',', ':'))
+        os.replace(state_path + '.tmp', state_path)
+    except OSError as e:
+        logger.error(f"Error saving space checker state: {e}")
+
+def usage_entry(torrent: Dict[str, Any]) -> List[Any]:
+    """The fields of a torrent that the aggregates depend on."""
+    return [torrent['category'].lower(), torrent['state'], torrent['size'], torrent['eta'] == 0]
+
+def apply_usage_entry(usage: Dict[str, Any], entry: List[Any], sign: int) -> None:
+    category, state, size, completed = entry
+    category_totals = usage['categories'].setdefault(category, {'total': 0, 'completed': 0, 'count': 0})
+    category_totals['total'] += sign * size
+    category_totals['completed'] += sign * size if completed else 0
+    category_totals['count'] += sign
+    state_totals = usage['states'].setdefault(state, {'total': 0, 'count': 0})
+    state_totals['total'] += sign * size
+    state_totals['count'] += sign
+
+def update_usage(usage: Dict[str, Any], torrents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Update the aggregates from the torrents that changed since the last run and return them."""
+    previous = usage['torrents']
+    changed = []
+    current_hashes = set()
+    for torrent in torrents:
+        current_hashes.add(torrent['hash'])
+        entry = usage_entry(torrent)
+        old_entry = previous.get(torrent['hash'])
+        if old_entry == entry:
+            continue
+        if old_entry is not None:
+            apply_usage_entry(usage, old_entry, -1)
+        apply_usage_entry(usage, entry, 1)
+        previous[torrent['hash']] = entry
+        changed.append(torrent)
+
+    for torrent_hash in [h for h in previous if h not in current_hashes]:
+        apply_usage_entry(usage, previous.pop(torrent_hash), -1)
+
+    usage['categories'] = {c: totals for c, totals in usage['categories'].items() if totals['count'] > 0}
+    usage['states'] = {s: totals for s, totals in usage['states'].items() if totals['count'] > 0}
+    return changed
+
+def log_usage_summary(usage: Dict[str, Any], summary_categories: List[str], logger: Logger) -> None:
+    """Log one line per category and state, with growth since the last run."""
+    last_totals = usage.get('last_totals', {})
+    for category, totals in sorted(usage['categories'].items()):
+        growth = (totals['total'] - last_totals.get(category, 0)) / BYTES_TO_GB
+        logger.info(f"Category '{category}': {totals['total'] / BYTES_TO_GB:.2f} GB, "
+                    f"completed: {totals['completed'] / BYTES_TO_GB:.2f} GB, "
+                    f"torrents: {totals['count']}, growth: {growth:+.2f} GB")
+
+    logger.info("States: " + ", ".join(f"{state} {totals['count']} ({totals['total'] / BYTES_TO_GB:.2f} GB)"
+                                       for state, totals in sorted(usage['states'].items())))
+
+    total = sum(totals['total'] for totals in usage['categories'].values())
+    logger.info(f"Total size of torrents: {total / BYTES_TO_GB:.2f} GB, "
+                f"growth: {(total - sum(last_totals.values())) / BYTES_TO_GB:+.2f} GB")
+
+    completed_seeds = sum(totals['completed'] for category, totals in usage['categories'].items()
+                          if any(name in category for name in summary_categories))
+    logger.info(f"Total size of completed seeds: {completed_seeds / BYTES_TO_GB:.2f} GB")
+    usage['last_totals'] = {category: totals['total'] for category, totals in usage['categories'].items()}
+
+def main(logger: Logger, handler: Any, config: ConfigParser, session: requests.Session, details: bool = False) -> None:
     try:
         api_address = config.get('login', 'address')
+        summary_categories = [cat.strip().lower() for cat in config.get('space_checker', 'summary_categories', fallback='seeds, tv, movies').split(',') if cat.strip()]
+        details = details or config.getboolean('space_checker', 'log_torrent_details', fallback=False)
+        script_directory = os.path.dirname(os.path.abspath(__file__))
+        state_path = os.path.join(config.get('logging', 'location', fallback='') or script_directory, STATE_FILE_NAME)
+
+        all_torrents = torrent_utils.get_torrent_list(session, api_address, logger)
+
+        usage = load_usage_state(state_path)
+        changed_torrents = update_usage(usage, all_torrents)
+        logger.info(f"{len(changed_torrents)} of {len(all_torrents)} torrents changed since the last run")
+
+        if details:
+            for torrent in all_torrents:
+                logger.info(f"Torrent {torrent['name']} size: {torrent['size'] / BYTES_TO_GB:.2f} GB, "
+                            f"category: {torrent['category'].lower()}, state: {torrent['state']}")
 
-        for _ in range(2):  # Attempt twice: first try, then retry after login if unauthorized
-            try:
-                all_torrents = torrent_utils.get_torrent_list(session, api_address, logger)
-                break  # Exit loop if successful
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code == 403 and _ == 0:  # Retry only on the first attempt
-                    torrent_utils.login_to_qbittorrent(session, api_address, 
-                                                    config.get('login', 'username'), 
-                                                    config.get('login', 'password'), logger)
-                else:
-                    raise
-        
-        size_by_category = {}
-        for torrent in all_torrents:
-            torrent_size = torrent['size'] / (1024 ** 3)  # Convert size to GB
-            category = torrent['category'].lower()
-            size_by_category.setdefault(category, 0)
-            size_by_category[category] += torrent_size
-            logger.info(f"Torrent {torrent['name']} size: {torrent_size:.2f} GB, category: {category}")
-        
-        for category, size in size_by_category.items():
-            logger.info(f"Total size for category '{category}': {size:.2f} GB")
-
-        suma = sum(size_by_category.values())
-        logger.info(f"Total size of torrents: {suma:.2f} GB")
-
-
-        sum_of_seeds = 0
-        for torrent in all_torrents:
-            if any(category in torrent['category'] for category in ("seeds", "tv", "movies")) and torrent['eta'] == 0:
-                torrent_size = torrent['size'] / (1024 ** 3)
-                sum_of_seeds += torrent_size
-        logger.info(f"Total size of completed seeds: {sum_of_seeds:.2f} GB")
+        log_usage_summary(usage, summary_categories, logger)
+        save_usage_state(state_path, usage, logger)
 
     except Exception as e:
         logger.error(f"An error occurred: {e}")
@@ -80,11 +135,12 @@ def main(logger: Logger, handler: Any, config: ConfigParser, session: requests.S
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Qbittorrent Force Seeding Script")
     parser.add_argument('--config', type=str, help='Path to the configuration file')
+    parser.add_argument('--details', action='store_true', help='Also log the size, category and state of every torrent')
     args = parser.parse_args()
     config_path = args.config if args.config else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
 
     script_directory = os.path.dirname(os.path.abspath(__file__))
     config = torrent_utils.load_configuration(script_directory)
     logger, log_handler = logger_utils.setup_logger(config.get('logging', 'location', fallback=''), config.getboolean('logging', 'debug'))
-    session = requests.Session()
-    main(logger, log_handler, config, session)
\ No newline at end of file
+    session = qbittorrent_api.from_config(config, logger)
+    main(logger, log_handler, config, session, args.details)
\ No newline at end of file
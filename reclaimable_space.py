@@ -0,0 +1,176 @@
+import os
+import json
+import stat
+import time
+import configparser
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+from content_deleter import map_path, load_path_map
+
+# Constants
+STAT_CACHE_FILE_NAME = 'stat_cache.json'
+DEFAULT_MAX_AGE_HOURS = 24
+SECONDS_PER_HOUR = 3600
+
+def _allocated_bytes(stat_result: os.stat_result) -> int:
+    """Bytes actually allocated on disk, falling back to the file size where blocks are not reported."""
+    blocks = getattr(stat_result, 'st_blocks', None)
+    return blocks * 512 if blocks is not None else stat_result.st_size
+
+class ReclaimEstimator:
+    """Estimate the disk space actually freed by deleting torrent content.
+
+    Files are identified by (st_dev, st_ino), and a file only frees space once
+    all of its st_nlink links are part of the removed content, so hardlinked
+    library imports and cross-seeds are not counted as freed.
+
+    The file names found under a content folder are cached together with the
+    folder's mtime, and rescanned when the mtime changed or the entry is older
+    than max_age_seconds. The files themselves are stat'ed again on every
+    estimate, so a hardlink created since the scan is always noticed.
+    """
+
+    def __init__(self, cache_path: Optional[str], path_map: Optional[List[Tuple[str, str]]] = None,
+                 max_age_seconds: float = DEFAULT_MAX_AGE_HOURS * SECONDS_PER_HOUR):
+        self.cache_path = cache_path
+        self.path_map = path_map or []
+        self.max_age_seconds = max_age_seconds
+        self.cache = self._load_cache()
+        self.used_paths = set()
+        self.removed_links: Dict[Tuple[int, int], int] = {}
+
+    def _load_cache(self) -> Dict[str, Any]:
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path, 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self) -> None:
+        """Save the cache, dropping entries for content that was not looked at in this run."""
+        if not self.cache_path:
+            return
+        cache = {path: entry for path, entry in self.cache.items() if path in self.used_paths}
+        with open(self.cache_path + '.tmp', 'w') as file:
+            json.dump(cache, file, separators=(',', ':'))
+        os.replace(self.cache_path + '.tmp', self.cache_path)
+
+    def files(self, content_path: str) -> Optional[List[str]]:
+        """Local paths of the files of a content folder or file, or None if it is missing."""
+        local_path = map_path(content_path, self.path_map)
+        try:
+            root_stat = os.lstat(local_path)
+        except OSError:
+            return None
+        if not stat.S_ISDIR(root_stat.st_mode):
+            return [local_path]
+        self.used_paths.add(local_path)
+
+        entry = self.cache.get(local_path)
+        if (entry and 'names' in entry and entry['mtime'] == root_stat.st_mtime_ns
+                and time.time() - entry['scanned'] < self.max_age_seconds):
+            return [os.path.join(local_path, name) for name in entry['names']]
+
+        names = []
+        for root, _, file_names in os.walk(local_path):
+            names.extend(os.path.relpath(os.path.join(root, name), local_path) for name in file_names)
+        self.cache[local_path] = {'mtime': root_stat.st_mtime_ns, 'scanned': time.time(), 'names': names}
+        return [os.path.join(local_path, name) for name in names]
+
+    def _links(self, content_paths: Iterable[str]) -> Optional[Dict[Tuple[int, int], List[int]]]:
+        """[links in the content, st_nlink, bytes] per file of the content, or None if any of it is missing.
+
+        Each path is counted once, even when it is part of several of the given
+        content paths, so only distinct links of a file add up.
+        """
+        paths = set()
+        for content_path in set(content_paths):
+            files = self.files(content_path)
+            if files is None:
+                return None
+            paths.update(files)
+        links: Dict[Tuple[int, int], List[int]] = {}
+        for path in paths:
+            try:
+                file_stat = os.lstat(path)
+            except OSError:
+                continue  # Deleted since the folder was scanned
+            if stat.S_ISREG(file_stat.st_mode):
+                links.setdefault((file_stat.st_dev, file_stat.st_ino), [0, file_stat.st_nlink, _allocated_bytes(file_stat)])[0] += 1
+        return links
+
+    def standalone_bytes(self, content_paths: Iterable[str]) -> Optional[int]:
+        """Bytes freed by deleting only the given content, ignoring anything removed before."""
+        links = self._links(content_paths)
+        if links is None:
+            return None
+        return sum(size for count, nlink, size in links.values() if count >= nlink)
+
+    def marginal_bytes(self, content_paths: Iterable[str]) -> Optional[int]:
+        """Bytes freed by deleting the content on top of the content already marked as removed.
+
+        Does not mark anything, so a caller can still decide not to remove it.
+        """
+        links = self._links(content_paths)
+        if links is None:
+            return None
+        freed = 0
+        for inode, (count, nlink, size) in links.items():
+            removed = self.removed_links.get(inode, 0)
+            if removed < nlink <= removed + count:  # The last links go with this content
+                freed += size
+        return freed
+
+    def mark_removed(self, content_paths: Iterable[str]) -> None:
+        """Mark content that was selected for removal, so later estimates count its links as gone."""
+        for inode, (count, _, _) in (self._links(content_paths) or {}).items():
+            self.removed_links[inode] = self.removed_links.get(inode, 0) + count
+
+def is_rootless(torrent: Dict[str, Any]) -> bool:
+    """Whether the torrent is a multi-file torrent without a root folder, whose content path is its save path."""
+    content_path = torrent.get('content_path', '')
+    return bool(content_path) and content_path.rstrip('/\\') == torrent.get('save_path', '').rstrip('/\\')
+
+def content_paths(torrent: Dict[str, Any]) -> Optional[List[str]]:
+    """Paths of the content of a torrent, or None if it is not known.
+
+    A torrent without a root folder is made of the files in its content_files
+    list, as read from /torrents/files, and not of its whole save path.
+    """
+    if is_rootless(torrent):
+        return torrent.get('content_files')
+    return [torrent.get('content_path', '')]
+
+def content_key(torrent: Dict[str, Any]) -> str:
+    """Key of the content of a torrent: torrents with the same key share their content."""
+    if is_rootless(torrent):
+        files = torrent.get('content_files')
+        return '\n'.join(sorted(files)) if files else torrent['hash']
+    return torrent.get('content_path') or torrent['hash']
+
+def unit_content_paths(unit: List[Dict[str, Any]]) -> Optional[List[str]]:
+    """Content paths of all torrents of a unit, or None if the content of one of them is not known."""
+    paths = []
+    for torrent in unit:
+        torrent_paths = content_paths(torrent)
+        if torrent_paths is None:
+            return None
+        paths.extend(torrent_paths)
+    return paths
+
+def group_by_content(torrents: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Torrents sharing their content, such as cross-seeds, which have to be removed together."""
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for torrent in torrents:
+        groups.setdefault(content_key(torrent), []).append(torrent)
+    return groups
+
+def from_config(config: configparser.ConfigParser) -> Optional[ReclaimEstimator]:
+    """Create the estimator when [cleanup] inode_aware_space is enabled."""
+    if not config.getboolean('cleanup', 'inode_aware_space', fallback=False):
+        return None
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    default_cache = os.path.join(config.get('logging', 'location', fallback='') or script_directory, STAT_CACHE_FILE_NAME)
+    return ReclaimEstimator(config.get('cleanup', 'stat_cache', fallback=default_cache), load_path_map(config),
+                            config.getfloat('cleanup', 'stat_cache_max_age_hours', fallback=DEFAULT_MAX_AGE_HOURS) * SECONDS_PER_HOUR)
@@ -0,0 +1,103 @@
+import time
+import configparser
+from logging import Logger
+from typing import Callable, Iterator, List, Optional
+from removal_plan import PlannedRemoval, RemovalPlan
+
+# Constants
+BYTES_TO_GB = 1024**3
+BATCH_SECONDS = 5  # Budget of one batch, so a batch is never a burst of more than a few seconds of I/O
+RECOVERY_POLL_SECONDS = 2
+
+class RemovalPacer:
+    """Spreads the removals of a plan over time within an I/O budget.
+
+    Removals are issued in small batches so that at most bytes_per_second and
+    torrents_per_second are removed on average, space removals first. With a
+    free space probe, the pacer measures how much space has actually been
+    recovered: it waits while the disk lags more than max_lag_seconds of
+    budget behind the removals issued so far, and stops removing for space
+    once the free space target of the plan is reached.
+    """
+
+    def __init__(self, logger: Logger, bytes_per_second: float, torrents_per_second: float,
+                 free_space_probe: Optional[Callable[[], float]] = None, max_lag_seconds: float = 60,
+                 sleep: Callable[[float], None] = time.sleep, clock: Callable[[], float] = time.monotonic):
+        self.logger = logger
+        self.bytes_per_second = bytes_per_second
+        self.torrents_per_second = torrents_per_second
+        self.free_space_probe = free_space_probe
+        self.max_lag_seconds = max_lag_seconds
+        self.sleep = sleep
+        self.clock = clock
+        self._issued_gb = 0.0
+        self._next_at = 0.0
+
+    def _next_batch(self, pending: List[PlannedRemoval], max_batch: int) -> List[PlannedRemoval]:
+        max_bytes = self.bytes_per_second * BATCH_SECONDS
+        max_count = max(1, min(max_batch, int(self.torrents_per_second * BATCH_SECONDS)))
+        batch = [pending[0]]
+        batch_bytes = pending[0].expected_bytes_freed
+        for removal in pending[1:max_count]:
+            if batch_bytes + removal.expected_bytes_freed > max_bytes:
+                break
+            batch.append(removal)
+            batch_bytes += removal.expected_bytes_freed
+        return batch
+
+    def _wait_for_recovery(self, start_free_gb: float) -> float:
+        """Wait while the freed space lags too far behind the removals issued, and return the free space."""
+        max_lag_gb = self.bytes_per_second * self.max_lag_seconds / BYTES_TO_GB
+        deadline = self.clock() + self.max_lag_seconds
+        free_gb = self.free_space_probe()
+        while self._issued_gb - (free_gb - start_free_gb) > max_lag_gb and self.clock() < deadline:
+            self.logger.debug(f"Waiting for the disk to catch up: {free_gb - start_free_gb:.2f} of {self._issued_gb:.2f} GB freed")
+            self.sleep(RECOVERY_POLL_SECONDS)
+            free_gb = self.free_space_probe()
+        return free_gb
+
+    def batches(self, plan: RemovalPlan, max_batch: int) -> Iterator[List[PlannedRemoval]]:
+        """Yield the batches of the plan to execute, sleeping between them to stay within the budget.
+
+        Call record() with the removals of each batch that were actually executed.
+        """
+        pending = sorted(plan.removals, key=lambda removal: removal.reason != 'space')  # Most urgent deficit first
+        start_free_gb = self.free_space_probe() if self.free_space_probe is not None else None
+        self._issued_gb = 0.0
+        self._next_at = self.clock()
+
+        while pending:
+            if start_free_gb is not None and pending[0].reason == 'space':
+                free_gb = self._wait_for_recovery(start_free_gb)
+                if free_gb - start_free_gb >= plan.space_needed_gb:
+                    skipped = [removal for removal in pending if removal.reason == 'space']
+                    self.logger.info(f"Free space target reached after freeing {free_gb - start_free_gb:.2f} GB, "
+                                     f"keeping {len(skipped)} torrents planned for space")
+                    pending = [removal for removal in pending if removal.reason != 'space']
+                    continue
+
+            batch = self._next_batch(pending, max_batch)
+            pending = pending[len(batch):]
+            delay = self._next_at - self.clock()
+            if delay > 0:
+                self.sleep(delay)
+            yield batch
+
+    def record(self, removals: List[PlannedRemoval]) -> None:
+        """Charge executed removals against the budget."""
+        removed_bytes = sum(removal.expected_bytes_freed for removal in removals)
+        self._issued_gb += removed_bytes / BYTES_TO_GB
+        self._next_at = max(self._next_at, self.clock()) + max(removed_bytes / self.bytes_per_second,
+                                                                len(removals) / self.torrents_per_second)
+
+def from_config(config: configparser.ConfigParser, logger: Logger,
+                free_space_probe: Optional[Callable[[], float]] = None) -> Optional[RemovalPacer]:
+    """Create the pacer configured in the [removal_pacing] section, or None when removals are not paced."""
+    if not config.getboolean('removal_pacing', 'enabled', fallback=False):
+        return None
+    mb_per_second = config.getfloat('removal_pacing', 'mb_per_second', fallback=200)
+    torrents_per_second = config.getfloat('removal_pacing', 'torrents_per_second', fallback=2)
+    if mb_per_second <= 0 or torrents_per_second <= 0:
+        raise ValueError("[removal_pacing] mb_per_second and torrents_per_second must be greater than 0")
+    return RemovalPacer(logger, mb_per_second * 1024**2, torrents_per_second, free_space_probe,
+                        config.getfloat('removal_pacing', 'max_lag_seconds', fallback=60))
@@ -0,0 +1,90 @@
+import os
+import json
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Any, Iterator, Optional
+
+# Constants
+BYTES_TO_GB = 1024**3
+PLAN_VERSION = 1
+
+@dataclass
+class PlannedRemoval:
+    """A torrent selected for removal, with everything needed to execute and report it."""
+    hash: str
+    name: str
+    category: str
+    size: int
+    seeding_time: int
+    ratio: float
+    popularity: float
+    eta: int
+    tracker: str
+    score: float
+    reason: str  # 'space' or 'count'
+    expected_bytes_freed: int
+    content_path: str = ''
+    save_path: str = ''
+
+    @classmethod
+    def from_torrent(cls, torrent: Dict[str, Any], score: float, reason: str, expected_bytes_freed: Optional[int] = None) -> 'PlannedRemoval':
+        return cls(
+            hash=torrent['hash'],
+            name=torrent['name'],
+            category=torrent['category'],
+            size=torrent['size'],
+            seeding_time=torrent['seeding_time'],
+            ratio=torrent['ratio'],
+            popularity=torrent['popularity'],
+            eta=torrent['eta'],
+            tracker=torrent['tracker'],
+            score=score,
+            reason=reason,
+            expected_bytes_freed=torrent['size'] if expected_bytes_freed is None else expected_bytes_freed,
+            content_path=torrent.get('content_path', ''),
+            save_path=torrent.get('save_path', '')
+        )
+
+@dataclass
+class RemovalPlan:
+    """The removals decided by one cleanup run, which can be saved, reviewed and executed later."""
+    created: float = field(default_factory=time.time)
+    free_space_gb: float = 0.0
+    space_needed_gb: float = 0.0
+    removals: List[PlannedRemoval] = field(default_factory=list)
+
+    def add(self, removals: List[PlannedRemoval]) -> None:
+        """Add removals, skipping torrents that are already part of the plan."""
+        planned = {removal.hash for removal in self.removals}
+        for removal in removals:
+            if removal.hash not in planned:
+                self.removals.append(removal)
+                planned.add(removal.hash)
+
+    def expected_gb_freed(self, reason: Optional[str] = None) -> float:
+        return sum(r.expected_bytes_freed for r in self.removals if reason is None or r.reason == reason) / BYTES_TO_GB
+
+    def batches(self, batch_size: int) -> Iterator[List[PlannedRemoval]]:
+        for start in range(0, len(self.removals), batch_size):
+            yield self.removals[start:start + batch_size]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'version': PLAN_VERSION, **asdict(self)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'RemovalPlan':
+        if data.get('version') != PLAN_VERSION:
+            raise ValueError(f"Unsupported removal plan version: {data.get('version')}")
+        return cls(created=data['created'], free_space_gb=data['free_space_gb'], space_needed_gb=data['space_needed_gb'],
+                   removals=[PlannedRemoval(**removal) for removal in data['removals']])
+
+    def save(self, plan_path: str) -> None:
+        """Write the plan as JSON, replacing any previous plan atomically."""
+        with open(plan_path + '.tmp', 'w') as file:
+            json.dump(self.to_dict(), file, indent=4)
+        os.replace(plan_path + '.tmp', plan_path)
+
+    @classmethod
+    def load(cls, plan_path: str) -> 'RemovalPlan':
+        with open(plan_path, 'r') as file:
+            return cls.from_dict(json.load(file))
@@ -0,0 +1,260 @@
+import os
+import json
+import time
+import logging
+import argparse
+import configparser
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Iterator, Optional
+import torrent_utils
+import torrent_snapshot_archive
+from removal_plan import RemovalPlan
+
+# Constants
+BYTES_TO_GB = 1024**3
+SECONDS_PER_HOUR = 3600
+DEFAULT_MAX_ENTRIES = 28
+
+def load_variants(variants_path: str) -> List[Dict[str, Any]]:
+    """Load candidate policy variants from a JSON file.
+
+    The file holds a list of objects with a 'name' and one key per config section
+    to override, e.g. {"name": "strict", "seed_rules": {"movies": "seeding_time:1209600"}}.
+    Setting "__replace__": true in a section drops the base values of that section first.
+    """
+    with open(variants_path, 'r') as file:
+        variants = json.load(file)
+    for index, variant in enumerate(variants):
+        variant.setdefault('name', f"variant_{index}")
+    check_variant_names(variants)
+    return variants
+
+def check_variant_names(variants: List[Dict[str, Any]]) -> None:
+    """Raise ValueError when two variants share a name, as their results would be reported as one."""
+    seen = set()
+    for variant in variants:
+        if variant['name'] in seen:
+            raise ValueError(f"Duplicate variant name: {variant['name']}")
+        seen.add(variant['name'])
+
+def config_to_dict(config: configparser.ConfigParser) -> Dict[str, Dict[str, str]]:
+    """Convert a config into plain dicts so it can be sent to worker processes."""
+    return {section: dict(config[section]) for section in config.sections()}
+
+def build_variant_config(base_config: Dict[str, Dict[str, str]], variant: Dict[str, Any]) -> configparser.ConfigParser:
+    """Build the config for a variant by applying its section overrides on top of the base config."""
+    config = configparser.ConfigParser()
+    config.read_dict(base_config)
+    for section, values in variant.items():
+        if section == 'name' or not isinstance(values, dict):
+            continue
+        if values.get('__replace__') and config.has_section(section):
+            config.remove_section(section)
+        if not config.has_section(section):
+            config.add_section(section)
+        for key, value in values.items():
+            if key != '__replace__':
+                config.set(section, key, str(value))
+    return config
+
+def iter_snapshots(snapshots_path: str, step_seconds: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield recorded snapshots in time order, at most one per step_seconds.
+
+    snapshots_path is either a snapshot archive directory or a JSON lines file
+    where each line is an object with 'timestamp', an optional 'free_space' in
+    bytes and the 'torrents' list returned by /torrents/info.
+    """
+    if os.path.isdir(snapshots_path):
+        yield from torrent_snapshot_archive.SnapshotArchive(snapshots_path).iter_snapshots(step_seconds=step_seconds)
+        return
+
+    last_timestamp = None
+    with open(snapshots_path, 'r') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            snapshot = json.loads(line)
+            if last_timestamp is not None and snapshot['timestamp'] - last_timestamp < step_seconds:
+                continue
+            last_timestamp = snapshot['timestamp']
+            yield snapshot
+
+class RatioHistory:
+    """Rebuild the daily ratio log as torrent_ratio_logger would have written it at each simulated date."""
+
+    def __init__(self, recorded_log: Dict[str, List[Dict[str, Any]]], max_entries: int):
+        self.records = {torrent_hash: list(entries) for torrent_hash, entries in recorded_log.items()}
+        self.max_entries = max_entries
+
+    def advance(self, torrents: List[Dict[str, Any]], date: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Record the first ratio seen on a date and return the log visible on that date."""
+        view = {}
+        for torrent in torrents:
+            entries = self.records.setdefault(torrent['hash'], [])
+            while entries and entries[-1]['date'] > date:
+                entries.pop()
+            if not entries or entries[-1]['date'] != date:
+                entries.append({'date': date, 'ratio': torrent['ratio']})
+            view[torrent['hash']] = entries[-self.max_entries:]
+        return view
+
+def simulate_free_space(snapshot: Dict[str, Any], torrents: List[Dict[str, Any]], removed_sizes: Dict[str, int],
+                        disk_size_gb: Optional[float]) -> float:
+    """Free space in GB the disk would have had if the simulated removals had happened."""
+    reclaimed = sum(removed_sizes[t['hash']] for t in torrents if t['hash'] in removed_sizes)
+    if snapshot.get('free_space') is not None:
+        return (snapshot['free_space'] + reclaimed) / BYTES_TO_GB
+    if disk_size_gb is None:
+        raise ValueError(f"Snapshot at {snapshot['timestamp']} has no free_space and no disk size was given")
+    return disk_size_gb - (sum(t['size'] for t in torrents) - reclaimed) / BYTES_TO_GB
+
+def new_variant_state(variant: Dict[str, Any], base_config: Dict[str, Dict[str, str]], logger: logging.Logger) -> Dict[str, Any]:
+    config = build_variant_config(base_config, variant)
+    return {
+        'name': variant['name'],
+        'config': config,
+        'bonus_rules': torrent_utils.load_bonus_rules(config),
+        'category_rules': torrent_utils.get_category_rules(config, logger),
+        'categories_space': [cat.strip().lower() for cat in config.get('cleanup', 'categories_to_check_for_space', fallback='').split(',') if cat.strip()],
+        'categories_count': [cat.strip().lower() for cat in config.get('cleanup', 'categories_to_check_for_number', fallback='').split(',') if cat.strip()],
+        'removed_sizes': {},
+        'upload_retained': 0,
+        'upload_forgone': 0,
+        'bytes_deleted': 0,
+        'deletions': 0,
+        'runtime': 0.0,
+    }
+
+def replay_step(state: Dict[str, Any], snapshot: Dict[str, Any], ratio_log: Dict[str, List[Dict[str, Any]]],
+                disk_size_gb: Optional[float], logger: logging.Logger) -> None:
+    """Run one simulated cleanup pass for a variant against a snapshot."""
+    config = state['config']
+    removed_sizes = state['removed_sizes']
+    free_space = simulate_free_space(snapshot, snapshot['torrents'], removed_sizes, disk_size_gb)
+    # Planning stores scores on the torrents, so each variant works on its own copies of the shared snapshot
+    torrents = [dict(t) for t in snapshot['torrents'] if t['hash'] not in removed_sizes]
+
+    space_needed, additional_space_needed, _ = torrent_utils.compute_space_needed(free_space, torrents, config)
+    filtered_torrents = torrent_utils.filter_torrents_by_rules(torrents, state['category_rules'], logger)
+
+    plan = RemovalPlan()
+    if space_needed > 0 or additional_space_needed > 0:
+        plan.add(torrent_utils.plan_removals_by_space(
+            filtered_torrents, state['categories_space'], max(space_needed, additional_space_needed),
+            logger, '', state['bonus_rules'], config, ratio_log))
+
+    if state['categories_count']:
+        plan.add(torrent_utils.plan_removals_by_count(
+            filtered_torrents, state['categories_count'], config.getint('cleanup', 'max_torrents_for_categories'),
+            logger, '', state['bonus_rules'],
+            config.getboolean('cleanup', 'sort_count_removal_by_size', fallback=False), config, ratio_log))
+
+    for removal in plan.removals:
+        removed_sizes[removal.hash] = removal.size
+        state['bytes_deleted'] += removal.size
+        state['deletions'] += 1
+
+def account_uploads(state: Dict[str, Any], previous_uploaded: Dict[str, int], torrents: List[Dict[str, Any]]) -> None:
+    """Credit upload growth since the previous snapshot to retained or forgone totals."""
+    removed_sizes = state['removed_sizes']
+    for torrent in torrents:
+        previous = previous_uploaded.get(torrent['hash'])
+        if previous is None:
+            continue
+        uploaded = max(0, torrent.get('uploaded', 0) - previous)
+        if torrent['hash'] in removed_sizes:
+            state['upload_forgone'] += uploaded
+        else:
+            state['upload_retained'] += uploaded
+
+def replay_variants(variants: List[Dict[str, Any]], base_config: Dict[str, Dict[str, str]], snapshots_path: str,
+                    ratio_log_path: str, step_seconds: int, disk_size_gb: Optional[float]) -> List[Dict[str, Any]]:
+    """Replay the recorded history once and evaluate every given variant on each step."""
+    logger = logging.getLogger('removal_replay')
+    logger.setLevel(logging.WARNING)
+
+    recorded_log = torrent_utils.load_ratio_log(ratio_log_path) if ratio_log_path else {}
+    max_entries = int(base_config.get('torrent_ratio_logger', {}).get('max_entries', DEFAULT_MAX_ENTRIES))
+    history = RatioHistory(recorded_log, max_entries)
+    states = [new_variant_state(variant, base_config, logger) for variant in variants]
+    previous_uploaded: Dict[str, int] = {}
+    steps = 0
+
+    for snapshot in iter_snapshots(snapshots_path, step_seconds):
+        date = datetime.fromtimestamp(snapshot['timestamp']).strftime('%Y-%m-%d')
+        ratio_log = history.advance(snapshot['torrents'], date)
+        for state in states:
+            started = time.perf_counter()
+            account_uploads(state, previous_uploaded, snapshot['torrents'])
+            replay_step(state, snapshot, ratio_log, disk_size_gb, logger)
+            state['runtime'] += time.perf_counter() - started
+        previous_uploaded = {t['hash']: t.get('uploaded', 0) for t in snapshot['torrents']}
+        steps += 1
+
+    return [{
+        'name': state['name'],
+        'steps': steps,
+        'upload_retained_bytes': state['upload_retained'],
+        'upload_forgone_bytes': state['upload_forgone'],
+        'bytes_deleted': state['bytes_deleted'],
+        'deletions': state['deletions'],
+        'runtime_seconds': round(state['runtime'], 3),
+    } for state in states]
+
+def run_replay(variants: List[Dict[str, Any]], config: configparser.ConfigParser, snapshots_path: str, ratio_log_path: str,
+               step_seconds: int, disk_size_gb: Optional[float], workers: int) -> List[Dict[str, Any]]:
+    """Evaluate all variants, spreading them over a process pool."""
+    check_variant_names(variants)
+    base_config = config_to_dict(config)
+    workers = max(1, min(workers, len(variants)))
+    batches = [variants[index::workers] for index in range(workers)]
+
+    if workers == 1:
+        return replay_variants(variants, base_config, snapshots_path, ratio_log_path, step_seconds, disk_size_gb)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(replay_variants, batch, base_config, snapshots_path, ratio_log_path, step_seconds, disk_size_gb)
+                   for batch in batches]
+        for future in futures:
+            results.extend(future.result())
+    order = {variant['name']: index for index, variant in enumerate(variants)}
+    return sorted(results, key=lambda result: order[result['name']])
+
+def format_results(results: List[Dict[str, Any]]) -> List[str]:
+    lines = [f"{'Variant':<30} {'Upload kept GB':>15} {'Upload lost GB':>15} {'Deleted GB':>11} {'Deletions':>10} {'Runtime s':>10}"]
+    for result in sorted(results, key=lambda r: (-r['upload_retained_bytes'], r['bytes_deleted'])):
+        lines.append(f"{result['name'][:30]:<30} "
+                     f"{result['upload_retained_bytes'] / BYTES_TO_GB:>15.2f} "
+                     f"{result['upload_forgone_bytes'] / BYTES_TO_GB:>15.2f} "
+                     f"{result['bytes_deleted'] / BYTES_TO_GB:>11.2f} "
+                     f"{result['deletions']:>10} "
+                     f"{result['runtime_seconds']:>10.2f}")
+    return lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Qbittorrent Removal Policy Replay")
+    parser.add_argument('--snapshots', type=str, required=True, help='Snapshot archive directory or JSON lines file of recorded snapshots')
+    parser.add_argument('--variants', type=str, required=True, help='Path to the JSON file with the policy variants')
+    parser.add_argument('--ratio-log', type=str, help='Path to a recorded torrent_ratio_log.json used as initial history')
+    parser.add_argument('--step-hours', type=float, default=1, help='Simulated time between cleanup runs')
+    parser.add_argument('--disk-size-gb', type=float, help='Disk size used when snapshots carry no free_space')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+    parser.add_argument('--output', type=str, help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    config = torrent_utils.load_configuration(script_directory)
+    variants = load_variants(args.variants)
+
+    started = time.perf_counter()
+    results = run_replay(variants, config, args.snapshots, args.ratio_log, int(args.step_hours * SECONDS_PER_HOUR),
+                         args.disk_size_gb, args.workers)
+    for line in format_results(results):
+        print(line)
+    print(f"Evaluated {len(variants)} variants in {time.perf_counter() - started:.1f} s")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
@@ -0,0 +1,108 @@
+import time
+from typing import List, Optional, Sequence, Tuple
+
+# Constants
+EXACT_MAX_ITEMS = 64
+NODES_PER_CLOCK_CHECK = 1024
+
+def _density_order(sizes: Sequence[float], costs: Sequence[float]) -> List[int]:
+    return sorted(range(len(sizes)), key=lambda i: (costs[i] / sizes[i] if sizes[i] > 0 else float('inf'), -sizes[i]))
+
+def _prune_redundant(selected: List[int], sizes: Sequence[float], costs: Sequence[float], need: float) -> List[int]:
+    """Drop the most expensive items that are not needed to cover the deficit."""
+    covered = sum(sizes[i] for i in selected)
+    kept = []
+    for i in sorted(selected, key=lambda i: -costs[i]):
+        if covered - sizes[i] >= need:
+            covered -= sizes[i]
+        else:
+            kept.append(i)
+    return kept
+
+def approximate_cover(sizes: Sequence[float], costs: Sequence[float], need: float) -> List[int]:
+    """Cheap cover of the deficit, at most twice the optimal cost.
+
+    Items are taken by cost per size as long as they leave part of the deficit
+    uncovered. Every item that would cover the rest completes a candidate
+    solution, and the cheapest candidate wins (the modified greedy heuristic of
+    Csirik et al., 1991). Runs in O(n log n).
+    """
+    chosen: List[int] = []
+    covered = 0.0
+    chosen_cost = 0.0
+    best_cost, best = float('inf'), None
+    for i in _density_order(sizes, costs):
+        if covered + sizes[i] >= need:
+            if chosen_cost + costs[i] < best_cost:
+                best_cost, best = chosen_cost + costs[i], (len(chosen), i)
+        else:
+            chosen.append(i)
+            covered += sizes[i]
+            chosen_cost += costs[i]
+    if best is None:
+        return chosen  # Not coverable, take everything
+    length, completion = best
+    return _prune_redundant(chosen[:length] + [completion], sizes, costs, need)
+
+def exact_cover(sizes: Sequence[float], costs: Sequence[float], need: float, incumbent: List[int],
+                deadline: float) -> Tuple[List[int], bool]:
+    """Cheapest cover by branch and bound, starting from an incumbent solution.
+
+    Returns the best cover found and whether it was proven optimal before the deadline.
+    """
+    order = _density_order(sizes, costs)
+    best = {'cost': sum(costs[i] for i in incumbent), 'items': list(incumbent)}
+    nodes = [0]
+    timed_out = [False]
+
+    def lower_bound(position: int, deficit: float) -> float:
+        """Cost of covering the deficit with fractions of the remaining items."""
+        bound = 0.0
+        for i in order[position:]:
+            if sizes[i] >= deficit:
+                return bound + costs[i] * deficit / sizes[i]
+            bound += costs[i]
+            deficit -= sizes[i]
+        return float('inf')
+
+    def search(position: int, deficit: float, cost: float, chosen: List[int]) -> None:
+        nodes[0] += 1
+        if nodes[0] % NODES_PER_CLOCK_CHECK == 0 and time.monotonic() > deadline:
+            timed_out[0] = True
+        if timed_out[0]:
+            return
+        if deficit <= 0:
+            if cost < best['cost']:
+                best['cost'], best['items'] = cost, list(chosen)
+            return
+        if position == len(order) or cost + lower_bound(position, deficit) >= best['cost']:
+            return
+        item = order[position]
+        chosen.append(item)
+        search(position + 1, deficit - sizes[item], cost + costs[item], chosen)
+        chosen.pop()
+        search(position + 1, deficit, cost, chosen)
+
+    search(0, need, 0.0, [])
+    return best['items'], not timed_out[0]
+
+def select_cover(sizes: Sequence[float], costs: Sequence[float], need: float, time_budget: float,
+                 incumbent: Optional[List[int]] = None) -> Tuple[List[int], bool]:
+    """Indices of the items to take so their sizes cover need at the lowest total cost.
+
+    Small candidate sets are solved exactly within time_budget seconds; larger
+    ones, or searches that run out of time, fall back to the approximation.
+    An incumbent cover, e.g. the greedy one, is kept when it is cheaper than
+    the approximation. Returns the selection and whether it is proven optimal.
+    """
+    if need <= 0 or not sizes:
+        return [], True
+    if sum(sizes) < need:
+        return list(range(len(sizes))), True
+    selected = approximate_cover(sizes, costs, need)
+    if (incumbent and sum(sizes[i] for i in incumbent) >= need
+            and sum(costs[i] for i in incumbent) < sum(costs[i] for i in selected)):
+        selected = list(incumbent)
+    if len(sizes) > EXACT_MAX_ITEMS:
+        return selected, False
+    return exact_cover(sizes, costs, need, selected, time.monotonic() + time_budget)
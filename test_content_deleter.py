@@ -0,0 +1,113 @@
+import os
+import sys
+import logging
+import tempfile
+import unittest
+import torrent_utils
+from content_deleter import ContentDeleter
+from removal_plan import PlannedRemoval
+from testing_utils import make_torrent, FakeSession
+
+def make_removal(torrent_hash: str, content_path: str, save_path: str) -> PlannedRemoval:
+    return PlannedRemoval.from_torrent(make_torrent(torrent_hash, size=0, content_path=content_path, save_path=save_path), 0.0, 'space')
+
+class TestContentDeleter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.save_path = os.path.join(self.directory.name, 'downloads')
+        self.deleter = ContentDeleter(os.path.join(self.directory.name, 'journal.jsonl'), logging.getLogger('test_deleter'),
+                                      workers=1, low_priority=False)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, *parts: str) -> str:
+        path = os.path.join(self.save_path, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write('data')
+        return path
+
+    def test_deletes_only_files_of_torrent_without_root_folder(self):
+        own = [self.write('a.mkv'), self.write('Extras', 'b.mkv')]
+        sibling = self.write('other_torrent', 'movie.mkv')
+        user_file = self.write('Extras', 'notes.txt')
+        self.deleter.queue([make_removal('h1', self.save_path, self.save_path)], {'h1': own})
+        self.deleter.run({sibling})
+
+        self.assertFalse(any(os.path.exists(path) for path in own))
+        self.assertTrue(os.path.exists(sibling))
+        self.assertTrue(os.path.exists(user_file))
+        self.assertTrue(os.path.isdir(self.save_path))
+        self.assertEqual(self.deleter.pending(), {})
+
+    def test_rootless_neighbour_only_protects_its_own_files(self):
+        own = [self.write('A', 'a.bin')]
+        neighbour = [self.write('b1.bin'), self.write('B2', 'b2.bin')]
+        session = FakeSession({
+            '/torrents/info': lambda params: [make_torrent('n1', content_path=self.save_path, save_path=self.save_path)],
+            '/torrents/files': lambda params: [{'name': 'b1.bin'}, {'name': 'B2/b2.bin'}]})
+        self.deleter.queue([make_removal('h1', os.path.dirname(own[0]), self.save_path)], {'h1': own})
+        in_use = torrent_utils.get_files_in_use(session, '', [entry['path'] for entry in self.deleter.pending().values()],
+                                                self.deleter.logger)
+        self.assertEqual(in_use, set(neighbour))
+
+        self.assertEqual(self.deleter.run(in_use), 4)
+        self.assertFalse(os.path.exists(os.path.dirname(own[0])))
+        self.assertTrue(all(os.path.exists(path) for path in neighbour))
+        self.assertEqual(self.deleter.pending(), {})
+
+    def test_prunes_empty_folders_but_not_save_path(self):
+        own = [self.write('Show', 'Season 1', 'e1.mkv'), self.write('Show', 'e2.mkv')]
+        content_path = os.path.join(self.save_path, 'Show')
+        self.deleter.queue([make_removal('h1', content_path, self.save_path)], {'h1': own})
+        self.deleter.run(set())
+
+        self.assertFalse(os.path.exists(content_path))
+        self.assertTrue(os.path.isdir(self.save_path))
+
+    def test_files_in_use_stay_pending_until_released(self):
+        own = [self.write('Show', 'e1.mkv'), self.write('Show', 'e2.mkv')]
+        self.deleter.queue([make_removal('h1', os.path.join(self.save_path, 'Show'), self.save_path)], {'h1': own})
+        self.deleter.run({own[1]})
+
+        self.assertFalse(os.path.exists(own[0]))
+        self.assertTrue(os.path.exists(own[1]))
+        self.assertEqual(self.deleter.pending()['h1']['files'], [own[1]])
+
+        self.deleter.run({own[1]})  # Still in use: nothing happens
+        self.assertTrue(os.path.exists(own[1]))
+        self.deleter.run(set())
+        self.assertFalse(os.path.exists(own[1]))
+        self.assertEqual(self.deleter.pending(), {})
+
+    def test_refuses_save_path_without_file_list(self):
+        sibling = self.write('other_torrent', 'movie.mkv')
+        self.write('a.mkv')
+        self.deleter.queue([make_removal('h1', self.save_path, self.save_path)], {})
+        self.deleter.run(set())
+
+        self.assertTrue(os.path.exists(sibling))
+        self.assertEqual(self.deleter.pending(), {})
+
+    def test_waits_for_folder_holding_files_in_use_without_file_list(self):
+        sibling = self.write('Pack', 'other', 'movie.mkv')
+        self.deleter.queue([make_removal('h1', os.path.join(self.save_path, 'Pack'), self.save_path)], {})
+        self.deleter.run({sibling})
+
+        self.assertTrue(os.path.exists(sibling))
+        self.assertIn('h1', self.deleter.pending())
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'thread priorities are per thread on Linux only')
+    def test_low_priority_leaves_the_calling_thread_alone(self):
+        deleter = ContentDeleter(self.deleter.journal_path, self.deleter.logger, workers=1, low_priority=True)
+        own = [self.write('Show', 'e1.mkv')]
+        deleter.queue([make_removal('h1', os.path.join(self.save_path, 'Show'), self.save_path)], {'h1': own})
+        priority = os.getpriority(os.PRIO_PROCESS, 0)
+        deleter.run(set())
+        self.assertFalse(os.path.exists(own[0]))
+        self.assertEqual(os.getpriority(os.PRIO_PROCESS, 0), priority)
+
+if __name__ == '__main__':
+    unittest.main()
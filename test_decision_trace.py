@@ -0,0 +1,66 @@
+import os
+import json
+import logging
+import tempfile
+import unittest
+import configparser
+from unittest import mock
+import torrent_utils
+import torrent_filterer
+from decision_trace import DecisionTrace, NULL_TRACE
+from testing_utils import make_torrent, FakeSession
+
+LOGGER = logging.getLogger('test_decision_trace')
+HASHES = [f"{index:040x}" for index in range(200)]
+
+class TestDecisionTrace(unittest.TestCase):
+
+    def test_disabled_trace_wants_nothing(self):
+        self.assertFalse(NULL_TRACE.wants(make_torrent()))
+
+    def test_categories_are_sampled_by_hash(self):
+        trace = DecisionTrace('unused', categories={'tv'}, sample_rate=0.5)
+        selected = {h for h in HASHES if trace.wants(make_torrent(h))}
+        self.assertTrue(0 < len(selected) < len(HASHES))
+        again = DecisionTrace('unused', categories={'tv'}, sample_rate=0.5)
+        self.assertEqual({h for h in HASHES if again.wants(make_torrent(h))}, selected)  # Same torrents on every run
+        self.assertFalse(trace.wants(make_torrent('f' * 40, category='movies')))
+
+    def test_listed_hashes_are_never_sampled_out(self):
+        trace = DecisionTrace('unused', categories={'movies'}, hashes={HASHES[0]}, sample_rate=0)
+        self.assertTrue(trace.wants(make_torrent(HASHES[0])))
+        self.assertFalse(trace.wants(make_torrent(HASHES[1], category='movies')))
+
+    def test_flush_appends_json_lines(self):
+        with tempfile.TemporaryDirectory() as directory:
+            trace_path = os.path.join(directory, 'trace.jsonl')
+            trace = DecisionTrace(trace_path)
+            for run in range(2):
+                trace.record('score', make_torrent(), average_ratio=run)
+                trace.flush()
+            with open(trace_path, 'r') as file:
+                events = [json.loads(line) for line in file]
+        self.assertEqual([(event['event'], event['average_ratio']) for event in events], [('score', 0), ('score', 1)])
+        self.assertEqual(trace.events, [])
+
+    def test_events_are_kept_when_planning_fails(self):
+        torrents = [make_torrent(h, seeding_time=7200) for h in HASHES[:3]]
+        session = FakeSession({'/sync/maindata': lambda params: {'server_state': {'free_space_on_disk': 1024**4}},
+                               '/torrents/info': lambda params: torrents})
+        with tempfile.TemporaryDirectory() as directory:
+            config = configparser.ConfigParser()
+            config.read_dict({'login': {'address': ''}, 'logging': {'location': directory},
+                              'cleanup': {'min_space_gb': '1', 'categories_to_check_for_space': 'tv',
+                                          'categories_to_check_for_number': 'tv', 'max_torrents_for_categories': '1'},
+                              'seed_rules': {'tv': 'seeding_time:3600'},
+                              'decision_trace': {'enabled': 'true'}})
+            with mock.patch.object(torrent_utils, 'plan_removals_by_count', side_effect=RuntimeError('planning failed')):
+                with self.assertRaises(RuntimeError):
+                    torrent_filterer.check_space_and_remove_torrents(session, LOGGER, config, True, {},
+                                                                     os.path.join(directory, 'plan.json'))
+            with open(os.path.join(directory, 'decision_trace.jsonl'), 'r') as file:
+                events = [json.loads(line) for line in file]
+        self.assertEqual(sum(event['event'] == 'eligibility' for event in events), 3)
+
+if __name__ == '__main__':
+    unittest.main()
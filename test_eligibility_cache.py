@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from eligibility_cache import EligibilityCache
+from testing_utils import make_torrent as make_info_torrent
+
+RULES = {'tv': {'seeding_time': 3600, 'ratio': 1.0, 'num_seeds': 2}}
+
+def make_torrent(seeding_time: int, ratio: float, **fields) -> dict:
+    return make_info_torrent(seeding_time=seeding_time, ratio=ratio, num_seeds=5, **fields)
+
+class TestEligibilityCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = EligibilityCache(None)
+        self.cache.set_rules(RULES)
+
+    def test_reuses_verdict_while_fields_are_unchanged(self):
+        torrent = make_torrent(7200, 1.5)
+        self.cache.store(torrent, 'tv', RULES['tv'], True, 1000)
+        self.assertTrue(self.cache.lookup(make_torrent(9000, 1.5), 'tv', RULES['tv'], 2000))
+
+    def test_checked_field_change_invalidates(self):
+        self.cache.store(make_torrent(7200, 1.5), 'tv', RULES['tv'], True, 1000)
+        self.assertIsNone(self.cache.lookup(make_info_torrent(seeding_time=7300, ratio=1.5, num_seeds=1), 'tv', RULES['tv'], 1100))
+        self.assertIsNone(self.cache.lookup(make_torrent(7300, 0.5), 'tv', RULES['tv'], 1100))  # Ratio went down
+
+    def test_growing_ratio_keeps_the_verdict_until_its_rule_is_met(self):
+        self.cache.store(make_torrent(7200, 0.2), 'tv', RULES['tv'], False, 1000)
+        self.assertFalse(self.cache.lookup(make_torrent(7300, 0.9), 'tv', RULES['tv'], 1100))
+        self.assertIsNone(self.cache.lookup(make_torrent(7300, 1.0), 'tv', RULES['tv'], 1100))
+
+        self.cache.store(make_torrent(7200, 1.5), 'tv', RULES['tv'], True, 1000)
+        self.assertTrue(self.cache.lookup(make_torrent(7300, 2.5), 'tv', RULES['tv'], 1100))
+
+    def test_unmet_clock_rule_is_rechecked_when_it_can_be_met(self):
+        self.cache.store(make_torrent(600, 1.5), 'tv', RULES['tv'], False, 1000)
+        self.assertFalse(self.cache.lookup(make_torrent(700, 1.5), 'tv', RULES['tv'], 1100))
+        self.assertIsNone(self.cache.lookup(make_torrent(3600, 1.5), 'tv', RULES['tv'], 1000 + 3000))
+
+    def test_clock_going_down_invalidates(self):
+        # Removed and added again under the same hash: the counters start over
+        self.cache.store(make_torrent(7200, 1.5), 'tv', RULES['tv'], True, 1000)
+        self.assertIsNone(self.cache.lookup(make_torrent(60, 1.5), 'tv', RULES['tv'], 1100))
+
+    def test_category_and_rule_changes_invalidate(self):
+        self.cache.store(make_torrent(7200, 1.5), 'tv', RULES['tv'], True, 1000)
+        self.assertIsNone(self.cache.lookup(make_torrent(7200, 1.5), 'movies', RULES['tv'], 1100))
+        self.cache.set_rules({'tv': {'seeding_time': 3600, 'ratio': 2.0}})
+        self.assertIsNone(self.cache.lookup(make_torrent(7200, 1.5), 'tv', RULES['tv'], 1100))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_path = os.path.join(directory, 'eligibility_cache.json')
+            cache = EligibilityCache(cache_path)
+            cache.set_rules(RULES)
+            cache.store(make_torrent(7200, 1.5), 'tv', RULES['tv'], True, 1000)
+            cache.save(['a' * 40])
+
+            loaded = EligibilityCache(cache_path)
+            loaded.set_rules(RULES)
+            self.assertTrue(loaded.lookup(make_torrent(7300, 1.5), 'tv', RULES['tv'], 1100))
+            self.assertIsNone(loaded.lookup(make_torrent(10, 1.5), 'tv', RULES['tv'], 1100))
+
+    def test_unchanged_cache_is_not_written(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_path = os.path.join(directory, 'eligibility_cache.json')
+            cache = EligibilityCache(cache_path)
+            cache.set_rules(RULES)
+            cache.store(make_torrent(7200, 1.5), 'tv', RULES['tv'], True, 1000)
+            cache.save(['a' * 40])
+
+            loaded = EligibilityCache(cache_path)
+            os.remove(cache_path)
+            loaded.set_rules(RULES)
+            self.assertTrue(loaded.lookup(make_torrent(7300, 1.6), 'tv', RULES['tv'], 1100))
+            loaded.save(['a' * 40])
+            self.assertFalse(os.path.exists(cache_path))
+            loaded.save([])  # The torrent is gone
+            self.assertTrue(os.path.exists(cache_path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import json
+import stat
+import tempfile
+import threading
+import unittest
+import configparser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from qbittorrent_api import QBittorrentSession, transport_options, LOGIN_PATH
+
+INFO_PATH = '/api/v2/torrents/info'
+DELETE_PATH = '/api/v2/torrents/delete'
+
+class FakeWebUI(BaseHTTPRequestHandler):
+    """Answers each request with the next scripted (status, body) of its path, then with (200, '[]')."""
+
+    def do_GET(self):
+        self.answer()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.answer()
+
+    def answer(self):
+        path = self.path.split('?')[0]
+        self.server.requests.append((self.command, path, self.headers.get('Cookie')))
+        script = self.server.script.get(path, [])
+        status, body = script.pop(0) if script else (200, '[]')
+        self.send_response(status)
+        if path == LOGIN_PATH and status == 200 and body == 'Ok.':
+            self.send_header('Set-Cookie', 'SID=session; path=/')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+class TestQBittorrentSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeWebUI)
+        self.server.script = {}
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        address = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.session = QBittorrentSession(address, 'admin', 'secret', retries=2, backoff_factor=0)
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def paths(self):
+        return [(method, path) for method, path, _ in self.server.requests]
+
+    def test_idempotent_request_is_retried_on_overload(self):
+        self.server.script[INFO_PATH] = [(503, ''), (503, ''), (200, json.dumps([{'hash': 'a'}]))]
+        response = self.session.get(f"{self.session.api_address}{INFO_PATH}")
+        self.assertEqual(response.json(), [{'hash': 'a'}])
+        self.assertEqual(self.paths(), [('GET', INFO_PATH)] * 3)
+
+    def test_retries_are_bounded(self):
+        self.server.script[INFO_PATH] = [(503, '')] * 5
+        response = self.session.get(f"{self.session.api_address}{INFO_PATH}")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_post_is_not_sent_twice(self):
+        self.server.script[DELETE_PATH] = [(503, '')]
+        response = self.session.post(f"{self.session.api_address}{DELETE_PATH}", data={'hashes': 'a'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.paths(), [('POST', DELETE_PATH)])
+
+    def test_forbidden_request_logs_in_once_and_is_retried(self):
+        self.server.script[INFO_PATH] = [(403, 'Forbidden')]
+        self.server.script[LOGIN_PATH] = [(200, 'Ok.')]
+        response = self.session.get(f"{self.session.api_address}{INFO_PATH}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.paths(), [('GET', INFO_PATH), ('POST', LOGIN_PATH), ('GET', INFO_PATH)])
+        self.assertEqual(self.server.requests[-1][2], 'SID=session')
+
+        self.session.get(f"{self.session.api_address}{INFO_PATH}")  # The cookie is kept
+        self.assertEqual(self.paths()[-1], ('GET', INFO_PATH))
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_rejected_login_raises(self):
+        self.server.script[INFO_PATH] = [(403, 'Forbidden')]
+        self.server.script[LOGIN_PATH] = [(200, 'Fails.')]
+        with self.assertRaises(ConnectionError):
+            self.session.get(f"{self.session.api_address}{INFO_PATH}")
+
+    def test_saved_cookie_is_reused_by_the_next_session(self):
+        self.server.script[INFO_PATH] = [(403, 'Forbidden')]
+        self.server.script[LOGIN_PATH] = [(200, 'Ok.')]
+        self.session.get(f"{self.session.api_address}{INFO_PATH}")
+        with tempfile.TemporaryDirectory() as directory:
+            cookie_path = os.path.join(directory, 'session.cookie')
+            self.session.save_cookies(cookie_path)
+            if os.name == 'posix':
+                self.assertEqual(stat.S_IMODE(os.stat(cookie_path).st_mode), 0o600)
+
+            other = QBittorrentSession('http://127.0.0.1:1', 'admin', 'secret')
+            other.load_cookies(cookie_path)
+            self.assertEqual(len(other.cookies), 0)  # Saved for another WebUI
+
+            next_run = QBittorrentSession(self.session.api_address, 'admin', 'secret')
+            next_run.load_cookies(cookie_path)
+            next_run.get(f"{self.session.api_address}{INFO_PATH}")
+            next_run.close()
+        self.assertEqual(self.paths()[3:], [('GET', INFO_PATH)])  # No new login
+        self.assertEqual(self.server.requests[-1][2], 'SID=session')
+
+    def test_transport_options_from_config(self):
+        config = configparser.ConfigParser()
+        config.read_dict({'api': {'read_timeout': '30', 'retries': '1'}})
+        self.assertEqual(transport_options(config), {'timeout': (5, 30), 'retries': 1, 'backoff_factor': 0.5, 'pool_size': 4})
+
+if __name__ == '__main__':
+    unittest.main()
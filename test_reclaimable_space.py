@@ -0,0 +1,102 @@
+import os
+import logging
+import tempfile
+import unittest
+import configparser
+import torrent_utils
+from reclaimable_space import ReclaimEstimator, group_by_content
+from torrent_utils import plan_removals_by_space, BYTES_TO_GB
+from testing_utils import make_torrent, FakeSession
+
+FILE_SIZE = 1024 * 1024
+LOGGER = logging.getLogger('test_reclaim')
+
+def seeding_torrent(torrent_hash: str, content_path: str, average_ratio: float, **fields) -> dict:
+    return make_torrent(torrent_hash, **{'size': FILE_SIZE, 'ratio': average_ratio, 'popularity': average_ratio,
+                                         'content_path': content_path, **fields})
+
+class TestReclaimEstimator(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.estimator = ReclaimEstimator(None)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name: str) -> str:
+        path = os.path.join(self.directory.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(os.urandom(FILE_SIZE))
+        return path
+
+    def link(self, source: str, name: str) -> str:
+        path = os.path.join(self.directory.name, name)
+        os.link(source, path)
+        return path
+
+    def allocated(self, path: str) -> int:
+        return os.stat(path).st_blocks * 512
+
+    def test_hardlinked_file_is_freed_with_its_last_link(self):
+        first = self.write('a.mkv')
+        second = self.link(first, 'b.mkv')
+        self.assertEqual(self.estimator.standalone_bytes([first]), 0)
+        self.assertEqual(self.estimator.standalone_bytes([first, second]), self.allocated(first))
+
+        self.assertEqual(self.estimator.marginal_bytes([first]), 0)
+        self.estimator.mark_removed([first])
+        self.assertEqual(self.estimator.marginal_bytes([second]), self.allocated(first))
+
+    def test_marginal_bytes_does_not_mark_content_as_removed(self):
+        first = self.write('a.mkv')
+        second = self.link(first, 'b.mkv')
+        self.assertEqual(self.estimator.marginal_bytes([first]), 0)
+        self.assertEqual(self.estimator.marginal_bytes([second]), 0)  # The first link was never removed
+
+    def test_missing_content_is_unknown(self):
+        self.assertIsNone(self.estimator.marginal_bytes([os.path.join(self.directory.name, 'missing')]))
+
+    def test_skipped_cross_seed_does_not_credit_the_next_one(self):
+        first = self.write('a.mkv')
+        second = self.link(first, 'b.mkv')
+        torrents = [seeding_torrent('a', first, 0.1), seeding_torrent('b', second, 0.2)]
+        # Removing only one of the two links frees nothing, so neither is planned
+        self.assertEqual(self.plan(torrents, 10 * FILE_SIZE), [])
+
+    def test_torrent_without_root_folder_is_credited_its_own_files(self):
+        save_path = self.directory.name
+        own = [self.write('e1.mkv'), self.write(os.path.join('Extras', 'e2.mkv'))]
+        for index in range(5):
+            self.write(os.path.join('Other', f"{index}.mkv"))
+        torrent = seeding_torrent('a', save_path, 0.1, save_path=save_path, size=2 * FILE_SIZE)
+        session = FakeSession({'/torrents/files': lambda params: [{'name': 'e1.mkv'}, {'name': 'Extras/e2.mkv'}]})
+        torrent_utils.attach_content_files(session, '', [torrent], LOGGER)
+
+        removals = self.plan([torrent], FILE_SIZE)
+        self.assertEqual([removal.hash for removal in removals], ['a'])
+        self.assertEqual(removals[0].expected_bytes_freed, sum(self.allocated(path) for path in own))
+
+    def test_torrents_without_root_folder_are_not_grouped_by_save_path(self):
+        save_path = self.directory.name
+        torrents = [seeding_torrent(h, save_path, 0.1, save_path=save_path, content_files=[os.path.join(save_path, f"{h}.mkv")])
+                    for h in 'ab']
+        torrents.append(seeding_torrent('c', save_path, 0.1, save_path=save_path, content_files=torrents[0]['content_files']))
+        self.assertEqual(sorted(len(unit) for unit in group_by_content(torrents).values()), [1, 2])
+
+    def test_new_hardlink_is_noticed_before_the_cache_expires(self):
+        episode = self.write(os.path.join('Show', 'e1.mkv'))
+        content_path = os.path.dirname(episode)
+        self.assertEqual(self.estimator.standalone_bytes([content_path]), self.allocated(episode))
+        self.link(episode, 'library.mkv')  # Does not change the mtime of the content folder
+        self.assertEqual(self.estimator.standalone_bytes([content_path]), 0)
+
+    def plan(self, torrents: list, bytes_needed: int) -> list:
+        config = configparser.ConfigParser()
+        config.read_dict({'cleanup': {}})
+        return plan_removals_by_space(torrents, ['tv'], bytes_needed / BYTES_TO_GB, LOGGER,
+                                      '', {}, config, ratio_log={}, estimator=self.estimator)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import logging
+import unittest
+import configparser
+import removal_pacer
+from removal_pacer import RemovalPacer, BYTES_TO_GB
+from removal_plan import PlannedRemoval, RemovalPlan
+from torrent_filterer import qbittorrent_free_space_probe
+from testing_utils import make_torrent, FakeSession, FakeClock
+
+LOGGER = logging.getLogger('test_removal_pacer')
+
+def make_plan(space_needed_gb: float, removals: list) -> RemovalPlan:
+    """Plan with one removal per (hash, reason, GB freed)."""
+    plan = RemovalPlan(free_space_gb=0, space_needed_gb=space_needed_gb)
+    plan.add([PlannedRemoval.from_torrent(make_torrent(h), 0.0, reason, gb * BYTES_TO_GB) for h, reason, gb in removals])
+    return plan
+
+class TestRemovalPacer(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def pacer(self, free_space_probe=None, max_lag_seconds: float = 60) -> RemovalPacer:
+        return RemovalPacer(LOGGER, BYTES_TO_GB, 100, free_space_probe, max_lag_seconds,
+                            sleep=self.clock.sleep, clock=self.clock.monotonic)
+
+    def execute(self, pacer: RemovalPacer, plan: RemovalPlan, on_removed=None, max_batch: int = 10) -> list:
+        """(time, hashes) of each batch, executing every batch in full."""
+        executed = []
+        for batch in pacer.batches(plan, max_batch):
+            executed.append((self.clock.now, [removal.hash for removal in batch]))
+            pacer.record(batch)
+            if on_removed is not None:
+                on_removed(batch)
+        return executed
+
+    def test_batches_are_spaced_by_the_budget(self):
+        plan = make_plan(100, [('a', 'space', 10), ('b', 'space', 2), ('c', 'space', 2), ('d', 'space', 2)])
+        # 1 GB/s with 5 second batches: a fills a batch on its own, b and c fit together, d does not
+        self.assertEqual(self.execute(self.pacer(), plan), [(0, ['a']), (10, ['b', 'c']), (14, ['d'])])
+
+    def test_space_removals_go_first_and_stop_at_the_target(self):
+        freed = [0.0]
+
+        def record_freed(batch):
+            freed[0] += sum(removal.expected_bytes_freed for removal in batch) / BYTES_TO_GB
+        pacer = self.pacer(lambda: 50 + freed[0])
+        plan = make_plan(15, [('d', 'count', 1), ('a', 'space', 10), ('b', 'space', 10), ('c', 'space', 10)])
+        with self.assertLogs(LOGGER, logging.INFO) as logs:
+            executed = self.execute(pacer, plan, record_freed)
+        self.assertEqual([hashes for _, hashes in executed], [['a'], ['b'], ['d']])
+        self.assertIn("Free space target reached after freeing 20.00 GB, keeping 1 torrents planned for space", logs.output[0])
+
+    def test_waits_while_the_disk_lags_behind(self):
+        # More than 4 GB behind after e: waits until the disk catches up at t=6
+        pacer = self.pacer(lambda: 100 + (5 if self.clock.now >= 6 else 0), max_lag_seconds=4)
+        plan = make_plan(100, [(h, 'space', 1) for h in 'abcdefg'])
+        self.assertEqual([time for time, _ in self.execute(pacer, plan, max_batch=1)], [0, 1, 2, 3, 4, 6, 7])
+
+    def test_lagging_disk_is_waited_for_at_most_max_lag(self):
+        pacer = self.pacer(lambda: 100, max_lag_seconds=4)
+        plan = make_plan(100, [(h, 'space', 1) for h in 'abcdefg'])
+        self.assertEqual([time for time, _ in self.execute(pacer, plan, max_batch=1)], [0, 1, 2, 3, 4, 8, 12])
+
+    def test_from_config(self):
+        config = configparser.ConfigParser()
+        config.read_dict({'removal_pacing': {'enabled': 'false'}})
+        self.assertIsNone(removal_pacer.from_config(config, LOGGER))
+        config.read_dict({'removal_pacing': {'enabled': 'true', 'mb_per_second': '50', 'max_lag_seconds': '30'}})
+        pacer = removal_pacer.from_config(config, LOGGER)
+        self.assertEqual((pacer.bytes_per_second, pacer.torrents_per_second, pacer.max_lag_seconds), (50 * 1024**2, 2, 30))
+        config.read_dict({'removal_pacing': {'torrents_per_second': '0'}})
+        with self.assertRaises(ValueError):
+            removal_pacer.from_config(config, LOGGER)
+
+class TestFreeSpaceProbe(unittest.TestCase):
+
+    def test_probe_only_asks_for_changes(self):
+        responses = {5: {'rid': 6}, 6: {'rid': 7, 'server_state': {'free_space_on_disk': 20 * BYTES_TO_GB}}}
+        session = FakeSession({'/sync/maindata': lambda params: responses[params['rid']]})
+        probe = qbittorrent_free_space_probe(session, '', LOGGER, {'rid': 5, 'server_state': {'free_space_on_disk': 10 * BYTES_TO_GB}})
+        self.assertEqual(probe(), 10)  # Nothing changed: the last known value
+        self.assertEqual(probe(), 20)
+        self.assertEqual(session.endpoint_calls('/sync/maindata'), [{'rid': 5}, {'rid': 6}])
+
+if __name__ == '__main__':
+    unittest.main()
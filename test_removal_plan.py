@@ -0,0 +1,73 @@
+import os
+import json
+import logging
+import tempfile
+import unittest
+import configparser
+import torrent_utils
+from torrent_filterer import apply_removal_plan, executed_plan_path
+from removal_plan import PlannedRemoval, RemovalPlan
+from testing_utils import make_torrent, FakeSession
+
+LOGGER = logging.getLogger('test_removal_plan')
+
+def make_plan() -> RemovalPlan:
+    plan = RemovalPlan(free_space_gb=5, space_needed_gb=2)
+    plan.add([PlannedRemoval.from_torrent(make_torrent(h, content_path=f"/dl/{h}"), 0.5, 'space') for h in 'abc'])
+    return plan
+
+class TestRemovalPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.plan_path = os.path.join(self.directory.name, 'removal_plan.json')
+        self.config = configparser.ConfigParser()
+        self.config.read_dict({'login': {'address': ''}})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_add_skips_planned_torrents(self):
+        plan = make_plan()
+        plan.add([PlannedRemoval.from_torrent(make_torrent(h), 0.1, 'count') for h in 'cd'])
+        self.assertEqual([(r.hash, r.reason) for r in plan.removals], [('a', 'space'), ('b', 'space'), ('c', 'space'), ('d', 'count')])
+        self.assertEqual(plan.expected_gb_freed('space'), 3)
+        self.assertEqual([len(batch) for batch in plan.batches(3)], [3, 1])
+
+    def test_save_and_load(self):
+        plan = make_plan()
+        plan.save(self.plan_path)
+        self.assertEqual(RemovalPlan.load(self.plan_path), plan)
+
+        with open(self.plan_path, 'w') as file:
+            json.dump({**plan.to_dict(), 'version': 99}, file)
+        with self.assertRaises(ValueError):
+            RemovalPlan.load(self.plan_path)
+
+    def test_executed_plans_do_not_replace_the_reviewed_one(self):
+        self.assertEqual(executed_plan_path(self.plan_path), os.path.join(self.directory.name, 'removal_plan.executed.json'))
+
+    def test_apply_in_test_mode_only_shows_the_plan(self):
+        make_plan().save(self.plan_path)
+        session = FakeSession()
+        with self.assertLogs(LOGGER, logging.INFO) as logs:
+            apply_removal_plan(session, LOGGER, self.config, self.plan_path, True)
+        self.assertEqual(session.calls, [])
+        self.assertIn('TEST MODE', logs.output[0])
+
+    def test_apply_removes_torrents_that_are_still_as_planned(self):
+        make_plan().save(self.plan_path)
+        current = [make_torrent('a', content_path='/dl/a'), make_torrent('b', content_path='/dl/moved')]  # c is gone
+        session = FakeSession({'/torrents/info': lambda params: [t for t in current if t['hash'] in params['hashes'].split('|')]})
+        apply_removal_plan(session, LOGGER, self.config, self.plan_path, False)
+        self.assertEqual(session.endpoint_calls('/torrents/delete'), [{'hashes': 'a', 'deleteFiles': 'true'}])
+
+    def test_execute_returns_the_executed_removals(self):
+        session = FakeSession({'/torrents/info': lambda params: [make_torrent(h, content_path=f"/dl/{h}")
+                                                                 for h in params['hashes'].split('|')]})
+        executed = torrent_utils.execute_removal_plan(session, '', make_plan(), LOGGER, batch_size=2)
+        self.assertEqual([r.hash for r in executed], ['a', 'b', 'c'])
+        self.assertEqual([call['hashes'] for call in session.endpoint_calls('/torrents/delete')], ['a|b', 'c'])
+
+if __name__ == '__main__':
+    unittest.main()
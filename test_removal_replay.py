@@ -0,0 +1,55 @@
+import os
+import json
+import logging
+import tempfile
+import unittest
+import configparser
+from removal_replay import replay_step, new_variant_state, replay_variants, run_replay
+from testing_utils import make_torrent
+
+GB = 1024**3
+LOGGER = logging.getLogger('test_replay')
+BASE_CONFIG = {
+    'cleanup': {'min_space_gb': '10', 'categories_to_check_for_space': 'tv', 'categories_to_check_for_number': '',
+                'max_torrents_for_categories': '100'},
+    'seed_rules': {'tv': 'seeding_time:3600'},
+}
+
+def make_snapshot(timestamp: int, free_space_gb: float, uploaded: int = 0) -> dict:
+    torrents = [make_torrent(f"{index:040x}", size=4 * GB, seeding_time=86400 * index, ratio=0.1 * index,
+                             uploaded=uploaded * index) for index in range(1, 6)]
+    return {'timestamp': timestamp, 'free_space': int(free_space_gb * GB), 'torrents': torrents}
+
+class TestRemovalReplay(unittest.TestCase):
+
+    def test_variants_do_not_share_torrent_state(self):
+        snapshot = make_snapshot(1700000000, 2)
+        for name in ('first', 'second'):
+            replay_step(new_variant_state({'name': name}, BASE_CONFIG, LOGGER), snapshot, {}, None, LOGGER)
+        self.assertFalse(any('average_ratio' in torrent for torrent in snapshot['torrents']))
+
+    def test_replay_reports_each_variant(self):
+        variants = [{'name': 'default'}, {'name': 'keep_all', 'seed_rules': {'tv': 'seeding_time:99999999'}}]
+        with tempfile.TemporaryDirectory() as directory:
+            snapshots_path = os.path.join(directory, 'snapshots.jsonl')
+            with open(snapshots_path, 'w') as file:
+                for step in range(3):
+                    file.write(json.dumps(make_snapshot(1700000000 + step * 3600, 2, uploaded=step * GB)) + '\n')
+            results = {result['name']: result for result in replay_variants(variants, BASE_CONFIG, snapshots_path, '', 0, None)}
+
+        self.assertEqual(results['default']['steps'], 3)
+        self.assertEqual(results['default']['deletions'], 2)  # 8 GB frees the 8 GB missing on the first step
+        self.assertEqual(results['default']['bytes_deleted'], 8 * GB)
+        self.assertGreater(results['default']['upload_forgone_bytes'], 0)
+        self.assertEqual(results['keep_all']['deletions'], 0)
+        self.assertEqual(results['keep_all']['upload_forgone_bytes'], 0)
+        self.assertEqual(results['keep_all']['upload_retained_bytes'], 2 * 15 * GB)
+
+    def test_duplicate_variant_names_are_rejected(self):
+        config = configparser.ConfigParser()
+        config.read_dict(BASE_CONFIG)
+        with self.assertRaises(ValueError):
+            run_replay([{'name': 'a'}, {'name': 'a'}], config, 'unused.jsonl', '', 0, None, 1)
+
+if __name__ == '__main__':
+    unittest.main()
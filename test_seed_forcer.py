@@ -0,0 +1,54 @@
+import logging
+import unittest
+import configparser
+import torrent_utils
+from qbittorrent_seed_forcer import compile_keyword_matcher, plan_force_start_changes, force_seed
+from testing_utils import make_torrent, FakeSession
+
+LOGGER = logging.getLogger('test_seed_forcer')
+
+class TestSeedForcer(unittest.TestCase):
+
+    def test_only_torrents_whose_force_start_changes_are_planned(self):
+        torrents = [make_torrent('1', name='show.trackera.mkv', category='TV'),
+                    make_torrent('2', name='show.trackera.mkv', force_start=True),
+                    make_torrent('3', name='other.mkv', force_start=True),
+                    make_torrent('4', name='other.mkv'),
+                    make_torrent('5', name='movie.trackera.mkv', category='movies')]
+        to_force, to_unforce = plan_force_start_changes(torrents, ['tv'], compile_keyword_matcher(['trackera']), True, LOGGER)
+        self.assertEqual([t['hash'] for t in to_force], ['1'])
+        self.assertEqual([t['hash'] for t in to_unforce], ['3'])
+
+        _, to_unforce = plan_force_start_changes(torrents, ['tv'], compile_keyword_matcher(['trackera']), False, LOGGER)
+        self.assertEqual(to_unforce, [])
+
+    def test_longest_keyword_wins(self):
+        matcher = compile_keyword_matcher(['tracker', 'trackerb'])
+        self.assertEqual(matcher.search('x.trackerb.y').group(), 'trackerb')
+        self.assertIsNone(compile_keyword_matcher([]))
+
+    def test_changes_are_sent_in_bounded_chunks(self):
+        session = FakeSession()
+        torrents = [make_torrent(f"{index:040x}") for index in range(450)]
+        torrent_utils.force_torrents(session, '', torrents, LOGGER, False, True, chunk_size=200)
+        chunks = session.endpoint_calls('/torrents/setForceStart')
+        self.assertEqual([len(chunk['hashes'].split('|')) for chunk in chunks], [200, 200, 50])
+        self.assertTrue(all(chunk['value'] == 'true' for chunk in chunks))
+
+        torrent_utils.force_torrents(session, '', torrents, LOGGER, True, True)
+        self.assertEqual(len(session.endpoint_calls('/torrents/setForceStart')), 3)  # Test mode sends nothing
+
+    def test_force_seed_sets_and_clears(self):
+        torrents = [make_torrent('1', name='a.trackera'), make_torrent('2', name='b', force_start=True),
+                    make_torrent('3', name='c.trackera', force_start=True)]
+        session = FakeSession({'/torrents/info': lambda params: torrents})
+        config = configparser.ConfigParser()
+        config.read_dict({'login': {'address': ''},
+                          'cleanup': {'categories_to_force_seed': 'tv', 'trackers_to_force_seed': 'trackera',
+                                      'unforce_unmatched_seeds': 'true'}})
+        force_seed(session, LOGGER, config, False)
+        self.assertEqual(session.endpoint_calls('/torrents/setForceStart'),
+                         [{'hashes': '1', 'value': 'true'}, {'hashes': '2', 'value': 'false'}])
+
+if __name__ == '__main__':
+    unittest.main()
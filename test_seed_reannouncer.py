@@ -0,0 +1,100 @@
+import os
+import logging
+import tempfile
+import unittest
+import configparser
+from unittest import mock
+import qbittorrent_seed_reannouncer
+from qbittorrent_seed_reannouncer import needs_reannounce, schedule_reannounces, get_tracker_host, RUN_LOCK_FILE_NAME
+from file_lock import try_locked
+from testing_utils import make_torrent, FakeSession, FakeClock
+
+LOGGER = logging.getLogger('test_reannouncer')
+TRACKER_WORKING, TRACKER_UPDATING, TRACKER_NOT_WORKING = 2, 3, 4
+
+class TestNeedsReannounce(unittest.TestCase):
+
+    def test_healthy_torrent_is_skipped(self):
+        self.assertFalse(needs_reannounce(make_torrent(tracker='http://t/announce', state='uploading', num_seeds=3), None, 1000, 1800))
+
+    def test_stale_torrents_need_one(self):
+        self.assertTrue(needs_reannounce(make_torrent(tracker=''), None, 1000, 1800))
+        self.assertTrue(needs_reannounce(make_torrent(tracker='http://t/announce', state='error', num_seeds=3), None, 1000, 1800))
+        self.assertTrue(needs_reannounce(make_torrent(tracker='http://t/announce'), None, 1000, 1800))
+
+    def test_recent_reannounce_is_not_repeated(self):
+        self.assertFalse(needs_reannounce(make_torrent(tracker=''), 1000 - 60, 1000, 1800))
+        self.assertTrue(needs_reannounce(make_torrent(tracker=''), 1000 - 1800, 1000, 1800))
+
+    def test_tracker_host_falls_back_to_the_magnet_link(self):
+        self.assertEqual(get_tracker_host(make_torrent(tracker='https://a.example:443/announce')), 'a.example')
+        self.assertEqual(get_tracker_host(make_torrent(magnet_uri='magnet:?xt=urn:btih:x&tr=http%3A%2F%2Fb.example%2Fannounce')),
+                         'b.example')
+
+class TestScheduleReannounces(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.status = lambda now: TRACKER_WORKING  # Announce status the tracker reports at a time
+        self.sent = []
+        self.session = FakeSession({'/torrents/reannounce': self.reannounce, '/torrents/trackers': self.trackers})
+        patcher = mock.patch.object(qbittorrent_seed_reannouncer, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reannounce(self, data: dict) -> None:
+        self.sent.append((self.clock.now, data['hashes'].split('|')))
+
+    def trackers(self, params: dict) -> list:
+        return [{'url': 'http://a.example/announce', 'status': self.status(self.clock.now)}]
+
+    def schedule(self, count: int) -> dict:
+        torrents = [make_torrent(str(index)) for index in range(count)]
+        reannounced = {}
+        schedule_reannounces(self.session, '', {'a.example': torrents}, 2, 2, 600, LOGGER, False, reannounced)
+        return reannounced
+
+    def test_batches_are_spread_over_the_window(self):
+        reannounced = self.schedule(5)
+        self.assertEqual([(due, len(hashes)) for due, hashes in self.sent], [(0, 2), (200, 2), (400, 1)])
+        self.assertEqual(len(reannounced), 5)
+
+    def test_backs_off_until_the_tracker_recovers(self):
+        self.status = lambda now: TRACKER_NOT_WORKING if now < 500 else TRACKER_WORKING
+        self.schedule(5)
+        self.assertEqual([due for due, _ in self.sent], [0, 1000, 1200])  # Checked at 200, 400 and 1000
+
+    def test_updating_announces_are_not_counted(self):
+        self.status = lambda now: TRACKER_UPDATING if now < 300 else TRACKER_NOT_WORKING
+        self.schedule(5)
+        self.assertEqual([due for due, _ in self.sent], [0, 200])  # The third batch waits for the failing second one
+
+    def test_gives_up_on_a_tracker_that_keeps_failing(self):
+        self.status = lambda now: TRACKER_NOT_WORKING
+        reannounced = self.schedule(5)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(len(reannounced), 2)
+
+    def test_test_mode_sends_nothing(self):
+        reannounced = {}
+        schedule_reannounces(self.session, '', {'a.example': [make_torrent(str(i)) for i in range(3)]}, 2, 2, 600,
+                             LOGGER, True, reannounced)
+        self.assertEqual(self.session.calls, [])
+        self.assertEqual(self.clock.now, 0)
+
+class TestRunLock(unittest.TestCase):
+
+    def test_overlapping_run_is_skipped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = configparser.ConfigParser()
+            config.read_dict({'logging': {'location': directory}})
+            handler = mock.Mock()
+            with mock.patch.object(qbittorrent_seed_reannouncer, 'check_space_and_remove_torrents') as run:
+                with try_locked(os.path.join(directory, RUN_LOCK_FILE_NAME)):
+                    qbittorrent_seed_reannouncer.main(False, LOGGER, handler, config, None)
+                run.assert_not_called()
+                qbittorrent_seed_reannouncer.main(False, LOGGER, handler, config, None)
+                run.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
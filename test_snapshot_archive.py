@@ -0,0 +1,86 @@
+import os
+import lzma
+import time
+import logging
+import tempfile
+import unittest
+import configparser
+from torrent_snapshot_archive import SnapshotArchive, record_snapshot, DATA_SUFFIX, TAIL_SUFFIX
+from testing_utils import make_torrent
+
+def archived_torrent(index: int, uploaded: int, popularity: float) -> dict:
+    return make_torrent(f"{index:040x}", name=f"Torrent{index}", size=1024 * index, uploaded=uploaded,
+                        popularity=popularity, ratio=uploaded / (1024 * index), tracker=None)
+
+def snapshots(count: int) -> list:
+    """Snapshots where torrents drift, get added and get removed over time."""
+    result = []
+    for step in range(count):
+        torrents = [archived_torrent(index, index * 1000 + step * 37 * index, round(0.5 + step * 0.013 * index, 6))
+                    for index in range(1, 40) if not (index % 7 == 0 and step >= 3)]
+        if step >= 2:
+            torrents.append(archived_torrent(100 + step, step, 0.1))
+        result.append((1700000000 + step * 3600, torrents))
+    return result
+
+def expected(torrents: list) -> dict:
+    """Torrents as the archive returns them: floats rounded to 6 decimals and None values dropped."""
+    return {t['hash']: {field: round(value, 6) if isinstance(value, float) else value
+                        for field, value in t.items() if value is not None} for t in torrents}
+
+class TestSnapshotArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive_dir = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        for codec in ('lzma', 'zlib'):
+            archive = SnapshotArchive(os.path.join(self.archive_dir, codec), codec, segment_days=1)
+            recorded = snapshots(30)  # Spans two segments
+            for timestamp, torrents in recorded:
+                archive.append(torrents, timestamp, free_space=timestamp)
+            self.assertGreater(len(archive.segments()), 1)
+
+            read = list(archive.iter_snapshots())
+            self.assertEqual([s['timestamp'] for s in read], [timestamp for timestamp, _ in recorded])
+            for snapshot, (timestamp, torrents) in zip(read, recorded):
+                self.assertEqual(snapshot['free_space'], timestamp)
+                self.assertEqual({t['hash']: t for t in snapshot['torrents']}, expected(torrents))
+
+            point = archive.read_snapshot(recorded[12][0] + 10)
+            self.assertEqual({t['hash']: t for t in point['torrents']}, expected(recorded[12][1]))
+
+            torrent_hash = archived_torrent(7, 0, 0.0)['hash']  # Removed after the third snapshot
+            history = archive.torrent_history(torrent_hash)
+            self.assertEqual([timestamp for timestamp, _ in history], [timestamp for timestamp, _ in recorded[:3]])
+            for (_, torrent), (_, torrents) in zip(history, recorded):
+                self.assertEqual(torrent, expected(torrents)[torrent_hash])
+
+    def test_rejects_older_snapshot(self):
+        archive = SnapshotArchive(self.archive_dir)
+        archive.append([archived_torrent(1, 0, 0.0)], 1700000000)
+        with self.assertRaises(ValueError):
+            archive.append([archived_torrent(1, 0, 0.0)], 1700000000)
+
+    def test_corrupt_segment_does_not_raise_from_record_snapshot(self):
+        archive = SnapshotArchive(self.archive_dir, segment_days=36500)  # The next append lands in the same segment
+        for step, (_, torrents) in enumerate(snapshots(2)):
+            archive.append(torrents, int(time.time()) - 100 + step)
+        segment = archive.segments()[0]
+        with open(os.path.join(self.archive_dir, segment + DATA_SUFFIX), 'r+b') as file:
+            file.write(b'\xff' * 64)
+        os.remove(os.path.join(self.archive_dir, segment + TAIL_SUFFIX))
+        with self.assertRaises(lzma.LZMAError):
+            list(archive.iter_snapshots())
+
+        config = configparser.ConfigParser()
+        config.read_dict({'snapshot_archive': {'enabled': 'true', 'location': self.archive_dir, 'segment_days': '36500'}})
+        with self.assertLogs('test_archive', logging.ERROR):
+            record_snapshot(config, snapshots(3)[2][1], None, logging.getLogger('test_archive'))
+
+if __name__ == '__main__':
+    unittest.main()
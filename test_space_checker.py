@@ -0,0 +1,64 @@
+import os
+import logging
+import tempfile
+import unittest
+import configparser
+from unittest import mock
+import qbittorrent_space_checker
+from qbittorrent_space_checker import load_usage_state, update_usage, log_usage_summary, BYTES_TO_GB
+from testing_utils import make_torrent, FakeSession
+
+LOGGER = logging.getLogger('test_space_checker')
+
+class TestUsageAccounting(unittest.TestCase):
+
+    def setUp(self):
+        self.usage = load_usage_state('missing.json')
+        self.torrents = [make_torrent('1', category='TV', size=2 * BYTES_TO_GB),
+                         make_torrent('2', category='movies', size=BYTES_TO_GB, state='downloading', eta=600),
+                         make_torrent('3', category='seeds', size=BYTES_TO_GB)]
+
+    def test_only_changed_torrents_are_applied(self):
+        self.assertEqual(len(update_usage(self.usage, self.torrents)), 3)
+        self.assertEqual(update_usage(self.usage, self.torrents), [])
+        self.torrents[1] = make_torrent('2', category='movies', size=BYTES_TO_GB, state='downloading', eta=300)
+        self.assertEqual(update_usage(self.usage, self.torrents), [])  # Still not completed
+
+        self.assertEqual(self.usage['categories']['tv'], {'total': 2 * BYTES_TO_GB, 'completed': 2 * BYTES_TO_GB, 'count': 1})
+        self.assertEqual(self.usage['categories']['movies'], {'total': BYTES_TO_GB, 'completed': 0, 'count': 1})
+        self.assertEqual(self.usage['states']['stalledUP'], {'total': 3 * BYTES_TO_GB, 'count': 2})
+
+    def test_changes_move_totals(self):
+        update_usage(self.usage, self.torrents)
+        self.torrents[1] = make_torrent('2', category='tv', size=BYTES_TO_GB, state='stalledUP', eta=0)
+        changed = update_usage(self.usage, self.torrents[1:])  # Torrent 1 was removed
+        self.assertEqual([t['hash'] for t in changed], ['2'])
+        self.assertNotIn('movies', self.usage['categories'])
+        self.assertEqual(self.usage['categories']['tv'], {'total': BYTES_TO_GB, 'completed': BYTES_TO_GB, 'count': 1})
+        self.assertNotIn('downloading', self.usage['states'])
+
+    def test_summary_reports_growth_since_the_last_run(self):
+        update_usage(self.usage, self.torrents)
+        log_usage_summary(self.usage, ['seeds', 'tv'], LOGGER)
+        self.torrents.append(make_torrent('4', category='tv', size=BYTES_TO_GB))
+        update_usage(self.usage, self.torrents)
+        with self.assertLogs(LOGGER, logging.INFO) as logs:
+            log_usage_summary(self.usage, ['seeds', 'tv'], LOGGER)
+        self.assertIn("Category 'tv': 3.00 GB, completed: 3.00 GB, torrents: 2, growth: +1.00 GB", logs.output[2])
+        self.assertIn("Total size of torrents: 5.00 GB, growth: +1.00 GB", logs.output[-2])
+        self.assertIn("Total size of completed seeds: 4.00 GB", logs.output[-1])
+
+    def test_details_list_every_torrent(self):
+        session = FakeSession({'/torrents/info': lambda params: self.torrents})
+        with tempfile.TemporaryDirectory() as directory:
+            config = configparser.ConfigParser()
+            config.read_dict({'login': {'address': ''}, 'logging': {'location': directory}})
+            qbittorrent_space_checker.main(LOGGER, mock.Mock(), config, session)  # Saves the state
+            with self.assertLogs(LOGGER, logging.INFO) as logs:
+                qbittorrent_space_checker.main(LOGGER, mock.Mock(), config, session, details=True)
+            self.assertTrue(os.path.exists(os.path.join(directory, qbittorrent_space_checker.STATE_FILE_NAME)))
+        self.assertIn("0 of 3 torrents changed since the last run", logs.output[0])
+        self.assertEqual(sum('Torrent ' in line and 'size:' in line for line in logs.output), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import random
+import unittest
+from itertools import combinations
+from space_selection import approximate_cover, select_cover
+
+def brute_force_cost(sizes: list, costs: list, need: float) -> float:
+    best = float('inf')
+    for count in range(len(sizes) + 1):
+        for selection in combinations(range(len(sizes)), count):
+            if sum(sizes[i] for i in selection) >= need:
+                best = min(best, sum(costs[i] for i in selection))
+    return best
+
+def random_instance(rng: random.Random, count: int) -> tuple:
+    sizes = [rng.choice([rng.uniform(0.1, 5), rng.uniform(10, 100)]) for _ in range(count)]
+    costs = [size * rng.uniform(0.001, 3) for size in sizes]
+    need = rng.uniform(0.05, 0.9) * sum(sizes)
+    return sizes, costs, need
+
+class TestSpaceSelection(unittest.TestCase):
+
+    def test_select_cover_matches_brute_force(self):
+        rng = random.Random(1)
+        for _ in range(300):
+            sizes, costs, need = random_instance(rng, rng.randint(1, 10))
+            selected, proven = select_cover(sizes, costs, need, time_budget=5)
+            self.assertTrue(proven)
+            self.assertGreaterEqual(sum(sizes[i] for i in selected), need)
+            self.assertAlmostEqual(sum(costs[i] for i in selected), brute_force_cost(sizes, costs, need))
+
+    def test_approximation_is_within_twice_the_optimum(self):
+        rng = random.Random(2)
+        for _ in range(300):
+            sizes, costs, need = random_instance(rng, rng.randint(1, 10))
+            selected = approximate_cover(sizes, costs, need)
+            self.assertGreaterEqual(sum(sizes[i] for i in selected), need)
+            self.assertLessEqual(sum(costs[i] for i in selected), 2 * brute_force_cost(sizes, costs, need) + 1e-9)
+
+    def test_keeps_cheaper_incumbent(self):
+        sizes, costs = [10, 6, 6], [10, 1, 1]
+        self.assertEqual(sorted(select_cover(sizes, costs, 10, time_budget=0, incumbent=[1, 2])[0]), [1, 2])
+
+    def test_degenerate_inputs(self):
+        self.assertEqual(select_cover([], [], 10, time_budget=1), ([], True))
+        self.assertEqual(select_cover([5], [1], 0, time_budget=1), ([], True))
+        self.assertEqual(select_cover([1, 2], [1, 1], 10, time_budget=1), ([0, 1], True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import time
+import logging
+import tempfile
+import threading
+import unittest
+import configparser
+from unittest import mock
+import torrent_list_cache
+from torrent_list_cache import TorrentListCache
+from torrent_utils import get_torrent_list
+from testing_utils import make_torrent, FakeSession
+
+LOGGER = logging.getLogger('test_torrent_list_cache')
+ADDRESS = 'http://localhost:8080'
+
+class TestTorrentListCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = TorrentListCache(os.path.join(self.directory.name, torrent_list_cache.CACHE_FILE_NAME), ttl_seconds=60)
+        self.torrents = [make_torrent('a'), make_torrent('b')]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def session(self, delay: float = 0) -> FakeSession:
+        def torrent_list(params):
+            time.sleep(delay)
+            return self.torrents
+        session = FakeSession({'/torrents/info': torrent_list})
+        session.torrent_cache = self.cache
+        return session
+
+    def test_list_is_reused_until_the_ttl_expires(self):
+        session = self.session()
+        self.assertEqual(get_torrent_list(session, ADDRESS, LOGGER), self.torrents)
+        self.assertEqual(get_torrent_list(session, ADDRESS, LOGGER), self.torrents)
+        self.assertEqual(len(session.endpoint_calls('/torrents/info')), 1)
+
+        with mock.patch.object(torrent_list_cache.time, 'time', return_value=time.time() + 61):
+            self.assertIsNone(self.cache.load(ADDRESS))
+            get_torrent_list(session, ADDRESS, LOGGER)
+        self.assertEqual(len(session.endpoint_calls('/torrents/info')), 2)
+
+    def test_list_of_another_webui_is_not_used(self):
+        self.cache.store(ADDRESS, self.torrents)
+        self.assertEqual(self.cache.load(ADDRESS), self.torrents)
+        self.assertIsNone(self.cache.load('http://other:8080'))
+
+    def test_fresh_list_bypasses_and_refreshes_the_cache(self):
+        self.cache.store(ADDRESS, [])
+        session = self.session()
+        self.assertEqual(get_torrent_list(session, ADDRESS, LOGGER, fresh=True), self.torrents)
+        self.assertEqual(self.cache.load(ADDRESS), self.torrents)
+
+    def test_scripts_started_together_fetch_once(self):
+        sessions = [self.session(delay=0.2) for _ in range(4)]
+        results = [None] * len(sessions)
+
+        def run(index):
+            results[index] = get_torrent_list(sessions[index], ADDRESS, LOGGER)
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(len(sessions))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [self.torrents] * len(sessions))
+        self.assertEqual(sum(len(session.endpoint_calls('/torrents/info')) for session in sessions), 1)
+
+    def test_from_config(self):
+        config = configparser.ConfigParser()
+        config.read_dict({'logging': {'location': self.directory.name}})
+        self.assertIsNone(torrent_list_cache.from_config(config))
+        config.read_dict({'torrent_cache': {'enabled': 'true', 'ttl_seconds': '30'}})
+        cache = torrent_list_cache.from_config(config)
+        self.assertEqual((cache.cache_path, cache.ttl_seconds),
+                         (os.path.join(self.directory.name, torrent_list_cache.CACHE_FILE_NAME), 30))
+
+if __name__ == '__main__':
+    unittest.main()
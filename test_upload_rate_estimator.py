@@ -0,0 +1,88 @@
+import os
+import time
+import logging
+import tempfile
+import unittest
+from upload_rate_estimator import UploadRateEstimator, HEADER, SECONDS_PER_HOUR
+from torrent_utils import select_upload_rates
+from testing_utils import make_torrent
+
+HASH_A = 'a' * 40
+HASH_B = 'b' * 40
+
+def full_update(rid: int, uploaded_a: int, uploaded_b: int) -> dict:
+    return {'rid': rid, 'full_update': True, 'torrents': {HASH_A: {'uploaded': uploaded_a, 'upspeed': 0},
+                                                          HASH_B: {'uploaded': uploaded_b, 'upspeed': 0}}}
+
+class TestUploadRateEstimator(unittest.TestCase):
+
+    def setUp(self):
+        self.estimator = UploadRateEstimator(capacity=64, half_life_hours=1)
+
+    def test_rate_needs_two_polls(self):
+        self.estimator.update_from_maindata(full_update(1, 0, 0), now=0)
+        self.assertIsNone(self.estimator.rate(HASH_A, now=0))
+        self.estimator.update_from_maindata({'rid': 2, 'torrents': {}}, now=60)
+        self.assertEqual(self.estimator.rate(HASH_A, now=60), 0)
+        self.assertEqual(self.estimator.rid, 2)
+
+    def test_changed_counters_raise_the_rate_and_idle_torrents_decay(self):
+        self.estimator.update_from_maindata(full_update(1, 0, 0), now=0)
+        for poll in range(1, 13):  # An hour of 5 minute polls, only A uploads 1 MB per poll
+            self.estimator.update_from_maindata({'rid': poll + 1, 'torrents': {HASH_A: {'uploaded': poll * 1024**2}}},
+                                                now=poll * 300)
+        rate_a = self.estimator.rate(HASH_A, now=3600)
+        self.assertGreater(rate_a, 0.4 * 12 * 1024**2)
+        self.assertEqual(self.estimator.rate(HASH_B, now=3600), 0)
+
+        self.estimator.update_from_maindata({'rid': 20, 'torrents': {}}, now=2 * SECONDS_PER_HOUR)
+        self.assertAlmostEqual(self.estimator.rate(HASH_A, now=2 * SECONDS_PER_HOUR), rate_a / 2)
+
+    def test_stale_estimates_fall_back(self):
+        self.estimator.update_from_maindata(full_update(1, 0, 0), now=0)
+        self.estimator.update_from_maindata({'rid': 2, 'torrents': {HASH_A: {'uploaded': 1024}}}, now=300)
+        self.assertIsNotNone(self.estimator.rate(HASH_A, now=600))
+        self.assertIsNone(self.estimator.rate(HASH_A, now=300 + 4 * SECONDS_PER_HOUR))
+
+    def test_removed_torrents_are_dropped(self):
+        self.estimator.update_from_maindata(full_update(1, 0, 0), now=0)
+        self.estimator.update_from_maindata({'rid': 2, 'torrents_removed': [HASH_B]}, now=300)
+        self.assertEqual(self.estimator.count, 1)
+        self.assertIsNone(self.estimator.rate(HASH_B, now=300))
+        self.estimator.update_from_maindata({'rid': 3, 'full_update': True, 'torrents': {}}, now=600)
+        self.assertEqual(self.estimator.count, 0)
+
+    def test_save_and_load(self):
+        self.estimator.update_from_maindata(full_update(1, 0, 0), now=0)
+        self.estimator.update_from_maindata({'rid': 2, 'torrents': {HASH_A: {'uploaded': 1024**2}}}, now=300)
+        with tempfile.TemporaryDirectory() as directory:
+            state_path = os.path.join(directory, 'upload_rates.bin')
+            self.estimator.save(state_path)
+            self.assertEqual(os.path.getsize(state_path), HEADER.size + 64 * 34)  # 34 bytes per slot
+            loaded = UploadRateEstimator.load(state_path, capacity=64, half_life_hours=1)
+            self.assertEqual(loaded.rid, 2)
+            self.assertEqual(loaded.rate(HASH_A, now=300), self.estimator.rate(HASH_A, now=300))
+            self.assertEqual(UploadRateEstimator.load(state_path, capacity=128).count, 0)
+
+class TestSelectUploadRates(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('test_select_upload_rates')
+        self.estimator = UploadRateEstimator(capacity=64, half_life_hours=1)
+        now = time.time()
+        self.estimator.update_from_maindata(full_update(1, 0, 0), now=now - 600)
+        self.estimator.update_from_maindata({'rid': 2, 'torrents': {HASH_A: {'uploaded': 10**9}}}, now=now)
+
+    def test_rates_are_used_when_every_torrent_has_one(self):
+        torrents = [make_torrent(HASH_A), make_torrent(HASH_B)]
+        self.assertIs(select_upload_rates(self.estimator, torrents, self.logger), self.estimator)
+        self.assertIsNone(select_upload_rates(None, torrents, self.logger))
+
+    def test_one_unrated_torrent_scores_all_from_the_ratio_log(self):
+        torrents = [make_torrent(HASH_A), make_torrent('c' * 40)]
+        with self.assertLogs(self.logger, logging.INFO) as logs:
+            self.assertIsNone(select_upload_rates(self.estimator, torrents, self.logger))
+        self.assertIn("1 of 2 eligible torrents have no upload rate yet", logs.output[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Constants
+API_V2_BASE = "/api/v2"
+
+def make_torrent(torrent_hash: str = 'a' * 40, **fields: Any) -> Dict[str, Any]:
+    """A /torrents/info entry of a completed, seeding torrent, with the given fields overridden."""
+    torrent = {'hash': torrent_hash, 'name': torrent_hash, 'category': 'tv', 'size': 1024**3, 'state': 'stalledUP',
+               'progress': 1.0, 'eta': 0, 'seeding_time': 0, 'time_active': 0, 'ratio': 0.0, 'popularity': 0.0,
+               'uploaded': 0, 'upspeed': 0, 'tracker': '', 'num_seeds': 0, 'num_leechs': 0, 'force_start': False,
+               'save_path': '', 'content_path': ''}
+    torrent.update(fields)
+    return torrent
+
+class FakeResponse:
+    def __init__(self, payload: Any):
+        self.payload = payload
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def json(self) -> Any:
+        return self.payload
+
+class FakeSession:
+    """Stands in for the WebUI session: answers each API endpoint from a handler and records the calls.
+
+    handlers maps an endpoint such as '/torrents/info' to a function of the
+    request's params or form data returning the decoded JSON response.
+    """
+
+    def __init__(self, handlers: Optional[Dict[str, Callable[[Dict[str, Any]], Any]]] = None):
+        self.handlers = handlers or {}
+        self.calls: List[Tuple[str, str, Dict[str, Any]]] = []
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> FakeResponse:
+        return self._call('GET', url, params or {})
+
+    def post(self, url: str, data: Optional[Dict[str, Any]] = None, **kwargs: Any) -> FakeResponse:
+        return self._call('POST', url, data or {})
+
+    def _call(self, method: str, url: str, arguments: Dict[str, Any]) -> FakeResponse:
+        endpoint = url.split(API_V2_BASE, 1)[1]
+        self.calls.append((method, endpoint, arguments))
+        handler = self.handlers.get(endpoint)
+        return FakeResponse(handler(arguments) if handler is not None else None)
+
+    def endpoint_calls(self, endpoint: str) -> List[Dict[str, Any]]:
+        return [arguments for _, called, arguments in self.calls if called == endpoint]
+
+class FakeClock:
+    """Time that only moves when something sleeps, for code taking time, monotonic and sleep."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
@@ -1,117 +1,215 @@
 import os
 import requests
-from typing import Dict, Any
-from logging import Logger
+from datetime import datetime
+from typing import Callable, Dict, Any, Optional
+from logging import Logger, DEBUG
 import logger_utils
 import torrent_utils
+import qbittorrent_api
+import torrent_snapshot_archive
+import decision_trace
+from removal_plan import RemovalPlan
+import content_deleter
+import reclaimable_space
+import eligibility_cache
+import removal_pacer
+import upload_rate_estimator
+from file_lock import try_locked
 from configparser import ConfigParser
 import argparse
 
-def check_space_and_remove_torrents(session: requests.Session, logger: Logger, config: ConfigParser, test_mode: bool, bonus_rules: Dict[str, Dict[str, Any]]) -> None:
+# Constants
+PLAN_FILE_NAME = 'removal_plan.json'
+RUN_LOCK_FILE_NAME = 'torrent_filterer.lock'
+
+def executed_plan_path(plan_path: str) -> str:
+    """Where a run that executes its plan saves it, so it never replaces a test mode plan under review."""
+    root, extension = os.path.splitext(plan_path)
+    return f"{root}.executed{extension}"
+
+def qbittorrent_free_space_probe(session: requests.Session, api_address: str, logger: Logger,
+                                 status: Optional[Dict[str, Any]] = None) -> Callable[[], float]:
+    """Free space in GB as reported by qBittorrent, polled incrementally.
+
+    Each poll only asks for the changes since the previous response, so
+    qBittorrent does not list every torrent while removals are paced. Start
+    from an earlier full status to skip the first full response as well.
+    """
+    state = {'rid': 0, 'free_space': 0}
+    if status is not None:
+        state = {'rid': status.get('rid', 0), 'free_space': status['server_state']['free_space_on_disk']}
+
+    def probe() -> float:
+        changes = torrent_utils.get_status(session, api_address, logger, state['rid'])
+        state['rid'] = changes.get('rid', 0)
+        state['free_space'] = changes.get('server_state', {}).get('free_space_on_disk', state['free_space'])
+        return torrent_utils.parse_free_space(state['free_space'])
+    return probe
+
+def run_deleter(session: requests.Session, api_address: str, logger: Logger, deleter: content_deleter.ContentDeleter) -> int:
+    """Delete the pending content, keeping the files of every torrent still in qBittorrent, and return the bytes freed."""
+    # Looked up fresh, so the files of torrents missing from a cached list are protected as well
+    paths = [entry['path'] for entry in deleter.pending().values()]
+    return deleter.run(torrent_utils.get_files_in_use(session, api_address, paths, logger))
+
+def create_pacer(session: requests.Session, logger: Logger, config: ConfigParser,
+                 deleter: Optional[content_deleter.ContentDeleter],
+                 status: Optional[Dict[str, Any]] = None) -> Optional[removal_pacer.RemovalPacer]:
+    """Pacer for executing removals, measuring free space where qBittorrent frees it while removing."""
+    if deleter is not None:
+        return removal_pacer.from_config(config, logger)  # Space is only freed by deleter.run(), after all removals
+    api_address = config.get('login', 'address')
+    drive_path = config.get('cleanup', 'drive_path', fallback='').strip()
+    if drive_path:
+        return removal_pacer.from_config(config, logger, lambda: torrent_utils.get_free_space(drive_path))
+    return removal_pacer.from_config(config, logger, qbittorrent_free_space_probe(session, api_address, logger, status))
+
+def check_space_and_remove_torrents(session: requests.Session, logger: Logger, config: ConfigParser, test_mode: bool, bonus_rules: Dict[str, Dict[str, Any]],
+                                    plan_path: str) -> None:
     api_address = config.get('login', 'address')
-    download_minspace_gb = config.get('cleanup', 'download_minspace_gb', fallback='')
     min_space_gb = config.getfloat('cleanup', 'min_space_gb')
     categories_space = [cat.strip().lower() for cat in config.get('cleanup', 'categories_to_check_for_space').split(',')]
     categories_count = [cat.strip().lower() for cat in config.get('cleanup', 'categories_to_check_for_number').split(',')]
     free_space = min_space_gb
     script_directory = os.path.dirname(os.path.abspath(__file__))
 
-    for _ in range(2):  # Attempt twice: first try, then retry after login if unauthorized
-        try:
-            status = torrent_utils.get_status(session, api_address, logger)
-            free_space = torrent_utils.parse_free_space(status['server_state']['free_space_on_disk'])
-            logger.info(f"Free space on disk: {free_space:.2f} GB")
-            all_torrents = torrent_utils.get_torrent_list(session, api_address, logger)
-            break  # Exit loop if successful
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 403 and _ == 0:  # Retry only on the first attempt
-                torrent_utils.login_to_qbittorrent(session, api_address, 
-                                                   config.get('login', 'username'), 
-                                                   config.get('login', 'password'), logger)
-            else:
-                raise
+    status = torrent_utils.get_status(session, api_address, logger)
+    free_space = torrent_utils.parse_free_space(status['server_state']['free_space_on_disk'])
+    logger.info(f"Free space on disk: {free_space:.2f} GB")
+    # The archive records the list with the current time, so it must not come from the cache
+    all_torrents = torrent_utils.get_torrent_list(session, api_address, logger, fresh=torrent_snapshot_archive.is_enabled(config))
 
     configured_drive_path = config.get('cleanup', 'drive_path', fallback='').strip()
     if configured_drive_path:
         free_space = torrent_utils.get_free_space(configured_drive_path)
 
-    downloading_torrents = [t for t in all_torrents if t['state'] == 'downloading']
-    total_remaining_size_gb = sum((t['size'] * (1 - t['progress'])) for t in downloading_torrents) / (1024 ** 3)
+    torrent_snapshot_archive.record_snapshot(config, all_torrents, round(free_space * torrent_utils.BYTES_TO_GB), logger)
 
-    space_left_after_downloads = free_space - total_remaining_size_gb
-    logger.info(f"Free space after downloads: {space_left_after_downloads:.2f} GB")
-    # Check if download_minspace_gb is set and not empty
-    if download_minspace_gb and download_minspace_gb.strip():
-        download_minspace_gb = float(download_minspace_gb)
-        additional_space_needed = max(0, download_minspace_gb - space_left_after_downloads)
-    else:
-        additional_space_needed = 0
+    deleter = content_deleter.from_config(config, logger)
+    if deleter is not None and not test_mode and deleter.pending():
+        # Resume deletions left over by an interrupted run before deciding what else to remove
+        free_space += run_deleter(session, api_address, logger, deleter) / torrent_utils.BYTES_TO_GB
 
-    space_needed = max(0, min_space_gb - free_space)
+    space_needed, additional_space_needed, total_remaining_size_gb = torrent_utils.compute_space_needed(free_space, all_torrents, config)
+    logger.info(f"Free space after downloads: {free_space - total_remaining_size_gb:.2f} GB")
 
     category_rules = torrent_utils.get_category_rules(config, logger)
+    trace = decision_trace.from_config(config)
+    try:
+        rule_cache = eligibility_cache.from_config(config)
+
+        filtered_torrents = torrent_utils.filter_torrents_by_rules(
+            all_torrents, 
+            category_rules, 
+            logger,
+            trace,
+            rule_cache
+        )
+        if rule_cache is not None:
+            rule_cache.save(t['hash'] for t in all_torrents)
+
+        if logger.isEnabledFor(DEBUG):  # Skip building the f-strings when debug output is off
+            for torrent in filtered_torrents:
+                logger.debug(f"Torrent {torrent['name']} eligible for removal: "
+                        f"category: {torrent['category']}, "
+                        f"seed time: {torrent['seeding_time']}, "
+                        f"ratio: {torrent['ratio']} "
+                        f"tracker: {torrent['tracker']} " 
+                        f"popularity: {torrent['popularity']} "
+                        f"eta: {torrent['eta']}")
+
+        ratio_log_path = os.path.join(config.get('logging', 'location', fallback=script_directory), 'torrent_ratio_log.json')
+        plan = RemovalPlan(free_space_gb=free_space, space_needed_gb=max(space_needed, additional_space_needed))
+        upload_rates = torrent_utils.select_upload_rates(upload_rate_estimator.scoring_estimator(config), filtered_torrents, logger)
+
+        if space_needed > 0 or additional_space_needed > 0:
+            estimator = reclaimable_space.from_config(config)
+            if estimator is not None:
+                torrent_utils.attach_content_files(session, api_address, all_torrents, logger)
+            plan.add(torrent_utils.plan_removals_by_space(
+                filtered_torrents,
+                categories_space,
+                max(additional_space_needed, space_needed),
+                logger,
+                ratio_log_path,
+                bonus_rules,
+                config,
+                trace=trace,
+                estimator=estimator,
+                all_torrents=all_torrents,
+                upload_rates=upload_rates
+            ))
+            if estimator is not None:
+                estimator.save()
+        space_to_be_freed = plan.expected_gb_freed('space')
+
+        if space_to_be_freed == 0:
+            logger.info("No torrents to remove based on space requirements.")
+
+        plan.add(torrent_utils.plan_removals_by_count(
+            filtered_torrents,
+            categories_count,
+            config.getint('cleanup', 'max_torrents_for_categories'), 
+            logger, 
+            ratio_log_path,
+            bonus_rules,
+            config.getboolean('cleanup', 'sort_count_removal_by_size', fallback=False),
+            config,
+            trace=trace,
+            upload_rates=upload_rates
+        ))
+    finally:
+        trace.flush()  # Also keep the events recorded before a failure, they are what explains it
 
-    filtered_torrents = torrent_utils.filter_torrents_by_rules(
-        all_torrents, 
-        category_rules, 
-        logger
-    )
-
-    for torrent in filtered_torrents:
-        logger.debug(f"Torrent {torrent['name']} eligible for removal: "
-                f"category: {torrent['category']}, "
-                f"seed time: {torrent['seeding_time']}, "
-                f"ratio: {torrent['ratio']} "
-                f"tracker: {torrent['tracker']} " 
-                f"popularity: {torrent['popularity']} "
-                f"eta: {torrent['eta']}")
-
-    torrents_removed_by_space, space_to_be_freed = torrent_utils.remove_torrents_by_space(
-        filtered_torrents,
-        categories_space,
-        max(additional_space_needed, space_needed),
-        configured_drive_path,
-        logger,
-        session,
-        api_address,
-        test_mode,
-        os.path.join(config.get('logging', 'location', fallback=script_directory), 'torrent_ratio_log.json'),
-        bonus_rules,
-        config
-    ) if space_needed > 0 or additional_space_needed > 0 else ([], 0)
-
-    if space_to_be_freed == 0:
-        logger.info("No torrents to remove based on space requirements.")
-
-    torrents_removed_by_count = torrent_utils.remove_torrents_by_count(
-        filtered_torrents,
-        categories_count,
-        config.getint('cleanup', 'max_torrents_for_categories'), 
-        logger, 
-        session, 
-        api_address, 
-        test_mode,
-        os.path.join(config.get('logging', 'location', fallback=script_directory), 'torrent_ratio_log.json'),
-        bonus_rules,
-        config.getboolean('cleanup', 'sort_count_removal_by_size', fallback=False),
-        config
-    )
-
-    all_removed_torrents = torrents_removed_by_space + torrents_removed_by_count
+    plan.save(plan_path if test_mode else executed_plan_path(plan_path))
+    removals = plan.removals
+    if not test_mode:
+        removals = torrent_utils.execute_removal_plan(session, api_address, plan, logger, deleter=deleter,
+                                                      pacer=create_pacer(session, logger, config, deleter, status))
+        if deleter is not None:
+            run_deleter(session, api_address, logger, deleter)
 
     """Log information about removed or would-be removed torrents."""
-    if all_removed_torrents:
+    if removals:
         logger.info(f"{'TEST MODE: ' if test_mode else ''} "
                 f"Free space: {free_space:.2f} GB, "
                 f"DLremain: {total_remaining_size_gb:.1f} GB, "
                 f"Diskneed: {max(space_needed, additional_space_needed):.0f} GB "
                 f"Space to be freed: {space_to_be_freed:.2f} GB")
-        logger_utils.log_torrent_removal_info(all_removed_torrents, logger, bonus_rules, config)
+        logger_utils.log_torrent_removal_info(removals, logger)
 
-def main(test_mode: bool, logger: Logger, handler: Any, config: ConfigParser, session: requests.Session) -> None:
+def apply_removal_plan(session: requests.Session, logger: Logger, config: ConfigParser, plan_path: str, test_mode: bool) -> None:
+    """Execute a plan saved by an earlier run, e.g. a reviewed test mode run. In test mode the plan is only shown."""
+    api_address = config.get('login', 'address')
+    plan = RemovalPlan.load(plan_path)
+    logger.info(f"{'TEST MODE: ' if test_mode else ''}Applying removal plan from {plan_path} created at "
+                f"{datetime.fromtimestamp(plan.created):%Y-%m-%d %H:%M:%S}, Space to be freed: {plan.expected_gb_freed():.2f} GB")
+    if test_mode:
+        logger_utils.log_torrent_removal_info(plan.removals, logger)
+        return
+    deleter = content_deleter.from_config(config, logger)
+    removals = torrent_utils.execute_removal_plan(session, api_address, plan, logger, deleter=deleter,
+                                                  pacer=create_pacer(session, logger, config, deleter))
+    if deleter is not None:
+        run_deleter(session, api_address, logger, deleter)
+    logger_utils.log_torrent_removal_info(removals, logger)
+
+def main(test_mode: bool, logger: Logger, handler: Any, config: ConfigParser, session: requests.Session,
+         plan_path: Optional[str] = None, apply_plan: bool = False) -> None:
     try:
-        bonus_rules = torrent_utils.load_bonus_rules(config)
-        check_space_and_remove_torrents(session, logger, config, test_mode, bonus_rules)
+        script_directory = os.path.dirname(os.path.abspath(__file__))
+        log_directory = config.get('logging', 'location', fallback='') or script_directory
+        if plan_path is None:
+            plan_path = os.path.join(log_directory, PLAN_FILE_NAME)
+        # A paced run can outlast the schedule; an overlapping run would plan removals for space that is still being freed
+        with try_locked(os.path.join(log_directory, RUN_LOCK_FILE_NAME)) as acquired:
+            if not acquired:
+                logger.warning("Another cleanup run is still in progress, skipping this run")
+            elif apply_plan:
+                apply_removal_plan(session, logger, config, plan_path, test_mode)
+            else:
+                bonus_rules = torrent_utils.load_bonus_rules(config)
+                check_space_and_remove_torrents(session, logger, config, test_mode, bonus_rules, plan_path)
     except Exception as e:
         logger.error(f"An error occurred: {e}")
     finally:
@@ -121,7 +219,9 @@ def main(test_mode: bool, logger: Logger, handler: Any, config: ConfigParser, se
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Qbittorrent Auto Delete Script")
     parser.add_argument('--config', type=str, help='Path to the configuration file')
-    parser.add_argument('--test', action='store_true', help='Run in test mode')
+    parser.add_argument('--test', action='store_true', help='Run in test mode: only produce the removal plan')
+    parser.add_argument('--plan', type=str, help='Path of the removal plan file')
+    parser.add_argument('--apply-plan', action='store_true', help='Execute the saved removal plan instead of computing a new one')
     args = parser.parse_args()
 
     config_path = args.config if args.config else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
@@ -130,5 +230,5 @@ if __name__ == "__main__":
     script_directory = os.path.dirname(os.path.abspath(__file__))
     config = torrent_utils.load_configuration(script_directory)
     logger, log_handler = logger_utils.setup_logger(config.get('logging', 'location', fallback=''), config.getboolean('logging', 'debug'))
-    session = requests.Session()
-    main(test_mode, logger, log_handler, config, session)
\ No newline at end of file
+    session = qbittorrent_api.from_config(config, logger)
+    main(test_mode, logger, log_handler, config, session, args.plan, args.apply_plan)
\ No newline at end of file
@@ -0,0 +1,52 @@
+import os
+import time
+import pickle
+import configparser
+from typing import Dict, List, Any, Optional
+from file_lock import locked
+
+# Constants
+CACHE_FILE_NAME = 'torrent_list_cache.pickle'
+DEFAULT_TTL_SECONDS = 120
+
+class TorrentListCache:
+    """Local copy of the /torrents/info list shared by scripts scheduled close together.
+
+    The list is pickled to a temporary file and moved into place, so readers
+    always see a complete list. The fetch itself runs under an advisory lock:
+    scripts started at the same time wait for the first one instead of all
+    downloading the list.
+    """
+
+    def __init__(self, cache_path: str, ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+
+    def lock(self) -> Any:
+        return locked(self.cache_path + '.lock')
+
+    def load(self, api_address: str) -> Optional[List[Dict[str, Any]]]:
+        """The cached list of this WebUI, or None if there is none younger than the TTL."""
+        try:
+            with open(self.cache_path, 'rb') as file:
+                cached = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        if cached.get('address') != api_address or time.time() - cached.get('fetched', 0) > self.ttl_seconds:
+            return None
+        return cached['torrents']
+
+    def store(self, api_address: str, torrents: List[Dict[str, Any]]) -> None:
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            pickle.dump({'address': api_address, 'fetched': time.time(), 'torrents': torrents}, file, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.cache_path)
+
+def from_config(config: configparser.ConfigParser) -> Optional[TorrentListCache]:
+    """Create the cache configured in the [torrent_cache] section, or None when it is disabled."""
+    if not config.getboolean('torrent_cache', 'enabled', fallback=False):
+        return None
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    default_path = os.path.join(config.get('logging', 'location', fallback='') or script_directory, CACHE_FILE_NAME)
+    return TorrentListCache(config.get('torrent_cache', 'location', fallback=default_path),
+                            config.getfloat('torrent_cache', 'ttl_seconds', fallback=DEFAULT_TTL_SECONDS))
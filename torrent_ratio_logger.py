@@ -3,14 +3,19 @@ import json
 import configparser
 import os
 import sys
+import time
 from datetime import datetime
-from typing import Dict, List, Any, Tuple, Set
+from typing import Dict, List, Any, Tuple, Set, Optional
 import logger_utils
+import qbittorrent_api
+from file_lock import locked
 from contextlib import contextmanager
 
 # Constants
 API_V2_BASE = "/api/v2"
 SECONDS_PER_DAY = 24 * 3600
+REPLACE_ATTEMPTS = 10
+REPLACE_RETRY_SECONDS = 0.5
 
 def load_configuration(script_directory: str) -> configparser.ConfigParser:
     """Load configuration from the config file."""
@@ -20,14 +25,11 @@ def load_configuration(script_directory: str) -> configparser.ConfigParser:
     return config
 
 @contextmanager
-def api_session(api_address: str, username: str, password: str):
+def api_session(api_address: str, username: str, password: str, **transport_options: Any):
     """Create and manage an API session."""
-    session = requests.Session()
+    session = qbittorrent_api.QBittorrentSession(api_address, username, password, **transport_options)
     try:
-        login_url = f"{api_address}{API_V2_BASE}/auth/login"
-        response = session.post(login_url, data={'username': username, 'password': password})
-        if response.text != 'Ok.':
-            raise ConnectionError("Login failed")
+        session.login()
         yield session
     finally:
         session.close()
@@ -54,13 +56,30 @@ def load_existing_data(file_path: str) -> Dict[str, List[Dict[str, Any]]]:
     except json.JSONDecodeError as e:
         raise ValueError(f"Error decoding JSON from {file_path}: {e}")
 
+def replace_with_retry(source: str, destination: str) -> None:
+    """os.replace, retried for a few seconds while a reader holds the destination open on Windows."""
+    for attempt in range(REPLACE_ATTEMPTS):
+        try:
+            os.replace(source, destination)
+            return
+        except PermissionError:
+            if attempt == REPLACE_ATTEMPTS - 1:
+                raise
+            time.sleep(REPLACE_RETRY_SECONDS)
+
 def save_data(file_path: str, data: Dict[str, List[Dict[str, Any]]], logger: Any) -> None:
-    """Save data to the log file."""
+    """Save data to the log file, replacing it atomically so readers never see a partly written log."""
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
     try:
-        with open(file_path, 'w') as file:
+        with open(tmp_path, 'w') as file:
             json.dump(data, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        replace_with_retry(tmp_path, file_path)
     except Exception as e:
         logger.error(f"Error saving ratio log file: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 def process_torrent_data(torrents: List[Dict[str, Any]], old_data: Dict[str, List[Dict[str, Any]]], max_entries: int, purge_days: List[int]) -> Tuple[Dict[str, List[Dict[str, Any]]], Set[str]]:
     """Process torrent data and update the log."""
@@ -101,18 +120,20 @@ def log_statistics(new_data: Dict[str, List[Dict[str, Any]]], old_hashes: Set[st
               f"Torrents removed: {torrents_removed}, "
               f"Torrents with max entries: {torrents_with_max_entries}")
 
-def update_ratio_log(api_address: str, username: str, password: str, log_file_path: str, logger: Any, max_entries: int, purge_days: List[int]) -> None:
+def update_ratio_log(api_address: str, username: str, password: str, log_file_path: str, logger: Any, max_entries: int, purge_days: List[int],
+                     transport_options: Optional[Dict[str, Any]] = None) -> None:
   """Main function to update the ratio log."""
   try:
-      with api_session(api_address, username, password) as session:
+      with api_session(api_address, username, password, **(transport_options or {})) as session:
           torrents = get_torrent_list(api_address, session)
-          old_data = load_existing_data(log_file_path)
-          
-          # Get the current set of torrent hashes before processing
-          old_hashes = set(old_data.keys())
-          
-          new_data, current_hashes = process_torrent_data(torrents, old_data, max_entries, purge_days)
-          save_data(log_file_path, new_data, logger)
+          with locked(log_file_path + '.lock'):  # Concurrent loggers must not overwrite each other's update
+              old_data = load_existing_data(log_file_path)
+              
+              # Get the current set of torrent hashes before processing
+              old_hashes = set(old_data.keys())
+              
+              new_data, current_hashes = process_torrent_data(torrents, old_data, max_entries, purge_days)
+              save_data(log_file_path, new_data, logger)
           
           # Use old_hashes instead of old_data for comparison
           log_statistics(new_data, old_hashes, current_hashes, logger, max_entries)
@@ -138,5 +159,6 @@ if __name__ == "__main__":
     purge_days = [int(day.strip()) for day in purge_days_str.split(',') if day.strip()]
 
     logger.info("Running torrent ratio logger script")
-    update_ratio_log(api_address, username, password, log_file_path, logger, max_entries, purge_days)
+    update_ratio_log(api_address, username, password, log_file_path, logger, max_entries, purge_days,
+                     qbittorrent_api.transport_options(config))
     log_handler.write_log_entries()
\ No newline at end of file
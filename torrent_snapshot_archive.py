@@ -0,0 +1,416 @@
+import os
+import sys
+import json
+import lzma
+import zlib
+import time
+import argparse
+import configparser
+from datetime import datetime, timezone
+from logging import Logger
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+import qbittorrent_api
+import logger_utils
+import torrent_utils
+from file_lock import locked
+
+# Constants
+SHARDS = 16
+FLOAT_DIGITS = 6
+DEFAULT_SEGMENT_DAYS = 7
+SECONDS_PER_DAY = 86400
+CODECS = ('lzma', 'zlib')
+INDEX_SUFFIX = '.idx'
+DATA_SUFFIX = '.bin'
+TAIL_SUFFIX = '.tail'
+LOCK_FILE_NAME = '.lock'
+FIXED_POINT_LIMIT = 1e9
+
+# Archive layout
+# --------------
+# The archive is a directory with one segment per segment_days (a week by
+# default, starting at the UTC date in its name): <date>.bin holds the
+# compressed records and <date>.idx is a small JSON index listing, for every
+# snapshot, its timestamp, free space and the (offset, length) of one record per
+# shard. Torrents are spread over SHARDS shards by hash, so reading a single
+# torrent's history only decompresses 1/SHARDS of the data.
+#
+# The first snapshot of a segment is a keyframe, later ones are deltas against
+# the previous snapshot. Within a segment and shard every torrent gets a small
+# integer id, and a record is a JSON object with:
+#   "add": {"ids": [hash, ...], "cols": {field: [value per new torrent]}}
+#   "del": [gap-encoded ids of removed torrents]
+#   "chg": {field: [[gap-encoded ids], [values]]}
+#   "fchg": {field: [[gap-encoded ids], [second-order fixed-point differences]]}
+# Changed integer fields store the difference to the previous value. Floats
+# are rounded to FLOAT_DIGITS decimals and changes are stored as the change of
+# their fixed-point difference since the previous snapshot, so that smoothly
+# drifting derived fields such as popularity encode to runs of near-zero
+# values. None values are treated as absent.
+#
+# <date>.tail caches the decoded state after the last snapshot of a segment so
+# appending does not have to replay the whole segment.
+
+def shard_of(torrent_hash: str) -> int:
+    return zlib.crc32(torrent_hash.encode()) % SHARDS
+
+def _is_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _normalize(torrent: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: round(value, FLOAT_DIGITS) if isinstance(value, float) else value
+            for field, value in torrent.items() if value is not None}
+
+def _float_delta(old: Any, new: Any) -> Optional[int]:
+    """Fixed-point difference between two floats, or None if it would not round-trip."""
+    if not (isinstance(old, float) and isinstance(new, float)) or abs(old) > FIXED_POINT_LIMIT or abs(new) > FIXED_POINT_LIMIT:
+        return None
+    delta = round((new - old) * 10**FLOAT_DIGITS)
+    return delta if _apply_float_delta(old, delta) == new else None
+
+def _apply_float_delta(old: float, delta: int) -> float:
+    return round(old + delta / 10**FLOAT_DIGITS, FLOAT_DIGITS)
+
+def _encode_gaps(ids: List[int]) -> List[int]:
+    return [current - previous for previous, current in zip([0] + ids[:-1], ids)]
+
+def _decode_gaps(gaps: List[int]) -> List[int]:
+    ids = []
+    current = 0
+    for gap in gaps:
+        current += gap
+        ids.append(current)
+    return ids
+
+LZMA_FILTERS = [{'id': lzma.FILTER_LZMA2, 'preset': 6}]
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == 'lzma':
+        # Raw streams skip the per-record container headers, which matter for small delta records
+        return lzma.compress(data, format=lzma.FORMAT_RAW, filters=LZMA_FILTERS)
+    return zlib.compress(data, 9)
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'lzma':
+        return lzma.decompress(data, format=lzma.FORMAT_RAW, filters=LZMA_FILTERS)
+    return zlib.decompress(data)
+
+class ShardState:
+    """Decoded state of one shard while walking through a segment."""
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.id_of: Dict[str, int] = {}
+        self.rows: Dict[int, Dict[str, Any]] = {}
+        self.float_deltas: Dict[Tuple[int, str], int] = {}
+
+    def apply(self, record: Dict[str, Any]) -> None:
+        """Apply an encoded record to the state."""
+        added = record.get('add')
+        if added:
+            columns = added['cols']
+            for position, torrent_hash in enumerate(added['ids']):
+                torrent_id = len(self.ids)
+                self.ids.append(torrent_hash)
+                self.id_of[torrent_hash] = torrent_id
+                self.rows[torrent_id] = {field: values[position] for field, values in columns.items()
+                                         if values[position] is not None}
+
+        for torrent_id in _decode_gaps(record.get('del', [])):
+            self.rows.pop(torrent_id, None)
+
+        for field, (gaps, values) in record.get('chg', {}).items():
+            for torrent_id, value in zip(_decode_gaps(gaps), values):
+                row = self.rows[torrent_id]
+                if value is None:
+                    row.pop(field, None)
+                elif _is_int(value) and _is_int(row.get(field)):
+                    row[field] += value
+                else:
+                    row[field] = value
+
+        float_deltas = {}
+        for field, (gaps, second_deltas) in record.get('fchg', {}).items():
+            for torrent_id, second_delta in zip(_decode_gaps(gaps), second_deltas):
+                delta = self.float_deltas.get((torrent_id, field), 0) + second_delta
+                row = self.rows[torrent_id]
+                row[field] = _apply_float_delta(row[field], delta)
+                float_deltas[(torrent_id, field)] = delta
+        self.float_deltas = float_deltas
+
+    def encode(self, torrents: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        """Encode the given torrents as a record against the current state and apply it."""
+        live = {self.ids[torrent_id]: torrent_id for torrent_id in self.rows}
+        record: Dict[str, Any] = {}
+
+        new_hashes = sorted(h for h in torrents if h not in live)
+        if new_hashes:
+            fields = sorted({field for h in new_hashes for field in torrents[h]})
+            record['add'] = {'ids': new_hashes,
+                             'cols': {field: [torrents[h].get(field) for h in new_hashes] for field in fields}}
+
+        removed_ids = sorted(torrent_id for torrent_hash, torrent_id in live.items() if torrent_hash not in torrents)
+        if removed_ids:
+            record['del'] = _encode_gaps(removed_ids)
+
+        changes: Dict[str, Tuple[List[int], List[Any]]] = {}
+        float_changes: Dict[str, Tuple[List[int], List[int]]] = {}
+        for torrent_id in sorted(live.values()):
+            torrent = torrents.get(self.ids[torrent_id])
+            if torrent is None:
+                continue
+            row = self.rows[torrent_id]
+            for field in row.keys() | torrent.keys():
+                old, new = row.get(field), torrent.get(field)
+                if old == new and type(old) is type(new):
+                    continue
+                delta = _float_delta(old, new)
+                if delta is not None:
+                    target = float_changes.setdefault(field, ([], []))
+                    target[0].append(torrent_id)
+                    target[1].append(delta - self.float_deltas.get((torrent_id, field), 0))
+                    continue
+                if new is not None and _is_int(old) and _is_int(new):
+                    new = new - old
+                target = changes.setdefault(field, ([], []))
+                target[0].append(torrent_id)
+                target[1].append(new)
+        if changes:
+            record['chg'] = {field: [_encode_gaps(ids), values] for field, (ids, values) in sorted(changes.items())}
+        if float_changes:
+            record['fchg'] = {field: [_encode_gaps(ids), deltas] for field, (ids, deltas) in sorted(float_changes.items())}
+
+        self.apply(record)
+        return record
+
+    def torrents(self) -> List[Dict[str, Any]]:
+        return [dict(row) for row in self.rows.values()]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'ids': self.ids, 'rows': [[torrent_id, row] for torrent_id, row in self.rows.items()],
+                'float_deltas': [[torrent_id, field, delta] for (torrent_id, field), delta in self.float_deltas.items()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ShardState':
+        state = cls()
+        state.ids = data['ids']
+        state.id_of = {torrent_hash: torrent_id for torrent_id, torrent_hash in enumerate(state.ids)}
+        state.rows = {torrent_id: row for torrent_id, row in data['rows']}
+        state.float_deltas = {(torrent_id, field): delta for torrent_id, field, delta in data['float_deltas']}
+        return state
+
+class SnapshotArchive:
+    """Compressed, delta-encoded archive of /torrents/info snapshots."""
+
+    def __init__(self, archive_dir: str, codec: str = 'lzma', segment_days: int = DEFAULT_SEGMENT_DAYS):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}', expected one of {', '.join(CODECS)}")
+        self.archive_dir = archive_dir
+        self.codec = codec
+        self.segment_seconds = segment_days * SECONDS_PER_DAY
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def segments(self) -> List[str]:
+        """Names of all segments, oldest first."""
+        return sorted(name[:-len(INDEX_SUFFIX)] for name in os.listdir(self.archive_dir) if name.endswith(INDEX_SUFFIX))
+
+    def load_index(self, segment: str) -> Dict[str, Any]:
+        index_path = os.path.join(self.archive_dir, segment + INDEX_SUFFIX)
+        try:
+            with open(index_path, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {'codec': self.codec, 'snapshots': []}
+
+    def _save_index(self, segment: str, index: Dict[str, Any]) -> None:
+        index_path = os.path.join(self.archive_dir, segment + INDEX_SUFFIX)
+        temp_path = index_path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(index, file, separators=(',', ':'))
+        os.replace(temp_path, index_path)
+
+    def _read_record(self, file: Any, location: List[int], codec: str) -> Dict[str, Any]:
+        offset, length = location
+        file.seek(offset)
+        return json.loads(_decompress(file.read(length), codec))
+
+    def timestamps(self) -> List[int]:
+        return [snapshot['t'] for segment in self.segments() for snapshot in self.load_index(segment)['snapshots']]
+
+    def append(self, torrents: List[Dict[str, Any]], timestamp: Optional[int] = None, free_space: Optional[int] = None) -> None:
+        """Append a snapshot of the given torrents to the archive.
+
+        Runs under a lock on the archive, so the filterer and the standalone
+        recorder never write to the same segment at once.
+        """
+        with locked(os.path.join(self.archive_dir, LOCK_FILE_NAME)):
+            self._append(torrents, int(timestamp if timestamp is not None else time.time()), free_space)
+
+    def _append(self, torrents: List[Dict[str, Any]], timestamp: int, free_space: Optional[int]) -> None:
+        segment_start = timestamp - timestamp % self.segment_seconds
+        segment = datetime.fromtimestamp(segment_start, timezone.utc).strftime('%Y-%m-%d')
+        index = self.load_index(segment)
+        segments = self.segments()
+        last_snapshots = self.load_index(segments[-1])['snapshots'] if segments else []
+        if last_snapshots and timestamp <= last_snapshots[-1]['t']:
+            raise ValueError(f"Snapshot at {timestamp} is not newer than the last archived snapshot")
+
+        codec = index['codec']
+        states = self._load_tail(segment, len(index['snapshots']))
+        if states is None:
+            states = self._decode_segment(segment, index, len(index['snapshots']), range(SHARDS))
+
+        by_shard: List[Dict[str, Dict[str, Any]]] = [{} for _ in range(SHARDS)]
+        for torrent in torrents:
+            by_shard[shard_of(torrent['hash'])][torrent['hash']] = _normalize(torrent)
+
+        data_path = os.path.join(self.archive_dir, segment + DATA_SUFFIX)
+        end = 0
+        if index['snapshots']:
+            end = max(offset + length for offset, length in index['snapshots'][-1]['shards'])
+        with open(data_path, 'ab') as file:
+            file.truncate(end)  # Drop any bytes left behind by an interrupted write
+            file.seek(end)
+            locations = []
+            for shard in range(SHARDS):
+                blob = _compress(json.dumps(states[shard].encode(by_shard[shard]), separators=(',', ':')).encode(), codec)
+                locations.append([file.tell(), len(blob)])
+                file.write(blob)
+            file.flush()
+            os.fsync(file.fileno())
+
+        index['snapshots'].append({'t': timestamp, 'free_space': free_space, 'shards': locations})
+        self._save_index(segment, index)
+        self._save_tail(segment, len(index['snapshots']), states)
+
+    def _load_tail(self, segment: str, count: int) -> Optional[Dict[int, ShardState]]:
+        """Load the cached state after the last snapshot of a segment, if it is current."""
+        try:
+            with open(os.path.join(self.archive_dir, segment + TAIL_SUFFIX), 'rb') as file:
+                tail = json.loads(zlib.decompress(file.read()))
+        except (OSError, ValueError, zlib.error):
+            return None
+        if tail['count'] != count:
+            return None
+        return {shard: ShardState.from_dict(data) for shard, data in enumerate(tail['shards'])}
+
+    def _save_tail(self, segment: str, count: int, states: Dict[int, ShardState]) -> None:
+        tail = {'count': count, 'shards': [states[shard].to_dict() for shard in range(SHARDS)]}
+        tail_path = os.path.join(self.archive_dir, segment + TAIL_SUFFIX)
+        with open(tail_path + '.tmp', 'wb') as file:
+            file.write(zlib.compress(json.dumps(tail, separators=(',', ':')).encode(), 1))
+        os.replace(tail_path + '.tmp', tail_path)
+        for name in os.listdir(self.archive_dir):
+            if name.endswith(TAIL_SUFFIX) and name != segment + TAIL_SUFFIX:
+                os.remove(os.path.join(self.archive_dir, name))
+
+    def _decode_segment(self, segment: str, index: Dict[str, Any], count: int, shards: Any) -> Dict[int, ShardState]:
+        """Decode the first count snapshots of a segment for the given shards."""
+        states = {shard: ShardState() for shard in shards}
+        if count == 0:
+            return states
+        with open(os.path.join(self.archive_dir, segment + DATA_SUFFIX), 'rb') as file:
+            for snapshot in index['snapshots'][:count]:
+                for shard, state in states.items():
+                    state.apply(self._read_record(file, snapshot['shards'][shard], index['codec']))
+        return states
+
+    def read_snapshot(self, timestamp: int) -> Optional[Dict[str, Any]]:
+        """Return the latest snapshot taken at or before timestamp, or None."""
+        for segment in reversed(self.segments()):
+            index = self.load_index(segment)
+            count = sum(1 for snapshot in index['snapshots'] if snapshot['t'] <= timestamp)
+            if count:
+                states = self._decode_segment(segment, index, count, range(SHARDS))
+                snapshot = index['snapshots'][count - 1]
+                return {'timestamp': snapshot['t'], 'free_space': snapshot['free_space'],
+                        'torrents': [t for state in states.values() for t in state.torrents()]}
+        return None
+
+    def iter_snapshots(self, start: Optional[int] = None, end: Optional[int] = None, step_seconds: int = 0) -> Iterator[Dict[str, Any]]:
+        """Yield snapshots between start and end, at most one per step_seconds, decoding each segment once."""
+        last_timestamp = None
+        for segment in self.segments():
+            index = self.load_index(segment)
+            snapshots = index['snapshots']
+            if not snapshots or (start is not None and snapshots[-1]['t'] < start) or (end is not None and snapshots[0]['t'] > end):
+                continue
+            states = {shard: ShardState() for shard in range(SHARDS)}
+            with open(os.path.join(self.archive_dir, segment + DATA_SUFFIX), 'rb') as file:
+                for snapshot in snapshots:
+                    if end is not None and snapshot['t'] > end:
+                        return
+                    for shard, state in states.items():
+                        state.apply(self._read_record(file, snapshot['shards'][shard], index['codec']))
+                    if start is not None and snapshot['t'] < start:
+                        continue
+                    if last_timestamp is not None and snapshot['t'] - last_timestamp < step_seconds:
+                        continue
+                    last_timestamp = snapshot['t']
+                    yield {'timestamp': snapshot['t'], 'free_space': snapshot['free_space'],
+                           'torrents': [t for state in states.values() for t in state.torrents()]}
+
+    def torrent_history(self, torrent_hash: str, start: Optional[int] = None, end: Optional[int] = None) -> List[Tuple[int, Dict[str, Any]]]:
+        """Return (timestamp, torrent) pairs for every snapshot that contains the torrent."""
+        shard = shard_of(torrent_hash)
+        history = []
+        for segment in self.segments():
+            index = self.load_index(segment)
+            snapshots = index['snapshots']
+            if not snapshots or (start is not None and snapshots[-1]['t'] < start) or (end is not None and snapshots[0]['t'] > end):
+                continue
+            state = ShardState()
+            with open(os.path.join(self.archive_dir, segment + DATA_SUFFIX), 'rb') as file:
+                for snapshot in snapshots:
+                    if end is not None and snapshot['t'] > end:
+                        break
+                    state.apply(self._read_record(file, snapshot['shards'][shard], index['codec']))
+                    torrent_id = state.id_of.get(torrent_hash)
+                    if (start is None or snapshot['t'] >= start) and torrent_id in state.rows:
+                        history.append((snapshot['t'], dict(state.rows[torrent_id])))
+        return history
+
+def get_archive(config: configparser.ConfigParser) -> SnapshotArchive:
+    """Open the archive configured in the [snapshot_archive] section."""
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    default_location = os.path.join(config.get('logging', 'location', fallback='') or script_directory, 'snapshots')
+    return SnapshotArchive(config.get('snapshot_archive', 'location', fallback=default_location),
+                           config.get('snapshot_archive', 'codec', fallback='lzma'),
+                           config.getint('snapshot_archive', 'segment_days', fallback=DEFAULT_SEGMENT_DAYS))
+
+def is_enabled(config: configparser.ConfigParser) -> bool:
+    return config.getboolean('snapshot_archive', 'enabled', fallback=False)
+
+def record_snapshot(config: configparser.ConfigParser, torrents: List[Dict[str, Any]], free_space: Optional[int], logger: Logger) -> None:
+    """Append a torrent list that was just fetched to the archive when [snapshot_archive] enabled is set.
+
+    Never pass a list from the torrent list cache: it would be archived with the wrong timestamp.
+    """
+    if not is_enabled(config):
+        return
+    try:
+        get_archive(config).append(torrents, free_space=free_space)
+    except Exception as e:  # The archive is optional history, a damaged segment must never block the cleanup
+        logger.error(f"Failed to archive torrent snapshot: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Qbittorrent Snapshot Recorder")
+    parser.add_argument('--config', type=str, help='Path to the configuration file')
+    args = parser.parse_args()
+
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    config = torrent_utils.load_configuration(script_directory)
+    logger, log_handler = logger_utils.setup_logger(config.get('logging', 'location', fallback=''), config.getboolean('logging', 'debug'))
+    session = qbittorrent_api.from_config(config, logger)
+    api_address = config.get('login', 'address')
+
+    try:
+        status = torrent_utils.get_status(session, api_address, logger)
+        torrents = torrent_utils.get_torrent_list(session, api_address, logger, fresh=True)
+        get_archive(config).append(torrents, free_space=status['server_state'].get('free_space_on_disk'))
+        logger.info(f"Archived snapshot of {len(torrents)} torrents")
+    except Exception as e:
+        logger.error(f"Failed to archive torrent snapshot: {e}")
+        sys.exit(1)
+    finally:
+        log_handler.write_log_entries()
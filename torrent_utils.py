@@ -1,18 +1,29 @@
 import os
-import sys
 from shutil import disk_usage
 import requests
 import json
+import time
 import configparser
-from typing import Dict, List, Any, Tuple
-from logging import Logger
+from typing import Dict, List, Any, Iterable, Set, Tuple, Optional
+from logging import Logger, DEBUG
 from numbers import Number
 from torrent_fields_types import TORRENT_FIELDS_TYPES
+from decision_trace import DecisionTrace, NULL_TRACE
+from removal_plan import PlannedRemoval, RemovalPlan
+from reclaimable_space import ReclaimEstimator, group_by_content, content_key, is_rootless, unit_content_paths
+from content_deleter import ContentDeleter, is_within
+from eligibility_cache import EligibilityCache
+from space_selection import select_cover
+from removal_pacer import RemovalPacer
+from upload_rate_estimator import UploadRateEstimator
 # Constants
 API_V2_BASE = "/api/v2"
 BYTES_TO_GB = 1024**3
 SECONDS_PER_DAY = 86400
 SECONDS_PER_WEEK = 7 * SECONDS_PER_DAY
+HOURS_PER_WEEK = 7 * 24
+HASHES_PER_REQUEST = 200
+SCORE_FLOOR = 0.001  # Among torrents without upload, prefer removing the fewest bytes
 
 def get_drive_path(file_path: str) -> str:
     """Find the mount point of a given file path."""
@@ -36,67 +47,128 @@ def load_configuration(script_directory: str) -> configparser.ConfigParser:
     config.read(config_path)
     return config
 
-def login_to_qbittorrent(session: requests.Session, api_address: str, username: str, password: str, logger: Logger) -> None:
-    """Login to qBittorrent API."""
-    login_url = f"{api_address}{API_V2_BASE}/auth/login"
-    try:
-        response = session.post(login_url, data={'username': username, 'password': password})
-        response.raise_for_status()
-        if response.text != 'Ok.':
-            raise ValueError("Login failed: Unexpected response")
-    except (requests.RequestException, ValueError) as e:
-        logger.error(f"Login failed: {str(e)}")
-        sys.exit(1)
-
-def get_torrent_list(session: requests.Session, api_address: str, logger: Logger) -> List[Dict[str, Any]]:
-    """Get list of torrents from qBittorrent API."""
+def get_torrent_list(session: requests.Session, api_address: str, logger: Logger, fresh: bool = False) -> List[Dict[str, Any]]:
+    """Get list of torrents from qBittorrent API.
+
+    Goes through the session's torrent list cache when it has one, unless fresh is set.
+    """
+    cache = getattr(session, 'torrent_cache', None)
+    if cache is None or fresh:
+        torrents = _fetch_torrent_list(session, api_address)
+        if cache is not None:
+            cache.store(api_address, torrents)
+        return torrents
+    with cache.lock():  # Scripts started together wait for one fetch instead of all fetching
+        torrents = cache.load(api_address)
+        if torrents is not None:
+            logger.debug(f"Using cached torrent list of {len(torrents)} torrents")
+            return torrents
+        torrents = _fetch_torrent_list(session, api_address)
+        cache.store(api_address, torrents)
+        return torrents
+
+def _fetch_torrent_list(session: requests.Session, api_address: str, hashes: Optional[List[str]] = None) -> List[Dict[str, Any]]:
     torrent_list_url = f"{api_address}{API_V2_BASE}/torrents/info"
-    response = session.get(torrent_list_url)
+    response = session.get(torrent_list_url, params={'hashes': '|'.join(hashes)} if hashes is not None else None)
     response.raise_for_status()  # This will raise an HTTPError for bad responses
     return response.json()
 
-def get_status(session: requests.Session, api_address: str, logger: Logger) -> Dict[str, Any]:
-    """Get qBittorrent status."""
+def get_status(session: requests.Session, api_address: str, logger: Logger, rid: int = 0) -> Dict[str, Any]:
+    """Get qBittorrent status.
+
+    With the rid of an earlier response, only what changed since then is returned.
+    """
     status_url = f"{api_address}{API_V2_BASE}/sync/maindata"
-    response = session.get(status_url)
+    response = session.get(status_url, params={'rid': rid} if rid else None)
     response.raise_for_status()
     return response.json()
 
-def force_torrents(session: requests.Session, api_address: str, torrents: List[Dict[str, Any]], logger: Logger, test_mode: bool) -> None:
-    """Force torrents to seed."""
+def force_torrents(session: requests.Session, api_address: str, torrents: List[Dict[str, Any]], logger: Logger, test_mode: bool,
+                   value: bool = True, chunk_size: int = HASHES_PER_REQUEST) -> None:
+    """Set or clear force start on torrents, in requests of at most chunk_size hashes."""
     force_url = f"{api_address}{API_V2_BASE}/torrents/setForceStart"
-    hashList = '|'.join(torrent['hash'] for torrent in torrents)
-    if not test_mode:
-        data = {'hashes': hashList, 'value': 'true'}
-        response = session.post(force_url, data=data)
-        response.raise_for_status()
-        logger.info(f"Torrents {hashList} forced to seed.")
-    else:
-        for torrent in torrents:
-
-            logger.info(f"Test mode: Would force torrent {torrent['name']} in category {torrent['category']} to seed.")
-        logger.info(f"Test mode: Would force torrents {hashList} to seed.")
+    action = "forced to seed" if value else "unforced"
+    for start in range(0, len(torrents), chunk_size):
+        chunk = torrents[start:start + chunk_size]
+        hashList = '|'.join(torrent['hash'] for torrent in chunk)
+        if not test_mode:
+            data = {'hashes': hashList, 'value': str(value).lower()}
+            response = session.post(force_url, data=data)
+            response.raise_for_status()
+            logger.info(f"{len(chunk)} torrents {action}.")
+            logger.debug(f"Torrents {hashList} {action}.")
+        else:
+            for torrent in chunk:
+                logger.info(f"Test mode: Would set force start to {str(value).lower()} for torrent {torrent['name']} in category {torrent['category']}.")
 
 def reannounce_torrents(session: requests.Session, api_address: str, torrents: List[Dict[str, Any]], logger: Logger, test_mode: bool) -> None:
     """reannounce torrents to seed."""
     reannounce_url = f"{api_address}{API_V2_BASE}/torrents/reannounce"
     hashList = '|'.join(torrent['hash'] for torrent in torrents)
     if not test_mode:
-        data = {'hashes': hashList, 'value': 'true'}
+        data = {'hashes': hashList}
         response = session.post(reannounce_url, data=data)
         response.raise_for_status()
-        logger.info(f"Torrents {hashList} reannounced.")
+        logger.info(f"{len(torrents)} torrents reannounced.")
+        logger.debug(f"Torrents {hashList} reannounced.")
     else:
         for torrent in torrents:
             logger.info(f"Test mode: Would reannounce torrent {torrent['name']} in category {torrent['category']}.")
-        logger.info(f"Test mode: Would reannounce torrents {hashList}.")
 
+def get_torrent_trackers(session: requests.Session, api_address: str, torrent_hash: str, logger: Logger) -> List[Dict[str, Any]]:
+    """Get the trackers of a torrent with their announce status."""
+    trackers_url = f"{api_address}{API_V2_BASE}/torrents/trackers"
+    response = session.get(trackers_url, params={'hash': torrent_hash})
+    response.raise_for_status()
+    return response.json()
+
+def get_torrent_files(session: requests.Session, api_address: str, torrent: Dict[str, Any], logger: Logger) -> List[str]:
+    """Get the paths of the files of a torrent, as seen by qBittorrent."""
+    files_url = f"{api_address}{API_V2_BASE}/torrents/files"
+    response = session.get(files_url, params={'hash': torrent['hash']})
+    response.raise_for_status()
+    return [os.path.join(torrent['save_path'], file['name']) for file in response.json()]
+
+def get_files_in_use(session: requests.Session, api_address: str, paths: Iterable[str], logger: Logger) -> Set[str]:
+    """Files of the torrents in qBittorrent whose content overlaps the given paths, for the content deleter to keep.
+
+    Each overlapping torrent is listed with its own files, so a multi-file
+    torrent without a root folder, whose content path is its save path,
+    protects its files and not everything else in the save path.
+    """
+    paths = [path for path in paths if path]
+    in_use: Set[str] = set()
+    if not paths:
+        return in_use
+    for torrent in get_torrent_list(session, api_address, logger, fresh=True):
+        content_path = torrent.get('content_path', '')
+        if content_path and any(is_within(content_path, path) or is_within(path, content_path) for path in paths):
+            in_use.update(get_torrent_files(session, api_address, torrent, logger))
+    return in_use
+
+def attach_content_files(session: requests.Session, api_address: str, torrents: List[Dict[str, Any]], logger: Logger) -> None:
+    """Store the files of each torrent without a root folder as 'content_files', for estimating reclaimable space.
+
+    A torrent whose files cannot be listed is left without the field and is
+    counted with its full size.
+    """
+    for torrent in torrents:
+        if is_rootless(torrent):
+            try:
+                torrent['content_files'] = get_torrent_files(session, api_address, torrent, logger)
+            except requests.RequestException as e:
+                logger.warning(f"Could not list the files of {torrent['name']}, counting its full size as freed: {e}")
 
 def load_ratio_log(log_file_path: str) -> Dict[str, List[Dict[str, Any]]]:
-    """Load ratio log from file."""
+    """Load ratio log from file.
+
+    The ratio logger replaces the file atomically, so an open file always
+    holds one complete version, even while a new one is being written.
+    """
     try:
         with open(log_file_path, 'r') as file:
-            return json.load(file)
+            content = file.read()
+        return json.loads(content) if content else {}
     except FileNotFoundError:
         return {}
     except json.JSONDecodeError as e:
@@ -139,7 +211,8 @@ def apply_bonus_rules(torrent: Dict[str, Any], bonus_rules: Dict[str, Dict[str,
     
     if torrent_category in bonus_rules:
         category_rules = bonus_rules[torrent_category]
-        logger.debug(f"{torrent_category} category adjustments for torrent: {torrent['name']}")
+        if logger.isEnabledFor(DEBUG):
+            logger.debug(f"{torrent_category} category adjustments for torrent: {torrent['name']}")
         
         multiplier = 1.0
         if 'time_multipliers' in category_rules:
@@ -156,8 +229,33 @@ def apply_bonus_rules(torrent: Dict[str, Any], bonus_rules: Dict[str, Dict[str,
     
     return 1.0
 
-def calculate_average_ratio(torrent: Dict[str, Any], log_file_path: str, logger: Logger, bonus_rules: Dict[str, Dict[str, Any]], config: configparser.ConfigParser) -> float:
-    ratio_log = load_ratio_log(log_file_path)
+def select_upload_rates(upload_rates: Optional[UploadRateEstimator], torrents: List[Dict[str, Any]],
+                        logger: Logger) -> Optional[UploadRateEstimator]:
+    """The estimator to score every torrent with, or None to score all of them from the ratio log.
+
+    Upload rate and ratio log scores are not on the same scale, so one
+    planning run ranks all torrents by one of them: the upload rate only
+    when every torrent has one.
+    """
+    if upload_rates is None:
+        return None
+    unrated = sum(1 for torrent in torrents if torrent['size'] <= 0 or upload_rates.rate(torrent['hash']) is None)
+    if unrated:
+        logger.info(f"{unrated} of {len(torrents)} eligible torrents have no upload rate yet, scoring all of them from the ratio log")
+        return None
+    return upload_rates
+
+def calculate_average_ratio(torrent: Dict[str, Any], log_file_path: str, logger: Logger, bonus_rules: Dict[str, Dict[str, Any]], config: configparser.ConfigParser,
+                            ratio_log: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                            upload_rates: Optional[UploadRateEstimator] = None) -> float:
+    if upload_rates is not None:
+        upload_rate = upload_rates.rate(torrent['hash'])
+        if upload_rate is not None and torrent['size'] > 0:
+            # Ratio gained per week at the current upload rate, in the same unit as the ratio log based score
+            return upload_rate * HOURS_PER_WEEK / torrent['size'] * apply_bonus_rules(torrent, bonus_rules, logger)
+
+    if ratio_log is None:
+        ratio_log = load_ratio_log(log_file_path)
     ratio_records = ratio_log.get(torrent['hash'], [])
     
     current_ratio = torrent['ratio']
@@ -183,6 +281,24 @@ def calculate_average_ratio(torrent: Dict[str, Any], log_file_path: str, logger:
 
     return average_ratio_change
 
+def compute_space_needed(free_space: float, torrents: List[Dict[str, Any]], config: configparser.ConfigParser) -> Tuple[float, float, float]:
+    """Compute the space deficit and the extra space needed for pending downloads, in GB."""
+    min_space_gb = config.getfloat('cleanup', 'min_space_gb')
+    download_minspace_gb = config.get('cleanup', 'download_minspace_gb', fallback='')
+
+    downloading_torrents = [t for t in torrents if t['state'] == 'downloading']
+    total_remaining_size_gb = sum((t['size'] * (1 - t['progress'])) for t in downloading_torrents) / BYTES_TO_GB
+
+    space_left_after_downloads = free_space - total_remaining_size_gb
+    # Check if download_minspace_gb is set and not empty
+    if download_minspace_gb and download_minspace_gb.strip():
+        additional_space_needed = max(0, float(download_minspace_gb) - space_left_after_downloads)
+    else:
+        additional_space_needed = 0
+
+    space_needed = max(0, min_space_gb - free_space)
+    return space_needed, additional_space_needed, total_remaining_size_gb
+
 def get_category_rules(config: configparser.ConfigParser, logger: Logger) -> Dict[str, Dict[str, float]]:
     """Get seed time and ratio rules for each category."""
     rules = {}
@@ -202,53 +318,93 @@ def get_category_rules(config: configparser.ConfigParser, logger: Logger) -> Dic
             rules[category.lower()] = category_rules
     return rules
 
-def filter_torrents_by_rules(torrents: List[Dict[str, Any]], category_rules: Dict[str, Dict[str, float]], logger: Logger) -> List[Dict[str, Any]]:
+def _evaluate_rules(torrent: Dict[str, Any], category: str, rules: Dict[str, Any], logger: Logger, debug: bool,
+                    trace: DecisionTrace, traced: bool) -> bool:
+    conditions_met: bool = True
+    for category_name, category_value in rules.items():
+        if category_name not in TORRENT_FIELDS_TYPES:
+            logger.error(f"Unknown field '{category_name}' in category '{category}'")
+            continue
+        else:
+            if debug:
+                logger.debug(f"Checking torrent {torrent['name']} in category '{category}' with rules: {rules}")
+                logger.debug(f"Field '{category_name}' with field type '{type(category_value)}' is valid for category '{category}'")
+            
+            if isinstance(category_value, Number):
+                match category_name:
+                    case 'popularity':
+                        conditions_met = conditions_met and (torrent[category_name] < category_value)
+                    case 'eta':
+                        conditions_met = conditions_met and (torrent[category_name] == category_value)
+                    case _:
+                        conditions_met = conditions_met and (torrent[category_name] >= category_value)
+
+            elif isinstance(type(category_value), str):
+                conditions_met = conditions_met and (category_value in torrent[category_name])
+            elif isinstance(type(category_value), bool):
+                conditions_met = conditions_met and torrent[category_name]
+
+            if debug:
+                logger.debug(f"Torrent {torrent['name']} condition {conditions_met} at {category_name}"
+                             f"with torrent value {torrent[category_name]} and category expectation {category_value}")
+            if traced:
+                trace.record('rule', torrent, field=category_name, value=torrent[category_name],
+                             expected=category_value, result=conditions_met)
+    return conditions_met
+
+def filter_torrents_by_rules(torrents: List[Dict[str, Any]], category_rules: Dict[str, Dict[str, float]], logger: Logger,
+                             trace: DecisionTrace = NULL_TRACE, cache: Optional[EligibilityCache] = None) -> List[Dict[str, Any]]:
+    """Return the torrents that meet the seed rules of their category.
+
+    With a cache, only torrents whose rule fields changed since the last run
+    are evaluated again.
+    """
     filtered_torrents = []
+    debug = logger.isEnabledFor(DEBUG)  # Checked once so disabled debug output costs no formatting
+    now = time.time()
+    evaluated = reused = 0
+    if cache is not None:
+        cache.set_rules(category_rules)
     for torrent in torrents:
-        logger.debug(f"Processing torrent: {torrent['name']}")
+        if debug:
+            logger.debug(f"Processing torrent: {torrent['name']}")
         category = torrent.get('category', '').lower()
+        traced = trace.wants(torrent)
         if category in category_rules:
             rules = category_rules[category]
 
-            conditions_met: bool = True
-            for category_name, category_value in rules.items():
-                if category_name not in TORRENT_FIELDS_TYPES:
-                    logger.error(f"Unknown field '{category_name}' in category '{category}'")
-                    continue
-                else:
-                    logger.debug(f"Checking torrent {torrent['name']} in category '{category}' with rules: {rules}")
-                    logger.debug(f"Field '{category_name}' with field type '{type(category_value)}' is valid for category '{category}'")
-                    
-                    if isinstance(category_value, Number):
-                        match category_name:
-                            case 'popularity':
-                                conditions_met = conditions_met and (torrent[category_name] < category_value)
-                            case 'eta':
-                                conditions_met = conditions_met and (torrent[category_name] == category_value)
-                            case _:
-                                conditions_met = conditions_met and (torrent[category_name] >= category_value)
-
-                    elif isinstance(type(category_value), str):
-                        conditions_met = conditions_met and (category_value in torrent[category_name])
-                    elif isinstance(type(category_value), bool):
-                        conditions_met = conditions_met and torrent[category_name]
-
-                    logger.debug(f"Torrent {torrent['name']} condition {conditions_met} at {category_name}"
-                                 f"with torrent value {torrent[category_name]} and category expectation {category_value}")
+            conditions_met = cache.lookup(torrent, category, rules, now) if cache is not None else None
+            if conditions_met is None:
+                conditions_met = _evaluate_rules(torrent, category, rules, logger, debug, trace, traced)
+                evaluated += 1
+                if cache is not None:
+                    cache.store(torrent, category, rules, conditions_met, now)
+                if traced:
+                    trace.record('eligibility', torrent, eligible=conditions_met)
+            else:
+                reused += 1
+                if traced:
+                    trace.record('eligibility', torrent, eligible=conditions_met, cached=True)
 
             if conditions_met:
                 filtered_torrents.append(torrent)
-                logger.debug(f"Torrent {torrent['name']} eligible for removal: "
-                            f"category: {category}, "
-                            f"seed time: {torrent['seeding_time']}, "
-                            f"ratio: {torrent['ratio']} "
-                            f"tracker: {torrent['tracker']}")
+                if debug:
+                    logger.debug(f"Torrent {torrent['name']} eligible for removal: "
+                                f"category: {category}, "
+                                f"seed time: {torrent['seeding_time']}, "
+                                f"ratio: {torrent['ratio']} "
+                                f"tracker: {torrent['tracker']}")
         else:
-            logger.debug(f"No rules for category: {category}")
-    
+            if debug:
+                logger.debug(f"No rules for category: {category}")
+            if traced:
+                trace.record('eligibility', torrent, eligible=False, reason='no rules for category')
+
+    if cache is not None:
+        logger.info(f"Seed rules evaluated for {evaluated} torrents, {reused} cached verdicts reused")
     return filtered_torrents
 
-def remove_torrent(session: requests.Session, api_address: str, torrent_hash: str, delete_files: bool, logger: Logger) -> None:
+def remove_torrent(session: requests.Session, api_address: str, torrent_hash: str, delete_files: bool, logger: Logger) -> bool:
     """Remove a torrent from qBittorrent."""
     removal_url = f"{api_address}{API_V2_BASE}/torrents/delete"
     data = {'hashes': torrent_hash, 'deleteFiles': str(delete_files).lower()}
@@ -256,52 +412,244 @@ def remove_torrent(session: requests.Session, api_address: str, torrent_hash: st
         response = session.post(removal_url, data=data)
         response.raise_for_status()
         logger.debug(f"Torrent {torrent_hash} successfully removed.")
+        return True
     except requests.RequestException as e:
         logger.error(f"Failed to remove torrent {torrent_hash}: {str(e)}")
+        return False
+
+def revalidate_removals(session: requests.Session, api_address: str, removals: List[PlannedRemoval],
+                        logger: Logger) -> List[PlannedRemoval]:
+    """Keep only removals whose torrents are still in qBittorrent, in the same category and place.
 
-def remove_torrents_by_space(torrents: List[Dict[str, Any]], categories_space: List[str], space_needed: float, drive_path: str, 
-                             logger: Logger, session: requests.Session, api_address: str, test_mode: bool, log_file_path: str,
-                             bonus_rules: Dict[str, Dict[str, Any]], config: configparser.ConfigParser) -> List[Dict[str, Any]]:
-    """Remove torrents to free up space."""
+    The plan may have been made from a cached torrent list or by an earlier
+    run, so the torrents are looked up again right before they are removed.
+    """
+    try:
+        current = {t['hash']: t for t in _fetch_torrent_list(session, api_address, [removal.hash for removal in removals])}
+    except requests.RequestException as e:
+        logger.error(f"Could not revalidate {len(removals)} torrents before removal, skipping them: {e}")
+        return []
+    valid = []
+    for removal in removals:
+        torrent = current.get(removal.hash)
+        if torrent is None:
+            logger.warning(f"Torrent {removal.name} is no longer in qBittorrent, skipping its removal")
+        elif torrent['category'] != removal.category or torrent.get('content_path', '') != removal.content_path:
+            logger.warning(f"Torrent {removal.name} changed category or location since it was planned, skipping its removal")
+        else:
+            valid.append(removal)
+    return valid
+
+def execute_removal_plan(session: requests.Session, api_address: str, plan: RemovalPlan, logger: Logger,
+                         batch_size: int = HASHES_PER_REQUEST, deleter: Optional[ContentDeleter] = None,
+                         pacer: Optional[RemovalPacer] = None) -> List[PlannedRemoval]:
+    """Remove the torrents of a plan from qBittorrent, in batches, and return the removals that were executed.
+
+    Each batch is revalidated against qBittorrent first. With a deleter,
+    torrents are removed without their files and the content is queued for
+    local deletion instead; call deleter.run() afterwards. With a pacer, the
+    batches are spread over time within its I/O budget.
+    """
+    executed = []
+    for batch in (pacer.batches(plan, batch_size) if pacer is not None else plan.batches(batch_size)):
+        batch = revalidate_removals(session, api_address, batch, logger)
+        if not batch:
+            continue
+        hashes = '|'.join(removal.hash for removal in batch)
+        if deleter is None:
+            removed = remove_torrent(session, api_address, hashes, True, logger)
+        else:
+            deleter.queue(batch, _get_removal_files(session, api_address, batch, logger))
+            removed = remove_torrent(session, api_address, hashes, False, logger)
+            if not removed:
+                deleter.cancel(batch)
+        if removed:
+            executed.extend(batch)
+            if pacer is not None:
+                pacer.record(batch)
+    return executed
+
+def _get_removal_files(session: requests.Session, api_address: str, removals: List[PlannedRemoval],
+                       logger: Logger) -> Dict[str, List[str]]:
+    """File lists of the torrents to remove, for deleting exactly their files; torrents whose list cannot be read are left out."""
+    files = {}
+    for removal in removals:
+        if not removal.save_path:
+            continue  # Planned before save paths were recorded
+        try:
+            files[removal.hash] = get_torrent_files(session, api_address, {'hash': removal.hash, 'save_path': removal.save_path}, logger)
+        except requests.RequestException as e:
+            logger.warning(f"Could not list the files of {removal.name}, its content is only deleted if it is safe as a whole: {e}")
+    return files
+
+def plan_removals_by_space(torrents: List[Dict[str, Any]], categories_space: List[str], space_needed: float,
+                           logger: Logger, log_file_path: str, bonus_rules: Dict[str, Dict[str, Any]], config: configparser.ConfigParser,
+                           ratio_log: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                           trace: DecisionTrace = NULL_TRACE, estimator: Optional[ReclaimEstimator] = None,
+                           all_torrents: Optional[List[Dict[str, Any]]] = None,
+                           upload_rates: Optional[UploadRateEstimator] = None) -> List[PlannedRemoval]:
+    """Select torrents to remove to free up space.
+
+    With an estimator, torrents sharing content are removed as one unit and
+    only counted with the bytes their removal actually frees on disk.
+    """
     space_freed = 0.0
-    torrents_removed_info = []
+    removals = []
 
     torrents_in_categories = [t for t in torrents if t['category'].lower() in categories_space]
+    if ratio_log is None:
+        ratio_log = load_ratio_log(log_file_path)
     for torrent in torrents_in_categories:
-        torrent['average_ratio'] = calculate_average_ratio(torrent, log_file_path, logger, bonus_rules, config)
+        torrent['average_ratio'] = calculate_average_ratio(torrent, log_file_path, logger, bonus_rules, config, ratio_log, upload_rates)
+        if trace.wants(torrent):
+            trace.record('score', torrent, average_ratio=torrent['average_ratio'], popularity=torrent['popularity'],
+                         seeding_time=torrent['seeding_time'], size=torrent['size'])
 
     if config.getboolean('cleanup', 'prefer_qbittorrent_ratio', fallback=False):
         torrents_sorted = sorted(torrents_in_categories, key=lambda t: (t['popularity'], -t['seeding_time'], -t['size'], t['name']))
     else: # This is the original ration-based sorting
         torrents_sorted = sorted(torrents_in_categories, key=lambda t: (t['average_ratio'], -t['seeding_time'], -t['size'], t['name']))
 
+    optimal = config.get('cleanup', 'space_selection', fallback='greedy').strip().lower() == 'optimal'
+    greedy_trace = NULL_TRACE if optimal else trace
+
+    if estimator is not None:
+        removals = _plan_removal_units_by_space(torrents_sorted, all_torrents or torrents, space_needed, estimator, greedy_trace)
+    else:
+        for torrent in torrents_sorted:
+            if space_freed >= space_needed:
+                break
+            space_freed += torrent['size'] / BYTES_TO_GB
+            removals.append(PlannedRemoval.from_torrent(torrent, torrent['average_ratio'], 'space'))
+            if greedy_trace.wants(torrent):
+                greedy_trace.record('selected', torrent, reason='space', rank=len(removals),
+                                    space_freed_gb=space_freed, space_needed_gb=space_needed)
+
+    if optimal:
+        return _plan_optimal_removals_by_space(torrents_sorted, removals, all_torrents or torrents, space_needed,
+                                               estimator, config, logger, trace)
+    return removals
+
+def _removal_cost(torrent: Dict[str, Any], use_popularity: bool) -> float:
+    """Score lost by removing a torrent: its ranking score weighted by its size in GB."""
+    score = torrent['popularity'] if use_popularity else torrent['average_ratio']
+    return (max(score, 0) + SCORE_FLOOR) * torrent['size'] / BYTES_TO_GB
+
+def _plan_optimal_removals_by_space(torrents_sorted: List[Dict[str, Any]], greedy_removals: List[PlannedRemoval],
+                                    all_torrents: List[Dict[str, Any]], space_needed: float,
+                                    estimator: Optional[ReclaimEstimator], config: configparser.ConfigParser,
+                                    logger: Logger, trace: DecisionTrace) -> List[PlannedRemoval]:
+    """Select the removals that cover space_needed with the least lost score, instead of the greedy prefix."""
+    use_popularity = config.getboolean('cleanup', 'prefer_qbittorrent_ratio', fallback=False)
+    time_budget = config.getfloat('cleanup', 'selection_time_budget_ms', fallback=500) / 1000
+    candidates = {torrent['hash'] for torrent in torrents_sorted}
+    groups = group_by_content(all_torrents) if estimator is not None else {}
+    considered = set()
+    units, sizes, costs = [], [], []
+
+    for torrent in torrents_sorted:
+        unit = [torrent]
+        bytes_freed = torrent['size']
+        if estimator is not None:
+            unit_key = content_key(torrent)
+            if unit_key in considered:
+                continue
+            considered.add(unit_key)
+            unit = groups.get(unit_key, [torrent])
+            if any(member['hash'] not in candidates for member in unit):
+                continue
+            content_paths = unit_content_paths(unit)
+            bytes_freed = estimator.standalone_bytes(content_paths) if content_paths is not None else None
+            if bytes_freed is None:
+                bytes_freed = torrent['size']  # Content not visible locally, trust qBittorrent
+        if bytes_freed <= 0:
+            continue
+        units.append((torrent, unit, bytes_freed))
+        sizes.append(bytes_freed / BYTES_TO_GB)
+        costs.append(sum(_removal_cost(member, use_popularity) for member in unit))
+
+    greedy_hashes = {removal.hash for removal in greedy_removals}
+    greedy_units = [index for index, (_, unit, _) in enumerate(units) if any(m['hash'] in greedy_hashes for m in unit)]
+    started = time.monotonic()
+    selected, proven = select_cover(sizes, costs, space_needed, time_budget, greedy_units)
+    elapsed_ms = (time.monotonic() - started) * 1000
+
+    removals = []
+    space_freed = 0.0
+    for index in sorted(selected):  # Keep the ranking order for execution and logging
+        lead, unit, bytes_freed = units[index]
+        space_freed += bytes_freed / BYTES_TO_GB
+        for member in unit:
+            removals.append(PlannedRemoval.from_torrent(member, member['average_ratio'], 'space',
+                                                        bytes_freed if member is lead else 0))
+            if trace.wants(member):
+                trace.record('selected', member, reason='space', rank=len(removals), cost=costs[index],
+                             space_freed_gb=space_freed, space_needed_gb=space_needed)
+
+    greedy_gb = sum(removal.expected_bytes_freed for removal in greedy_removals) / BYTES_TO_GB
+    greedy_cost = sum(costs[index] for index in greedy_units)
+    logger.info(f"Optimal space selection ({'exact' if proven else 'approximate'}, {elapsed_ms:.0f} ms): "
+                f"{len(removals)} torrents freeing {space_freed:.2f} GB instead of {len(greedy_removals)} freeing {greedy_gb:.2f} GB, "
+                f"overshoot avoided: {max(greedy_gb - space_needed, 0) - max(space_freed - space_needed, 0):.2f} GB, "
+                f"lost score {sum(costs[index] for index in selected):.2f} instead of {greedy_cost:.2f}")
+    return removals
+
+def _plan_removal_units_by_space(torrents_sorted: List[Dict[str, Any]], all_torrents: List[Dict[str, Any]],
+                                 space_needed: float, estimator: ReclaimEstimator,
+                                 trace: DecisionTrace) -> List[PlannedRemoval]:
+    """Greedy selection over units of torrents sharing content, counting only reclaimable bytes."""
+    space_freed = 0.0
+    removals = []
+    candidates = {torrent['hash'] for torrent in torrents_sorted}
+    units = group_by_content(all_torrents)
+    considered = set()
+
     for torrent in torrents_sorted:
         if space_freed >= space_needed:
             break
-        torrent_info = {
-            'hash': torrent['hash'],
-            'name': torrent['name'],
-            'size': torrent['size'],
-            'seeding_time': torrent['seeding_time'],
-            'ratio': torrent['ratio'],
-            'category': torrent['category'],
-            'popularity': torrent['popularity'],
-            'eta': torrent['eta'],
-            'tracker': torrent['tracker']
-        }
-        if not test_mode:
-            remove_torrent(session, api_address, torrent['hash'], True, logger)
-        space_freed += torrent['size'] / BYTES_TO_GB
-        torrents_removed_info.append(torrent_info)
-
-    return torrents_removed_info, space_freed
-
-def remove_torrents_by_count(torrents: List[Dict[str, Any]], categories_number: List[str], max_torrents: int, 
-                             logger: Logger, session: requests.Session, api_address: str, test_mode: bool,
-                             log_file_path: str, bonus_rules: Dict[str, Dict[str, Any]], 
-                             sort_by_size: bool, config: configparser.ConfigParser) -> List[Dict[str, Any]]:
-    """Remove torrents to maintain a maximum count per category."""
-    torrents_removed_info = []
+        unit_key = content_key(torrent)
+        if unit_key in considered:
+            continue
+        considered.add(unit_key)
+        unit = units.get(unit_key, [torrent])
+        if any(member['hash'] not in candidates for member in unit):
+            if trace.wants(torrent):
+                trace.record('skipped', torrent, reason='content shared with a torrent that is not eligible',
+                             shared_with=[m['hash'] for m in unit if m['hash'] not in candidates])
+            continue
+
+        content_paths = unit_content_paths(unit)
+        bytes_freed = estimator.marginal_bytes(content_paths) if content_paths is not None else None
+        if bytes_freed is None:
+            bytes_freed = torrent['size']  # Content not visible locally or not listed, trust qBittorrent
+        if bytes_freed == 0:
+            if trace.wants(torrent):
+                trace.record('skipped', torrent, reason='no space would be freed', size=torrent['size'])
+            continue
+        if content_paths is not None:
+            estimator.mark_removed(content_paths)  # Only links of selected units count as gone for later units
+
+        space_freed += bytes_freed / BYTES_TO_GB
+        for member in unit:
+            removals.append(PlannedRemoval.from_torrent(member, member.get('average_ratio', torrent['average_ratio']), 'space',
+                                                        bytes_freed if member is torrent else 0))
+            if trace.wants(member):
+                trace.record('selected', member, reason='space', rank=len(removals), unit=unit_key,
+                             bytes_freed=bytes_freed if member is torrent else 0,
+                             space_freed_gb=space_freed, space_needed_gb=space_needed)
+
+    return removals
+
+def plan_removals_by_count(torrents: List[Dict[str, Any]], categories_number: List[str], max_torrents: int,
+                           logger: Logger, log_file_path: str, bonus_rules: Dict[str, Dict[str, Any]],
+                           sort_by_size: bool, config: configparser.ConfigParser,
+                           ratio_log: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                           trace: DecisionTrace = NULL_TRACE,
+                           upload_rates: Optional[UploadRateEstimator] = None) -> List[PlannedRemoval]:
+    """Select torrents to remove to maintain a maximum count per category."""
+    removals = []
+    if ratio_log is None:
+        ratio_log = load_ratio_log(log_file_path)
 
     for category in categories_number:
         category_torrents = [t for t in torrents if t['category'].lower() == category.lower()]
@@ -313,28 +661,22 @@ def remove_torrents_by_count(torrents: List[Dict[str, Any]], categories_number:
                 sorted_torrents = sorted(category_torrents, key=lambda t: t['size'], reverse=True)
             else:
                 for torrent in category_torrents:
-                    torrent['average_ratio'] = calculate_average_ratio(torrent, log_file_path, logger, bonus_rules, config)
+                    torrent['average_ratio'] = calculate_average_ratio(torrent, log_file_path, logger, bonus_rules, config, ratio_log, upload_rates)
+                    if trace.wants(torrent):
+                        trace.record('score', torrent, average_ratio=torrent['average_ratio'],
+                                     seeding_time=torrent['seeding_time'], size=torrent['size'])
                 sorted_torrents = sorted(category_torrents, key=lambda t: (t['average_ratio'], -t['seeding_time'], -t['size'], t['name']))
             
             torrents_to_remove = sorted_torrents[:len(category_torrents) - max_torrents]
             
             for torrent in torrents_to_remove:
-                torrent_info = {
-                    'hash': torrent['hash'],
-                    'name': torrent['name'],
-                    'size': torrent['size'],
-                    'seeding_time': torrent['seeding_time'],
-                    'ratio': torrent['ratio'],
-                    'category': torrent['category'],
-                    'popularity': torrent['popularity'],
-                    'eta': torrent['eta'],
-                    'tracker': torrent['tracker']
-                }
-                torrents_removed_info.append(torrent_info)
-        
-                if not test_mode:
-                    remove_torrent(session, api_address, torrent['hash'], True, logger)
-        else:
+                if sort_by_size:  # Scores are only needed for reporting here
+                    torrent['average_ratio'] = calculate_average_ratio(torrent, log_file_path, logger, bonus_rules, config, ratio_log, upload_rates)
+                removals.append(PlannedRemoval.from_torrent(torrent, torrent['average_ratio'], 'count'))
+                if trace.wants(torrent):
+                    trace.record('selected', torrent, reason='count', category_count=len(category_torrents),
+                                 max_torrents=max_torrents, sort_by_size=sort_by_size)
+        elif logger.isEnabledFor(DEBUG):
             logger.debug(f"No need to remove torrents from category '{category}'. Count ({len(category_torrents)}) is within the limit ({max_torrents}).")
 
-    return torrents_removed_info
\ No newline at end of file
+    return removals
@@ -0,0 +1,180 @@
+import os
+import math
+import time
+import struct
+import configparser
+from array import array
+from typing import Dict, List, Any, Optional
+
+# Constants
+STATE_FILE_NAME = 'upload_rates.bin'
+FILE_MAGIC = b'QBUR'
+FILE_VERSION = 2
+HEADER = struct.Struct('<4sHIIddQ')  # Magic, version, capacity, count, half life in seconds, last poll time, maindata rid
+DEFAULT_CAPACITY = 65536
+DEFAULT_HALF_LIFE_HOURS = 6
+STALE_HALF_LIVES = 3  # Without a poll for this long, the sampler is assumed to have stopped
+MAX_LOAD_FACTOR = 0.75
+SECONDS_PER_HOUR = 3600
+
+def _key(torrent_hash: str) -> int:
+    """64 bit slot key from the info hash; 0 marks an empty slot."""
+    return int(torrent_hash[:16], 16) or 1
+
+class UploadRateEstimator:
+    """Exponentially weighted moving average of bytes uploaded per hour, per torrent.
+
+    Each poll feeds the uploaded counters that changed since the previous
+    one; the rate since a torrent's previous sample is blended into its
+    average with a weight that depends on the time between them, so the
+    estimate has the same half life no matter how often it is sampled.
+    Torrents whose counter did not change decay towards zero as of the last
+    poll. State lives in fixed-size arrays of an open addressing table, so
+    memory only depends on the capacity.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, half_life_hours: float = DEFAULT_HALF_LIFE_HOURS):
+        self.capacity = capacity
+        self.half_life_seconds = half_life_hours * SECONDS_PER_HOUR
+        self.polled_at = 0.0
+        self.rid = 0  # Of the last /sync/maindata response, to only ask for changes on the next poll
+        self._allocate()
+
+    def _allocate(self) -> None:
+        self.keys = array('Q', bytes(8 * self.capacity))
+        self.uploaded = array('Q', bytes(8 * self.capacity))
+        self.sampled_at = array('d', bytes(8 * self.capacity))
+        self.rates = array('d', bytes(8 * self.capacity))
+        self.samples = array('H', bytes(2 * self.capacity))
+        self.count = 0
+
+    def _slot(self, key: int) -> int:
+        """Slot holding the key, or the empty slot where it belongs."""
+        slot = key % self.capacity
+        while self.keys[slot] != 0 and self.keys[slot] != key:
+            slot = (slot + 1) % self.capacity
+        return slot
+
+    def _decay(self, elapsed: float) -> float:
+        return math.exp(-elapsed * math.log(2) / self.half_life_seconds)
+
+    def _sample(self, torrent_hash: str, uploaded: int, upspeed: int, now: float) -> None:
+        slot = self._slot(_key(torrent_hash))
+        if self.keys[slot] == 0:
+            if self.count + 1 > self.capacity * MAX_LOAD_FACTOR:
+                return  # Table full, the rest is scored from the ratio log
+            self.keys[slot] = _key(torrent_hash)
+            self.count += 1
+            self.rates[slot] = upspeed * SECONDS_PER_HOUR
+        else:
+            elapsed = now - self.sampled_at[slot]
+            if elapsed <= 0:
+                return
+            # A counter that went backwards was reset, e.g. by re-adding the torrent
+            rate = max(uploaded - self.uploaded[slot], 0) / elapsed * SECONDS_PER_HOUR
+            weight = self._decay(elapsed)
+            self.rates[slot] = weight * self.rates[slot] + (1 - weight) * rate
+            self.samples[slot] = min(self.samples[slot] + 1, 0xFFFF)
+        self.uploaded[slot] = uploaded
+        self.sampled_at[slot] = now
+
+    def update(self, torrents: List[Dict[str, Any]], now: Optional[float] = None) -> None:
+        """Feed one poll of the full /torrents/info list."""
+        now = time.time() if now is None else now
+        for torrent in torrents:
+            if torrent.get('uploaded') != self._uploaded(torrent['hash']):
+                self._sample(torrent['hash'], torrent.get('uploaded', 0), torrent.get('upspeed', 0), now)
+        self.polled_at = now
+        keep = {_key(torrent['hash']) for torrent in torrents}
+        if self.count > len(keep):
+            self._drop_all_but(keep)
+
+    def update_from_maindata(self, maindata: Dict[str, Any], now: Optional[float] = None) -> None:
+        """Feed one /sync/maindata response requested with the rid of the previous one."""
+        now = time.time() if now is None else now
+        torrents = maindata.get('torrents', {})
+        if maindata.get('full_update'):
+            self.update([{'hash': torrent_hash, **fields} for torrent_hash, fields in torrents.items()], now)
+        else:
+            for torrent_hash, changes in torrents.items():
+                if 'uploaded' in changes:  # Only changed fields are sent
+                    self._sample(torrent_hash, changes['uploaded'], changes.get('upspeed', 0), now)
+            self.polled_at = now
+            removed = {_key(torrent_hash) for torrent_hash in maindata.get('torrents_removed', [])}
+            if removed:
+                self._drop_all_but({key for key in self.keys if key != 0 and key not in removed})
+        self.rid = maindata.get('rid', 0)
+
+    def _uploaded(self, torrent_hash: str) -> Optional[int]:
+        slot = self._slot(_key(torrent_hash))
+        return self.uploaded[slot] if self.keys[slot] != 0 else None
+
+    def _drop_all_but(self, keep: set) -> None:
+        """Rebuild the table without the torrents that are no longer in qBittorrent."""
+        old = (self.keys, self.uploaded, self.sampled_at, self.rates, self.samples)
+        self._allocate()
+        for old_slot, key in enumerate(old[0]):
+            if key == 0 or key not in keep:
+                continue
+            slot = self._slot(key)
+            self.keys[slot] = key
+            self.uploaded[slot] = old[1][old_slot]
+            self.sampled_at[slot] = old[2][old_slot]
+            self.rates[slot] = old[3][old_slot]
+            self.samples[slot] = old[4][old_slot]
+            self.count += 1
+
+    def rate(self, torrent_hash: str, now: Optional[float] = None) -> Optional[float]:
+        """Estimated bytes uploaded per hour, or None until the torrent was polled twice or when polling stopped."""
+        now = time.time() if now is None else now
+        if now - self.polled_at > STALE_HALF_LIVES * self.half_life_seconds:
+            return None
+        slot = self._slot(_key(torrent_hash))
+        if self.keys[slot] == 0 or (self.samples[slot] == 0 and self.polled_at <= self.sampled_at[slot]):
+            return None
+        # Nothing was uploaded between the last sample and the last poll, or the counter would have changed
+        return self.rates[slot] * self._decay(self.polled_at - self.sampled_at[slot])
+
+    def save(self, state_path: str) -> None:
+        with open(state_path + '.tmp', 'wb') as file:
+            file.write(HEADER.pack(FILE_MAGIC, FILE_VERSION, self.capacity, self.count, self.half_life_seconds,
+                                   self.polled_at, self.rid))
+            for values in (self.keys, self.uploaded, self.sampled_at, self.rates, self.samples):
+                values.tofile(file)
+        os.replace(state_path + '.tmp', state_path)
+
+    @classmethod
+    def load(cls, state_path: str, capacity: int = DEFAULT_CAPACITY,
+             half_life_hours: float = DEFAULT_HALF_LIFE_HOURS) -> 'UploadRateEstimator':
+        """Load the saved state, or start empty if there is none or it was saved with another capacity."""
+        estimator = cls(capacity, half_life_hours)
+        try:
+            with open(state_path, 'rb') as file:
+                magic, version, saved_capacity, count, _, polled_at, rid = HEADER.unpack(file.read(HEADER.size))
+                if magic != FILE_MAGIC or version != FILE_VERSION or saved_capacity != capacity:
+                    return estimator
+                for values in (estimator.keys, estimator.uploaded, estimator.sampled_at, estimator.rates, estimator.samples):
+                    del values[:]
+                    values.fromfile(file, capacity)
+                estimator.count = count
+                estimator.polled_at = polled_at
+                estimator.rid = rid
+        except (FileNotFoundError, EOFError, struct.error):
+            return cls(capacity, half_life_hours)
+        return estimator
+
+def state_path_from_config(config: configparser.ConfigParser) -> str:
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    default_path = os.path.join(config.get('logging', 'location', fallback='') or script_directory, STATE_FILE_NAME)
+    return config.get('upload_rate', 'location', fallback=default_path)
+
+def from_config(config: configparser.ConfigParser) -> UploadRateEstimator:
+    return UploadRateEstimator.load(state_path_from_config(config),
+                                    config.getint('upload_rate', 'capacity', fallback=DEFAULT_CAPACITY),
+                                    config.getfloat('upload_rate', 'half_life_hours', fallback=DEFAULT_HALF_LIFE_HOURS))
+
+def scoring_estimator(config: configparser.ConfigParser) -> Optional[UploadRateEstimator]:
+    """The estimator to score torrents with when [ratio_calculation] score_source is upload_rate."""
+    if config.get('ratio_calculation', 'score_source', fallback='ratio_log').strip().lower() != 'upload_rate':
+        return None
+    return from_config(config)
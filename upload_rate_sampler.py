@@ -0,0 +1,39 @@
+import os
+import sys
+import argparse
+import logger_utils
+import torrent_utils
+import qbittorrent_api
+import upload_rate_estimator
+
+# Constants
+COOKIE_FILE_NAME = 'upload_rate_sampler.cookie'
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Qbittorrent Upload Rate Sampler")
+    parser.add_argument('--config', type=str, help='Path to the configuration file')
+    args = parser.parse_args()
+
+    script_directory = os.path.dirname(os.path.abspath(__file__))
+    config = torrent_utils.load_configuration(script_directory)
+    logger, log_handler = logger_utils.setup_logger(config.get('logging', 'location', fallback=''), config.getboolean('logging', 'debug'))
+    session = qbittorrent_api.from_config(config, logger)
+
+    try:
+        estimator = upload_rate_estimator.from_config(config)
+        state_path = upload_rate_estimator.state_path_from_config(config)
+        # The rid of the previous poll only counts within the WebUI session that received it, so the
+        # session cookie is kept between runs; a new session gets a full update
+        cookie_path = os.path.join(os.path.dirname(state_path), COOKIE_FILE_NAME)
+        session.load_cookies(cookie_path)
+        maindata = torrent_utils.get_status(session, config.get('login', 'address'), logger, estimator.rid)
+        estimator.update_from_maindata(maindata)
+        estimator.save(state_path)
+        session.save_cookies(cookie_path)
+        logger.debug(f"Sampled upload of {len(maindata.get('torrents', {}))} "
+                     f"{'torrents (full update)' if maindata.get('full_update') else 'changed torrents'}")
+    except Exception as e:
+        logger.error(f"Failed to sample upload rates: {e}")
+        sys.exit(1)
+    finally:
+        log_handler.write_log_entries()